@@ -0,0 +1,97 @@
+import threading
+import time
+
+import numpy as np
+
+class AnswerCache:
+    # In-memory cache of answers keyed by query embedding. A question whose
+    # embedding has cosine similarity >= threshold with a cached question gets
+    # that question's answer. Entries expire after ttl seconds, the least
+    # recently used ones are evicted past max_entries, and everything is
+    # dropped when the document set version changes (a re-ingest).
+
+    def __init__(self, threshold: float = 0.95, ttl: float = 3600, max_entries: int = 1000):
+        self.threshold = threshold
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.version = None
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._clear()
+
+    def _clear(self):
+        self.vectors = np.zeros((0, 0), dtype=np.float32)
+        self.answers = []
+        self.created = np.zeros(0)
+        self.last_used = np.zeros(0)
+
+    def _check_version(self, version):
+        if version != self.version:
+            self._clear()
+            self.version = version
+
+    def get(self, query_embedding, version):
+        # Returns the cached answer for the most similar question, or None.
+        with self._lock:
+            self._check_version(version)
+            self._expire(time.monotonic())
+            best = self._nearest(query_embedding)
+            if best is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self.last_used[best] = time.monotonic()
+            return self.answers[best]
+
+    def put(self, query_embedding, version, answer: str):
+        with self._lock:
+            self._check_version(version)
+            now = time.monotonic()
+            vector = _normalize(query_embedding)
+            if len(self.answers) == 0:
+                self.vectors = vector[None, :]
+            else:
+                self.vectors = np.vstack([self.vectors, vector])
+            self.answers.append(answer)
+            self.created = np.append(self.created, now)
+            self.last_used = np.append(self.last_used, now)
+            excess = len(self.answers) - self.max_entries
+            if excess > 0:
+                self._drop(np.argsort(self.last_used)[:excess])
+
+    def _nearest(self, query_embedding):
+        if len(self.answers) == 0:
+            return None
+        scores = self.vectors @ _normalize(query_embedding)
+        best = int(np.argmax(scores))
+        return best if scores[best] >= self.threshold else None
+
+    def _expire(self, now):
+        expired = np.nonzero(now - self.created > self.ttl)[0]
+        if len(expired):
+            self._drop(expired)
+
+    def _drop(self, indexes):
+        keep = np.ones(len(self.answers), dtype=bool)
+        keep[indexes] = False
+        self.vectors = self.vectors[keep]
+        self.answers = [answer for answer, kept in zip(self.answers, keep) if kept]
+        self.created = self.created[keep]
+        self.last_used = self.last_used[keep]
+
+    def __len__(self):
+        return len(self.answers)
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": self.hits / lookups if lookups else 0.0,
+            "entries": len(self),
+        }
+
+def _normalize(embedding) -> np.ndarray:
+    vector = np.array(embedding, dtype=np.float32)
+    return vector / (np.linalg.norm(vector) or 1)
@@ -0,0 +1,188 @@
+import argparse
+import contextlib
+import functools
+import glob
+import os
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from dotenv import load_dotenv
+
+from chunker import EXTRACT_WORKERS, extraction_pool, iter_pages
+from embedcache import EmbeddingCache
+from ingest import ingest
+from store import ConnectionPool, get_checkpoints, save_checkpoint
+
+load_dotenv()
+
+# Files ingested at once. Each runs the full extract/embed/write pipeline on
+# its own connection; embedding requests from all of them share the per-model
+# concurrency limit in ratelimit.py.
+INGEST_WORKERS = int(os.getenv("INGEST_WORKERS", "4"))
+# Seconds between progress lines.
+PROGRESS_INTERVAL = float(os.getenv("INGEST_PROGRESS_INTERVAL", "5"))
+
+# Checkpoint statuses that mean a file needs no more work while it is unchanged.
+_FINISHED = ("done", "empty")
+
+def find_pdfs(patterns: list[str]) -> list[str]:
+    # PDFs under each directory (recursively), matching each glob (** crosses
+    # directories) or named directly, without duplicates, in sorted order.
+    paths = set()
+    for pattern in patterns:
+        if os.path.isdir(pattern):
+            for root, _, names in os.walk(pattern):
+                paths.update(os.path.join(root, name) for name in names if name.lower().endswith(".pdf"))
+        elif glob.has_magic(pattern):
+            paths.update(path for path in glob.iglob(pattern, recursive=True) if os.path.isfile(path))
+        else:
+            paths.add(pattern)
+    return sorted(os.path.normpath(path) for path in paths)
+
+def _stat(path: str):
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return None
+    return stat.st_size, stat.st_mtime
+
+class BatchProgress:
+    # Running totals for a batch; line() is the progress report.
+    def __init__(self, total: int):
+        self.total = total
+        self.started = time.perf_counter()
+        self.files = 0
+        self.chunks = 0
+        self.bytes = 0
+        self.unchanged = 0
+        self.empty = []
+        self.failed = []
+        self._lock = threading.Lock()
+
+    def add(self, path: str, size: int, status: str, chunks: int = 0, error: str = None):
+        with self._lock:
+            self.files += 1
+            self.bytes += size
+            self.chunks += chunks
+            if status == "unchanged":
+                self.unchanged += 1
+            elif status == "empty":
+                self.empty.append(path)
+            elif status == "failed":
+                self.failed.append((path, error))
+
+    def line(self) -> str:
+        elapsed = time.perf_counter() - self.started
+        rate = self.files / elapsed if elapsed else 0.0
+        eta = (self.total - self.files) / rate if rate else 0.0
+        return (
+            f"[{self.files}/{self.total}] {rate:.1f} files/s, "
+            f"{self.chunks / elapsed if elapsed else 0.0:.1f} chunks/s, "
+            f"{self.bytes / elapsed / 1e6 if elapsed else 0.0:.1f} MB/s; "
+            f"{len(self.failed)} failed, {len(self.empty)} empty; "
+            f"{elapsed:.0f}s elapsed, ~{eta:.0f}s left"
+        )
+
+def _ingest_file(pool: ConnectionPool, lock, path: str, size: int, modified_at: float, cache,
+                 read_pages=None) -> tuple:
+    # Ingests one file and checkpoints the outcome; returns (status, chunks,
+    # error). A failure has already been rolled back by ingest.
+    with pool.connection() as conn, lock:
+        try:
+            result = ingest(conn, path, cache=cache, verbose=False, read_pages=read_pages)
+        except Exception as exc:
+            error = f"{type(exc).__name__}: {exc}"
+            save_checkpoint(conn, path, size, modified_at, "failed", error=error)
+            return "failed", 0, error
+        if result is None:
+            save_checkpoint(conn, path, size, modified_at, "done")
+            return "unchanged", 0, None
+        status = "empty" if result["chunks"] == 0 else "done"
+        save_checkpoint(conn, path, size, modified_at, status, result["chunks"])
+        return status, result["written"], None
+
+def batch_ingest(pool: ConnectionPool, patterns: list[str], workers: int = INGEST_WORKERS, cache=None,
+                 retry_failed: bool = False, progress_interval: float = PROGRESS_INTERVAL,
+                 out=print) -> BatchProgress:
+    # Ingests every PDF the patterns match. Files checkpointed as done or
+    # empty, and unless retry_failed as failed, are skipped while their size
+    # and mtime are unchanged, so an interrupted run picks up where it left
+    # off. Corrupt files are recorded and reported, not raised.
+    paths = find_pdfs(patterns)
+    with pool.connection() as conn:
+        checkpoints = get_checkpoints(conn)
+    skip = _FINISHED if retry_failed else _FINISHED + ("failed",)
+    pending, skipped, failed_before = [], 0, 0
+    for path in paths:
+        stat = _stat(path)
+        checkpoint = checkpoints.get(path)
+        if stat is not None and checkpoint is not None and checkpoint[:2] == stat and checkpoint[2] in skip:
+            skipped += 1
+            failed_before += checkpoint[2] == "failed"
+            continue
+        pending.append((path, stat))
+    out(f"Found {len(paths)} PDFs: {skipped} already processed, {len(pending)} to ingest")
+    if failed_before:
+        out(f"  {failed_before} of those failed before; use --retry-failed to try them again")
+
+    progress = BatchProgress(len(pending))
+    # The numpy store has one transaction at a time, so its files are written
+    # one by one; Postgres workers each have their own connection.
+    lock = threading.Lock() if pool.shared else contextlib.nullcontext()
+    # One pool of extraction processes serves the whole batch, each file
+    # getting an equal share of it, instead of every file starting its own.
+    workers = max(1, workers)
+    extractors = extraction_pool() if EXTRACT_WORKERS > 1 else None
+    read_pages = functools.partial(iter_pages, workers=max(1, EXTRACT_WORKERS // workers), pool=extractors)
+    executor = ThreadPoolExecutor(max_workers=workers)
+    try:
+        futures = {}
+        for path, stat in pending:
+            if stat is None:
+                progress.add(path, 0, "failed", error="file not found")
+                out(f"  skipped {path}: file not found")
+                continue
+            future = executor.submit(_ingest_file, pool, lock, path, *stat, cache, read_pages)
+            futures[future] = (path, stat[0])
+        reported = time.perf_counter()
+        for future in as_completed(futures):
+            path, size = futures[future]
+            status, chunks, error = future.result()
+            progress.add(path, size, status, chunks, error)
+            if error is not None:
+                out(f"  skipped {path}: {error}")
+            if time.perf_counter() - reported >= progress_interval:
+                out(progress.line())
+                reported = time.perf_counter()
+    finally:
+        # On Ctrl-C, drop the files not started yet; the ones in flight
+        # finish or roll back, and their checkpoints say which.
+        executor.shutdown(wait=True, cancel_futures=True)
+        if extractors is not None:
+            extractors.shutdown(wait=True, cancel_futures=True)
+
+    out(progress.line())
+    for path in progress.empty:
+        out(f"  no text in {path}")
+    return progress
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Ingest every PDF in directories or globs.")
+    parser.add_argument("paths", nargs="+", help="directories, globs (quote them; ** recurses) or PDF files")
+    parser.add_argument("--workers", type=int, default=INGEST_WORKERS, help="files ingested at once")
+    parser.add_argument("--retry-failed", action="store_true", help="retry files that failed in an earlier run")
+    args = parser.parse_args(argv)
+
+    pool = ConnectionPool(max(1, args.workers))
+    cache = EmbeddingCache(os.getenv("EMBEDDING_CACHE_PATH", ".askpdf_cache.db"))
+    try:
+        progress = batch_ingest(pool, args.paths, args.workers, cache, args.retry_failed)
+    finally:
+        cache.close()
+        pool.close()
+    return 1 if progress.failed else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
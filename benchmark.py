@@ -0,0 +1,407 @@
+import argparse
+import contextlib
+import hashlib
+import io
+import json
+import os
+import platform
+import random
+import statistics
+import sys
+import tempfile
+import time
+from types import SimpleNamespace
+
+import numpy as np
+import openai
+
+import npstore
+from chunker import chunk_by_sentences
+from embedder import EMBEDDING_DIMENSIONS
+from ingest import ingest
+from main import ask
+from store import backend_for, connect, insert_chunks, search_chunks
+from vectordb import rebuild_vector_index
+
+# Performance benchmarks for chunking, ingest, search and ask, run against
+# fake embedding and chat models so the numbers measure this code and not
+# the network. Results are written as JSON and can be compared against a
+# saved baseline run; see main() for the command line.
+
+CORPUS_WORDS = (10_000, 100_000, 1_000_000)
+PDF_PAGES = (10, 100, 1000)
+SEARCH_ROWS = (10_000, 100_000, 1_000_000)
+QUERIES = 200
+EMBED_LATENCY = 0.05
+CHAT_LATENCY = 0.2
+# Relative change beyond which compare_results reports a metric.
+TOLERANCE = 0.10
+
+# Metrics compare_results checks, and whether higher is better.
+METRICS = {
+    "chunks_per_sec": True,
+    "mb_per_sec": True,
+    "mb_per_min": True,
+    "p50_ms": False,
+    "p95_ms": False,
+    "p99_ms": False,
+}
+
+_VOCABULARY = (
+    "the a of to and in for on with by from that this is are was were be has have it its "
+    "system data model vector index query search document page chunk token result cost "
+    "latency memory table column row value report section figure method approach error "
+    "network server client request response cache store batch stream thread process "
+    "invoice contract policy clause payment account customer order product service"
+).split()
+
+def synthetic_text(words: int, seed: int = 0) -> str:
+    # Deterministic prose-like text: sentences of 5-25 words ending in . ! or ?
+    rng = random.Random(seed)
+    sentences = []
+    written = 0
+    while written < words:
+        length = min(rng.randint(5, 25), words - written)
+        sentence = " ".join(rng.choice(_VOCABULARY) for _ in range(length))
+        sentences.append(sentence.capitalize() + rng.choice("..!?"))
+        written += length
+    return " ".join(sentences)
+
+def synthetic_pages(pages: int, words_per_page: int = 400, seed: int = 0) -> list[str]:
+    return [synthetic_text(words_per_page, seed * 1_000_003 + page) for page in range(pages)]
+
+def _pdf_string(text):
+    return text.replace("\\", "\\\\").replace("(", "\\(").replace(")", "\\)")
+
+def make_pdf(path, pages) -> str:
+    # Writes a minimal text PDF that pypdf can parse. pages is a list of
+    # strings; each page gets one line of Helvetica text per line in its
+    # string.
+    objects = [
+        b"<< /Type /Catalog /Pages 2 0 R >>",
+        None,  # page tree, filled in once the page objects are numbered
+        b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>",
+    ]
+    page_ids = []
+    for text in pages:
+        lines = text.split("\n")
+        ops = ["BT", "/F1 12 Tf", "14 TL", "72 720 Td"]
+        for line in lines:
+            ops.append(f"({_pdf_string(line)}) Tj T*")
+        ops.append("ET")
+        stream = "\n".join(ops).encode("latin-1")
+        objects.append(b"<< /Length %d >>\nstream\n" % len(stream) + stream + b"\nendstream")
+        content_id = len(objects)
+        objects.append(
+            b"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 612 792] "
+            b"/Resources << /Font << /F1 3 0 R >> >> /Contents %d 0 R >>" % content_id
+        )
+        page_ids.append(len(objects))
+    kids = " ".join(f"{i} 0 R" for i in page_ids).encode()
+    objects[1] = b"<< /Type /Pages /Kids [" + kids + b"] /Count %d >>" % len(page_ids)
+
+    out = bytearray(b"%PDF-1.4\n")
+    offsets = []
+    for number, body in enumerate(objects, 1):
+        offsets.append(len(out))
+        out += b"%d 0 obj\n" % number + body + b"\nendobj\n"
+    xref = len(out)
+    out += b"xref\n0 %d\n0000000000 65535 f \n" % (len(objects) + 1)
+    for offset in offsets:
+        out += b"%010d 00000 n \n" % offset
+    out += b"trailer\n<< /Size %d /Root 1 0 R >>\nstartxref\n%d\n%%%%EOF\n" % (len(objects) + 1, xref)
+
+    with open(path, "wb") as file:
+        file.write(bytes(out))
+    return str(path)
+
+def synthetic_pdf(path: str, pages: int, words_per_page: int = 400, seed: int = 0) -> str:
+    # One line of text per 12 words so the page content stays readable.
+    texts = []
+    for text in synthetic_pages(pages, words_per_page, seed):
+        words = text.split()
+        texts.append("\n".join(" ".join(words[i:i + 12]) for i in range(0, len(words), 12)))
+    return make_pdf(path, texts)
+
+def fake_embedding(text: str, dimensions: int = EMBEDDING_DIMENSIONS) -> list[float]:
+    # Unit vector seeded by the text, so equal texts embed equally.
+    seed = int.from_bytes(hashlib.sha256(text.encode("utf-8")).digest()[:8], "little")
+    vector = np.random.default_rng(seed).standard_normal(dimensions)
+    return (vector / np.linalg.norm(vector)).tolist()
+
+class FakeEmbeddings:
+    # Stands in for openai.embeddings.create: sleeps latency seconds per
+    # request and returns fake_embedding vectors.
+    def __init__(self, latency: float = EMBED_LATENCY, dimensions: int = EMBEDDING_DIMENSIONS):
+        self.latency = latency
+        self.dimensions = dimensions
+        self.calls = 0
+
+    def __call__(self, model, input, dimensions=None, **options):
+        self.calls += 1
+        time.sleep(self.latency)
+        size = dimensions or self.dimensions
+        return SimpleNamespace(data=[SimpleNamespace(embedding=fake_embedding(text, size)) for text in input])
+
+class FakeChat:
+    # Stands in for openai.chat.completions.create: sleeps latency seconds
+    # and answers with the start of the context.
+    def __init__(self, latency: float = CHAT_LATENCY):
+        self.latency = latency
+        self.calls = 0
+
+    def __call__(self, model, messages, **options):
+        self.calls += 1
+        time.sleep(self.latency)
+        answer = " ".join(messages[-1]["content"].split()[1:21])
+        return SimpleNamespace(choices=[SimpleNamespace(message=SimpleNamespace(content=answer))])
+
+@contextlib.contextmanager
+def _replaced(target, name, value):
+    # Sets target.name for the duration of the block, then puts back the
+    # original (or removes the override if the value came from the class).
+    own = name in vars(target)
+    original = vars(target).get(name)
+    setattr(target, name, value)
+    try:
+        yield
+    finally:
+        if own:
+            setattr(target, name, original)
+        else:
+            delattr(target, name)
+
+@contextlib.contextmanager
+def fake_models(embed_latency: float = EMBED_LATENCY, chat_latency: float = CHAT_LATENCY):
+    with _replaced(openai.embeddings, "create", FakeEmbeddings(embed_latency)), \
+         _replaced(openai.chat.completions, "create", FakeChat(chat_latency)):
+        yield
+
+def percentiles(samples_ms: list[float]) -> dict:
+    if len(samples_ms) < 2:
+        value = samples_ms[0] if samples_ms else None
+        return {"p50_ms": value, "p95_ms": value, "p99_ms": value}
+    cuts = statistics.quantiles(samples_ms, n=100, method="inclusive")
+    return {"p50_ms": cuts[49], "p95_ms": cuts[94], "p99_ms": cuts[98]}
+
+def bench_chunking(word_counts=CORPUS_WORDS, repeat: int = 3) -> list[dict]:
+    # Best of repeat runs per corpus size, which is the least noisy figure.
+    results = []
+    for words in word_counts:
+        text = synthetic_text(words)
+        seconds = float("inf")
+        for _ in range(repeat):
+            tick = time.perf_counter()
+            chunks = chunk_by_sentences(text)
+            seconds = min(seconds, time.perf_counter() - tick)
+        results.append({
+            "words": words,
+            "chunks": len(chunks),
+            "seconds": seconds,
+            "chunks_per_sec": len(chunks) / seconds,
+            "mb_per_sec": len(text.encode("utf-8")) / 1e6 / seconds,
+        })
+    return results
+
+def bench_ingest(conn, page_counts=PDF_PAGES, workdir: str = None) -> list[dict]:
+    # Ingests a fresh synthetic PDF per size through the full pipeline
+    # (parse, chunk, embed with the fake model, write).
+    results = []
+    with tempfile.TemporaryDirectory(dir=workdir) as directory:
+        for pages in page_counts:
+            path = synthetic_pdf(os.path.join(directory, f"bench-{pages}.pdf"), pages, seed=pages)
+            size = os.path.getsize(path)
+            before = _count(conn)
+            tick = time.perf_counter()
+            with contextlib.redirect_stdout(io.StringIO()):
+                ingest(conn, path)
+            seconds = time.perf_counter() - tick
+            chunks = _count(conn) - before
+            results.append({
+                "pages": pages,
+                "pdf_bytes": size,
+                "chunks": chunks,
+                "seconds": seconds,
+                "chunks_per_sec": chunks / seconds,
+                "mb_per_min": size / 1e6 / (seconds / 60),
+            })
+    return results
+
+def bench_search(conn, row_counts=SEARCH_ROWS, queries: int = QUERIES, index: str = None,
+                 top_k: int = 5, dimensions: int = EMBEDDING_DIMENSIONS, batch: int = 5000,
+                 **settings) -> list[dict]:
+    # Grows the store to each row count in turn with synthetic clustered
+    # vectors, optionally (re)builds an ANN index (Postgres only), then times
+    # single queries.
+    rng = np.random.default_rng(0)
+    centers = rng.standard_normal((64, dimensions))
+    query_vectors = _clustered(rng, centers, queries)
+    results = []
+    for rows in sorted(row_counts):
+        while _count(conn) < rows:
+            count = min(batch, rows - _count(conn))
+            vectors = _clustered(rng, centers, count)
+            start = _count(conn)
+            insert_chunks(conn, [
+                (f"synthetic chunk {start + i}", vector.tolist(), "bench.pdf", start + i)
+                for i, vector in enumerate(vectors)
+            ])
+        if index is not None and backend_for(conn) is not npstore:
+            rebuild_vector_index(conn, index)
+        samples = []
+        for vector in query_vectors:
+            query = vector.tolist()
+            tick = time.perf_counter()
+            search_chunks(conn, query, top_k, **settings)
+            samples.append((time.perf_counter() - tick) * 1000)
+        results.append({"rows": rows, "queries": queries, "index": index, **percentiles(samples)})
+    return results
+
+def _clustered(rng, centers, count):
+    vectors = centers[rng.integers(len(centers), size=count)] + 0.5 * rng.standard_normal((count, centers.shape[1]))
+    return (vectors / np.linalg.norm(vectors, axis=1, keepdims=True)).astype(np.float32)
+
+def bench_ask(conn, questions: int = 20, seed: int = 0) -> dict:
+    # End to end: embed the question, search, pack and generate, with the
+    # fake models' latency included.
+    rng = random.Random(seed)
+    samples = []
+    for _ in range(questions):
+        question = synthetic_text(rng.randint(6, 14), rng.randrange(1 << 30))
+        tick = time.perf_counter()
+        ask(conn, question)
+        samples.append((time.perf_counter() - tick) * 1000)
+    return {"questions": questions, **percentiles(samples)}
+
+def _count(conn) -> int:
+    if backend_for(conn) is npstore:
+        return conn.count
+    cursor = conn.cursor()
+    cursor.execute("SELECT count(*) FROM documents;")
+    return cursor.fetchone()[0]
+
+def _open(args, parser, directory: str):
+    # An empty store for one benchmark: a new numpy store directory, or the
+    # Postgres database emptied (only with --reset if it has rows).
+    if args.backend == "numpy":
+        return npstore.NumpyStore(tempfile.mkdtemp(dir=directory))
+    conn = connect("postgres")
+    if _count(conn) and not args.reset:
+        parser.error("the documents table is not empty; use a scratch database or pass --reset")
+    cursor = conn.cursor()
+    cursor.execute("TRUNCATE documents, document_files, document_pages RESTART IDENTITY;")
+    conn.commit()
+    return conn
+
+# Fields that identify a run within a benchmark.
+_CASE_FIELDS = ("words", "pages", "rows", "index", "questions")
+
+def compare_results(current: dict, baseline: dict, tolerance: float = TOLERANCE) -> list[dict]:
+    # Every metric that got worse than the baseline by more than tolerance.
+    # Runs are matched on their size; ones missing from either side are skipped.
+    regressions = []
+    for name, runs in current["results"].items():
+        base_runs = baseline.get("results", {}).get(name)
+        if base_runs is None:
+            continue
+        if isinstance(runs, dict):
+            runs, base_runs = [runs], [base_runs]
+        base_by_case = {_case(base): base for base in base_runs}
+        for run in runs:
+            base = base_by_case.get(_case(run))
+            if base is None:
+                continue
+            for metric, higher_is_better in METRICS.items():
+                now, before = run.get(metric), base.get(metric)
+                if not now or not before:
+                    continue
+                change = (now - before) / before
+                worse = -change if higher_is_better else change
+                if worse > tolerance:
+                    regressions.append({
+                        "benchmark": name,
+                        "case": dict(_case(run)),
+                        "metric": metric,
+                        "baseline": before,
+                        "current": now,
+                        "change": change,
+                    })
+    return regressions
+
+def _case(run: dict) -> tuple:
+    return tuple((field, run[field]) for field in _CASE_FIELDS if field in run)
+
+def _sizes(value: str) -> list[int]:
+    return [int(size) for size in value.split(",") if size]
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Benchmark chunking, ingest, search and ask.")
+    parser.add_argument("--only", default="chunking,ingest,search,ask",
+                        help="comma-separated benchmarks to run")
+    parser.add_argument("--backend", default="numpy", choices=("numpy", "postgres"),
+                        help="postgres uses DATABASE_URL; point it at a scratch database")
+    parser.add_argument("--reset", action="store_true",
+                        help="empty the documents tables first (required if they have rows)")
+    parser.add_argument("--words", type=_sizes, default=list(CORPUS_WORDS))
+    parser.add_argument("--pages", type=_sizes, default=list(PDF_PAGES))
+    parser.add_argument("--rows", type=_sizes, default=list(SEARCH_ROWS))
+    parser.add_argument("--queries", type=int, default=QUERIES)
+    parser.add_argument("--questions", type=int, default=20)
+    parser.add_argument("--index", choices=("hnsw", "ivfflat"), default=None)
+    parser.add_argument("--embed-latency", type=float, default=EMBED_LATENCY)
+    parser.add_argument("--chat-latency", type=float, default=CHAT_LATENCY)
+    parser.add_argument("--output", default="benchmark-results.json")
+    parser.add_argument("--baseline", help="earlier results file to compare against")
+    parser.add_argument("--tolerance", type=float, default=TOLERANCE)
+    args = parser.parse_args(argv)
+    only = set(args.only.split(","))
+
+    results = {}
+    if "chunking" in only:
+        results["chunking"] = bench_chunking(args.words)
+
+    with tempfile.TemporaryDirectory() as directory, fake_models(args.embed_latency, args.chat_latency):
+        if "ingest" in only:
+            conn = _open(args, parser, directory)
+            results["ingest"] = bench_ingest(conn, args.pages)
+            conn.close()
+        if only & {"search", "ask"}:
+            conn = _open(args, parser, directory)
+            if "search" in only:
+                results["search"] = bench_search(conn, args.rows, args.queries, args.index)
+            else:
+                bench_search(conn, args.rows[-1:], 0)
+            if "ask" in only:
+                results["ask"] = bench_ask(conn, args.questions)
+            conn.close()
+
+    report = {
+        "meta": {
+            "created": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "backend": args.backend,
+            "dimensions": EMBEDDING_DIMENSIONS,
+            "embed_latency": args.embed_latency,
+            "chat_latency": args.chat_latency,
+        },
+        "results": results,
+    }
+    with open(args.output, "w") as file:
+        json.dump(report, file, indent=2)
+    print(json.dumps(results, indent=2))
+    print(f"Results written to {args.output}")
+
+    if args.baseline:
+        with open(args.baseline) as file:
+            regressions = compare_results(report, json.load(file), args.tolerance)
+        for regression in regressions:
+            print(f"REGRESSION {regression['benchmark']} {regression['case']} {regression['metric']}: "
+                  f"{regression['baseline']:.4g} -> {regression['current']:.4g} ({regression['change']:+.1%})")
+        if regressions:
+            return 1
+        print(f"No regressions beyond {args.tolerance:.0%} against {args.baseline}")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
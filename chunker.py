@@ -1,7 +1,51 @@
 from pypdf import PdfReader
+from bisect import bisect_right
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from typing import Iterable, Iterator
+import codecs
+import itertools
+import multiprocessing
+import operator
+import os
 import re
 
-def chunk_text(text: str, chunk_size: int = 500, overlap: int = 50) -> list[str]: 
+import numpy as np
+
+import metrics
+
+SENTENCE_BOUNDARY = re.compile(r'(?<=[.!?])\s+')
+# The same boundaries as SENTENCE_BOUNDARY, but matching the punctuation too,
+# which the regex engine can scan for much faster than a lookbehind.
+_SENTENCE_END = re.compile(r'([.!?])\s+')
+# Sentences are found and their words counted over one byte per character:
+# b' ' for whatever \s matches, b'.' for sentence punctuation and b'x' for
+# the rest. Characters past Latin-1 are encoded by _classify as a tab or an
+# 'x' (never a plain space, which a one-space separator must be); the byte
+# table then classifies every character.
+_CLASSES = ''.join(' ' if char.isspace() else '.' if char in '.!?' else 'x'
+                   for char in map(chr, range(256))).encode('ascii')
+_SPACE, _PERIOD = ord(' '), ord('.')
+
+def _classify(error):
+    text = error.object[error.start:error.end]
+    return ''.join('\t' if char.isspace() else 'x' for char in text), error.end
+
+codecs.register_error('chunker.classify', _classify)
+
+# Parallel extraction only pays for the worker start-up and the extra parse
+# of the PDF structure in every worker on larger files. A spawned worker
+# re-imports the main module (the CLI's pulls in openai), about 1.5 s, while
+# pypdf extracts a page in about 6 ms; with 4-8 workers that breaks even
+# around 300 pages. A pool shared by a batch (extraction_pool) is started
+# once, so files of any size go to it.
+EXTRACT_WORKERS = int(os.getenv("PDF_EXTRACT_WORKERS", os.cpu_count() or 1))
+PARALLEL_MIN_PAGES = 300
+MIN_PAGES_PER_TASK = 16
+# Page ranges queued or being extracted per worker at any time.
+RANGES_IN_FLIGHT = 2
+
+def chunk_text(text: str, chunk_size: int = 500, overlap: int = 50) -> list[str]:
     words = text.split()
     chunks = [];
     for i in range(0, len(words), chunk_size - overlap):
@@ -9,33 +53,241 @@ def chunk_text(text: str, chunk_size: int = 500, overlap: int = 50) -> list[str]
         chunks.append(chunk)
     return chunks
 
-def chunk_pdf(pdf_path: str) -> list[str]:
+def iter_pages(pdf_path: str, workers: int = None, pool: ProcessPoolExecutor = None) -> Iterator[str]:
+    # Pages are parsed one at a time, as the consumer asks for them. Large
+    # files are split into page ranges that worker processes extract
+    # concurrently; the ranges are still yielded in page order. With a
+    # shared pool, workers is this file's share of it.
+    workers = EXTRACT_WORKERS if workers is None else workers
     with open(pdf_path, 'rb') as file:
         pdf_reader = PdfReader(file)
-        text = ''
-        for page in pdf_reader.pages:
-            text += page.extract_text();
-        return chunk_by_sentences(text)
+        page_count = len(pdf_reader.pages)
+        if pool is None and (workers <= 1 or page_count < PARALLEL_MIN_PAGES):
+            for page in pdf_reader.pages:
+                yield _extracted(page.extract_text())
+            return
 
-def chunk_by_sentences(text:str, max_chunk_size: int = 500, overlap: int = 5) -> list[str]:
-    sentences = re.split(r'(?<=[.!?])\s+', text)
+    if pool is not None:
+        yield from _iter_ranges(pool, pdf_path, page_count, workers)
+        return
+    with extraction_pool(workers) as executor:
+        yield from _iter_ranges(executor, pdf_path, page_count, workers)
 
-    chunks = []
-    current_chunk = []
-    current_size = 0
+def extraction_pool(workers: int = None) -> ProcessPoolExecutor:
+    # Workers are spawned, not forked: ingest runs on threads while other
+    # threads hold locks and open connections a fork would copy.
+    workers = EXTRACT_WORKERS if workers is None else workers
+    return ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn"))
 
-    for sentence in sentences:
-        sentence_words = len(sentence.split())
+def _iter_ranges(executor, pdf_path: str, page_count: int, workers: int) -> Iterator[str]:
+    # Only a few ranges per worker are in flight, so a slow consumer doesn't
+    # end up holding the text of every page.
+    ranges = iter(_page_ranges(pdf_path, page_count, workers))
+    pending = deque(executor.submit(_extract_range, task)
+                    for task in itertools.islice(ranges, workers * RANGES_IN_FLIGHT))
+    try:
+        while pending:
+            pages = pending.popleft().result()
+            task = next(ranges, None)
+            if task is not None:
+                pending.append(executor.submit(_extract_range, task))
+            for page in pages:
+                yield _extracted(page)
+    finally:
+        # If the consumer stops early, don't extract the ranges queued.
+        for future in pending:
+            future.cancel()
 
-        if current_size + sentence_words > max_chunk_size and current_chunk:
-            chunks.append(' '.join(current_chunk))
-            current_chunk = current_chunk[-overlap:] if overlap > 0 else []
-            current_size = sum(len(s.split()) for s in current_chunk) if overlap > 0 else 0
+def _extracted(text: str) -> str:
+    if metrics.enabled():
+        metrics.count("extracted_bytes", len(text.encode("utf-8")))
+    return text
 
-        current_chunk.append(sentence)
-        current_size += sentence_words
+def _page_ranges(pdf_path: str, page_count: int, workers: int) -> list[tuple[str, int, int]]:
+    # A few tasks per worker so uneven pages don't leave workers idle.
+    size = max(MIN_PAGES_PER_TASK, -(-page_count // (workers * 4)))
+    return [(pdf_path, start, min(start + size, page_count)) for start in range(0, page_count, size)]
+
+def _extract_range(task: tuple[str, int, int]) -> list[str]:
+    # Runs in a worker process, which opens its own reader.
+    pdf_path, start, end = task
+    with open(pdf_path, 'rb') as file:
+        pdf_reader = PdfReader(file)
+        return [pdf_reader.pages[i].extract_text() for i in range(start, end)]
+
+def extract_pages(pdf_path: str, workers: int = None) -> list[str]:
+    return list(iter_pages(pdf_path, workers))
+
+def stream_pdf(pdf_path: str, max_chunk_size: int = 500, overlap: int = 5,
+               workers: int = None) -> Iterator[tuple[str, int, int]]:
+    # Yields (chunk, start_page, end_page) while the PDF is still being read.
+    for span in iter_chunk_spans(iter_pages(pdf_path, workers), max_chunk_size, overlap):
+        yield span.text(), span.start_page, span.end_page
+
+@metrics.instrumented("chunk_pdf")
+def chunk_pdf(pdf_path: str) -> list[str]:
+    return [chunk for chunk, _, _ in stream_pdf(pdf_path)]
 
-    if current_chunk:
-        chunks.append(' '.join(current_chunk))
+def chunk_pages(pages: list[str], max_chunk_size: int = 500, overlap: int = 5) -> list[tuple[str, int, int]]:
+    # Same chunks as chunk_by_sentences over the concatenated pages, each with
+    # the 1-based first and last page it was taken from.
+    return [
+        (span.text(), span.start_page, span.end_page)
+        for span in iter_chunk_spans(pages, max_chunk_size, overlap)
+    ]
 
-    return chunks
\ No newline at end of file
+class ChunkSpan:
+    # A chunk as the character range [start, end) of the document text (all
+    # pages joined) plus the 1-based pages it covers. The chunk text, with
+    # the whitespace between sentences collapsed to one space, is only built
+    # when text() is called.
+    __slots__ = ("start", "end", "start_page", "end_page", "_source", "_base", "_sentences")
+
+    def __init__(self, start, end, start_page, end_page, source, base, sentences=None):
+        self.start = start
+        self.end = end
+        self.start_page = start_page
+        self.end_page = end_page
+        self._source = source  # text holding the span, starting at offset base
+        self._base = base
+        # (start, end) of the sentences, or None if they are already
+        # separated by single spaces.
+        self._sentences = sentences
+
+    def text(self) -> str:
+        base, source = self._base, self._source
+        if self._sentences is None:
+            return source[self.start - base:self.end - base]
+        return ' '.join([source[start - base:end - base] for start, end in self._sentences])
+
+    def __repr__(self):
+        return f"ChunkSpan({self.start}, {self.end}, pages {self.start_page}-{self.end_page})"
+
+def materialize(text: str, start: int, end: int) -> str:
+    return _SENTENCE_END.sub(r'\1 ', text[start:end])
+
+def chunk_spans(text: str, max_chunk_size: int = 500, overlap: int = 5) -> list[tuple[int, int]]:
+    # (start, end) offsets of chunk_by_sentences' chunks in text.
+    return [(span.start, span.end) for span in iter_chunk_spans([text], max_chunk_size, overlap)]
+
+def iter_chunk_spans(pages: Iterable[str], max_chunk_size: int = 500,
+                     overlap: int = 5) -> Iterator[ChunkSpan]:
+    # The chunks of chunk_pages as spans. Each page's sentences are found and
+    # their words counted in a few passes over the page (_sentences), and a
+    # chunk's end is found by bisecting the running word count rather than by
+    # stepping through its sentences. Only the text from the current chunk's
+    # first sentence on is held.
+    buffer = ''
+    base = 0  # document offset of buffer[0]
+    scan = 0  # buffer index where the unfinished sentence starts
+    page_ends = []  # document end offset of every page so far
+    # Completed sentences from the current chunk's first one on; words and
+    # unspaced are running counts (of words, and of sentences not followed by
+    # exactly one space) before each sentence, so one entry longer.
+    starts, ends = [], []
+    words, unspaced = [0], [0]
+    first = 0  # the current chunk's first sentence
+    after = 0  # the first sentence not yet in the current chunk
+    pages = iter(pages)
+    last_page = False
+
+    while not last_page:
+        page = next(pages, None)
+        if page is None:
+            last_page = True
+        else:
+            page_ends.append((page_ends[-1] if page_ends else 0) + len(page))
+            buffer += page
+        new_starts, new_ends, new_words, new_spaced, scan = _sentences(buffer, scan, last_page, base)
+        if new_starts:
+            starts += new_starts
+            ends += new_ends
+            words += itertools.islice(itertools.accumulate(new_words, initial=words[-1]), 1, None)
+            unspaced += itertools.islice(itertools.accumulate(
+                map(operator.not_, new_spaced), initial=unspaced[-1]), 1, None)
+            after = max(after, first + 1)
+
+        # A sentence that takes the chunk past max_chunk_size words closes it
+        # (it is kept even then if the chunk has no other sentences), and the
+        # next chunk starts with the last overlap sentences before it.
+        while True:
+            close = max(after, bisect_right(words, words[first] + max_chunk_size, after) - 1)
+            if close >= len(starts):
+                break
+            yield _span(starts, ends, unspaced, first, close, buffer, base, page_ends)
+            first = close - (min(overlap, close - first) if overlap > 0 else 0)
+            after = close + 1
+
+        if last_page:
+            yield _span(starts, ends, unspaced, first, len(starts), buffer, base, page_ends)
+        elif first > 0:
+            # Drop sentences and text no chunk can need any more.
+            for counts in (starts, ends, words, unspaced):
+                del counts[:first]
+            after -= first
+            first = 0
+            keep_from = starts[0] - base if starts else scan
+            buffer = buffer[keep_from:]
+            base += keep_from
+            scan -= keep_from
+
+def _sentences(buffer: str, scan: int, final: bool, base: int) -> tuple[list, list, list, list, int]:
+    # (starts, ends, words, spaced, new scan) for the sentences completed in
+    # buffer[scan:], with document offsets (buffer[0] is at base): the same
+    # sentences _SENTENCE_END would give and the word counts str.split would,
+    # from the positions of all word starts and sentence ends rather than a
+    # copy and a split of every sentence. Until the last page, whitespace at
+    # the very end of the buffer may continue on the next page, so that
+    # boundary waits; on the last page the rest of the buffer is one more
+    # sentence.
+    encoded = buffer[scan:].encode('latin-1', 'chunker.classify')
+    text = np.frombuffer(encoded, dtype=np.uint8)
+    classes = np.frombuffer(encoded.translate(_CLASSES), dtype=np.uint8)
+    size = len(classes)
+    space = classes == _SPACE
+    word_starts = (space[:-1] & ~space[1:]).nonzero()[0] + 1
+    if size and not space[0]:
+        word_starts = np.concatenate(([0], word_starts))
+    ends = ((classes[:-1] == _PERIOD) & space[1:]).nonzero()[0] + 1
+    # Word starts before each end; the next sentence starts at the first
+    # word start after it.
+    before = word_starts.searchsorted(ends)
+    next_starts = np.concatenate((word_starts, [size]))[before]
+    if final:
+        ends = np.concatenate((ends, [size]))
+        next_starts = np.concatenate((next_starts, [size]))
+        before = np.concatenate((before, [len(word_starts)]))
+    elif len(ends) and next_starts[-1] == size:
+        ends, next_starts, before = ends[:-1], next_starts[:-1], before[:-1]
+    if not len(ends):
+        return [], [], [], [], scan
+    words = before.copy()
+    words[1:] -= before[:-1]
+    spaced = next_starts == ends + 1
+    spaced[spaced] = text[ends[spaced]] == _SPACE
+    offset = base + scan
+    starts = np.concatenate(([0], next_starts[:-1])) + offset
+    return (starts.tolist(), (ends + offset).tolist(), words.tolist(), spaced.tolist(),
+            scan + int(next_starts[-1]))
+
+def _span(starts, ends, unspaced, first, close, buffer, base, page_ends) -> ChunkSpan:
+    # The chunk of sentences [first, close).
+    start, first_end = starts[first], ends[first]
+    last_start, end = starts[close - 1], ends[close - 1]
+    # Empty sentences are attributed to the page of the preceding character.
+    first_char = start if first_end > start else max(start - 1, 0)
+    last_char = max(end - 1, last_start if end > last_start else max(last_start - 1, 0))
+    # What follows the last sentence isn't part of the chunk; if every other
+    # sentence is followed by one space, the text is the plain slice.
+    sentences = None
+    if unspaced[close - 1] - unspaced[first] > 0:
+        sentences = tuple(zip(starts[first:close], ends[first:close]))
+    return ChunkSpan(start, end, _page(page_ends, first_char), _page(page_ends, last_char), buffer, base, sentences)
+
+def _page(page_ends, offset):
+    if not page_ends:
+        return None
+    return min(bisect_right(page_ends, offset), len(page_ends) - 1) + 1
+
+def chunk_by_sentences(text:str, max_chunk_size: int = 500, overlap: int = 5) -> list[str]:
+    return [span.text() for span in iter_chunk_spans([text], max_chunk_size, overlap)]
@@ -0,0 +1,189 @@
+import hashlib
+import re
+import sqlite3
+import threading
+import time
+import unicodedata
+from array import array
+from collections import OrderedDict
+
+# SQLite caps the number of bound parameters per statement.
+_LOOKUP_BATCH = 500
+
+class EmbeddingCache:
+    # On-disk embedding cache keyed by (model, dimensions, sha256(text)).
+    # Vectors are stored as float32 blobs; the least recently used entries are
+    # evicted once the cache grows past max_entries.
+
+    def __init__(self, path: str, max_entries: int = 50_000):
+        self.path = path
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("""
+            CREATE TABLE IF NOT EXISTS embeddings (
+                model TEXT NOT NULL,
+                dimensions INTEGER NOT NULL,
+                text_hash BLOB NOT NULL,
+                vector BLOB NOT NULL,
+                last_used REAL NOT NULL,
+                PRIMARY KEY (model, dimensions, text_hash)
+            )
+        """)
+        self._db.execute(
+            "CREATE INDEX IF NOT EXISTS embeddings_last_used ON embeddings (last_used)"
+        )
+        self._db.commit()
+
+    def get_many(self, model: str, dimensions: int, texts: list[str]) -> list:
+        # Returns one vector per text, or None where the text isn't cached.
+        # Every occurrence of a text after the first counts as a hit, since
+        # the caller only has to embed it once.
+        hashes = [text_hash(text) for text in texts]
+        unique = list(dict.fromkeys(hashes))
+        found = {}
+        now = time.time()
+
+        with self._lock:
+            for i in range(0, len(unique), _LOOKUP_BATCH):
+                batch = unique[i:i + _LOOKUP_BATCH]
+                placeholders = ", ".join("?" * len(batch))
+                cursor = self._db.execute(f"""
+                    SELECT text_hash, vector FROM embeddings
+                    WHERE model = ? AND dimensions = ? AND text_hash IN ({placeholders})
+                """, (model, dimensions, *batch))
+                for key, blob in cursor:
+                    found[bytes(key)] = _decode(blob)
+
+            self._db.executemany("""
+                UPDATE embeddings SET last_used = ?
+                WHERE model = ? AND dimensions = ? AND text_hash = ?
+            """, [(now, model, dimensions, key) for key in found])
+            self._db.commit()
+
+            missing = len(unique) - len(found)
+            self.misses += missing
+            self.hits += len(texts) - missing
+
+        return [found.get(key) for key in hashes]
+
+    def put_many(self, model: str, dimensions: int, texts: list[str], vectors: list[list[float]]):
+        now = time.time()
+        rows = [
+            (model, dimensions, text_hash(text), _encode(vector), now)
+            for text, vector in zip(texts, vectors)
+        ]
+        with self._lock:
+            self._db.executemany("""
+                INSERT OR REPLACE INTO embeddings (model, dimensions, text_hash, vector, last_used)
+                VALUES (?, ?, ?, ?, ?)
+            """, rows)
+            self._evict()
+            self._db.commit()
+
+    def _evict(self):
+        (count,) = self._db.execute("SELECT COUNT(*) FROM embeddings").fetchone()
+        excess = count - self.max_entries
+        if excess > 0:
+            self._db.execute("""
+                DELETE FROM embeddings WHERE rowid IN (
+                    SELECT rowid FROM embeddings ORDER BY last_used LIMIT ?
+                )
+            """, (excess,))
+
+    def __len__(self):
+        with self._lock:
+            return self._db.execute("SELECT COUNT(*) FROM embeddings").fetchone()[0]
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": self.hits / lookups if lookups else 0.0,
+            "entries": len(self),
+        }
+
+    def close(self):
+        self._db.close()
+
+class QueryCache:
+    # In-memory LRU of query embeddings keyed by (model, dimensions,
+    # normalized query). Misses fall through to an optional EmbeddingCache so
+    # entries survive restarts; disk entries are kept under a separate model
+    # key, since a normalized query is not the text that was embedded.
+
+    def __init__(self, max_entries: int = 1024, disk: EmbeddingCache = None):
+        self.max_entries = max_entries
+        self.disk = disk
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, model: str, dimensions: int, query: str):
+        key = (model, dimensions, normalize_query(query))
+        with self._lock:
+            vector = self._entries.get(key)
+            if vector is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return vector
+        if self.disk is not None:
+            vector = self.disk.get_many(_query_model(model), dimensions, [key[2]])[0]
+            if vector is not None:
+                with self._lock:
+                    self.disk_hits += 1
+                    self._remember(key, vector)
+                return vector
+        with self._lock:
+            self.misses += 1
+        return None
+
+    def put(self, model: str, dimensions: int, query: str, vector: list[float]):
+        key = (model, dimensions, normalize_query(query))
+        with self._lock:
+            self._remember(key, vector)
+        if self.disk is not None:
+            self.disk.put_many(_query_model(model), dimensions, [key[2]], [vector])
+
+    def _remember(self, key, vector):
+        self._entries[key] = vector
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def __len__(self):
+        return len(self._entries)
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.disk_hits + self.misses
+        return {
+            "hits": self.hits,
+            "disk_hits": self.disk_hits,
+            "misses": self.misses,
+            "hit_ratio": (self.hits + self.disk_hits) / lookups if lookups else 0.0,
+            "entries": len(self),
+        }
+
+def normalize_query(query: str) -> str:
+    # Questions differing only in case, spacing or Unicode form share an entry.
+    return re.sub(r"\s+", " ", unicodedata.normalize("NFKC", query)).strip().casefold()
+
+def _query_model(model: str) -> str:
+    return f"{model}#query"
+
+def text_hash(text: str) -> bytes:
+    return hashlib.sha256(text.encode("utf-8")).digest()
+
+def _encode(vector) -> bytes:
+    return array("f", vector).tobytes()
+
+def _decode(blob) -> list[float]:
+    vector = array("f")
+    vector.frombytes(blob)
+    return vector.tolist()
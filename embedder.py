@@ -1,11 +1,190 @@
 import openai;
+import asyncio;
+import os;
+from concurrent.futures import ThreadPoolExecutor;
+from typing import Protocol;
 from dotenv import load_dotenv;
+import metrics;
+import localembed;
+from ratelimit import scheduler_for, http_client, async_http_client;
 
 load_dotenv();
 
-def get_embeddings(texts: list[str]) -> list[list[float]]:
-    response = openai.embeddings.create(
-        model = "text-embedding-3-small",
-        input = texts,
-    )
-    return [item.embedding for item in response.data];
\ No newline at end of file
+# Retries, backoff and rate limits are handled by ratelimit's schedulers,
+# which also read the rate-limit headers off every response.
+openai.max_retries = 0;
+openai.http_client = http_client();
+
+# "openai" (default), "local" for the CPU encoder in localembed.py, which
+# needs no network, or a name given to register_provider. Their vectors
+# don't mix: re-ingest after switching.
+EMBEDDING_PROVIDER = os.getenv("EMBEDDING_PROVIDER", "openai");
+OPENAI_EMBEDDING_MODEL = "text-embedding-3-small";
+EMBEDDING_MODEL = localembed.MODEL if EMBEDDING_PROVIDER == "local" else OPENAI_EMBEDDING_MODEL;
+# text-embedding-3 models can return shorter vectors (a prefix of the full
+# one, renormalized); fewer dimensions mean smaller storage and indexes.
+EMBEDDING_FULL_DIMENSIONS = 1536;
+EMBEDDING_DIMENSIONS = int(os.getenv("EMBEDDING_DIMENSIONS", str(EMBEDDING_FULL_DIMENSIONS)));
+
+# The embeddings endpoint caps a request at 2048 inputs and 300k tokens. Stay
+# well under both so a single batch never gets rejected and large documents
+# are split into enough batches to run in parallel.
+MAX_BATCH_SIZE = 256;
+MAX_BATCH_TOKENS = 100_000;
+MAX_CONCURRENCY = int(os.getenv("EMBEDDING_CONCURRENCY", "4"));
+
+def estimate_tokens(text: str) -> int:
+    # ~4 characters per token for English text; close enough for batching.
+    return len(text) // 4 + 1;
+
+def make_batches(texts: list[str], max_batch_size: int = MAX_BATCH_SIZE,
+                 max_batch_tokens: int = MAX_BATCH_TOKENS) -> list[tuple[int, int]]:
+    # Returns (start, end) index ranges into texts. A single text larger than
+    # the token budget still gets a batch of its own.
+    batches = [];
+    start = 0;
+    tokens = 0;
+    for i, text in enumerate(texts):
+        text_tokens = estimate_tokens(text);
+        if i > start and (i - start >= max_batch_size or tokens + text_tokens > max_batch_tokens):
+            batches.append((start, i));
+            start = i;
+            tokens = 0;
+        tokens += text_tokens;
+    if start < len(texts):
+        batches.append((start, len(texts)));
+    return batches;
+
+def _embed_batch(texts: list[str]) -> list[list[float]]:
+    response = scheduler_for(EMBEDDING_MODEL).call(
+        lambda: openai.embeddings.create(
+            model = EMBEDDING_MODEL,
+            input = texts,
+            **_dimension_options(),
+        ),
+        tokens = sum(estimate_tokens(text) for text in texts),
+    );
+    metrics.count_call(response);
+    return [item.embedding for item in response.data];
+
+def _dimension_options() -> dict:
+    # Only ask for a size when it isn't the model's default.
+    if EMBEDDING_DIMENSIONS == EMBEDDING_FULL_DIMENSIONS:
+        return {};
+    return {"dimensions": EMBEDDING_DIMENSIONS};
+
+_async_client = None;
+
+def async_client() -> openai.AsyncOpenAI:
+    # One AsyncOpenAI per process, shared by the async embedding and chat
+    # calls so they reuse its HTTP connections. Use it from a single event loop.
+    global _async_client;
+    if _async_client is None:
+        _async_client = openai.AsyncOpenAI(max_retries = 0, http_client = async_http_client());
+    return _async_client;
+
+class EmbeddingProvider(Protocol):
+    # What get_embeddings and get_embeddings_async need from a provider.
+    # Both methods take the texts and the batch limits (max_batch_size,
+    # max_batch_tokens, max_concurrency) and return one vector per text.
+    cached: bool;  # False when embedding is cheaper than a cache lookup
+
+    def embed(self, texts: list[str], max_batch_size: int, max_batch_tokens: int,
+              max_concurrency: int) -> list[list[float]]: ...
+
+    async def embed_async(self, texts: list[str], max_batch_size: int, max_batch_tokens: int,
+                          max_concurrency: int) -> list[list[float]]: ...
+
+class OpenAIProvider:
+    # The embeddings endpoint, in batches of at most max_batch_size texts and
+    # max_batch_tokens tokens with up to max_concurrency requests in flight.
+    cached = True;
+
+    def embed(self, texts, max_batch_size, max_batch_tokens, max_concurrency):
+        batches = make_batches(texts, max_batch_size, max_batch_tokens);
+        if len(batches) == 1 or max_concurrency <= 1:
+            results = [_embed_batch(texts[start:end]) for start, end in batches];
+        else:
+            workers = min(max_concurrency, len(batches));
+            with ThreadPoolExecutor(max_workers = workers) as executor:
+                # Results are collected in submission order, so they line up
+                # with texts. Each batch runs in a copy of this context to
+                # stay in the caller's trace.
+                futures = [executor.submit(metrics.run_in_context(_embed_batch), texts[start:end]) for start, end in batches];
+                results = [future.result() for future in futures];
+        return [embedding for batch in results for embedding in batch];
+
+    async def embed_async(self, texts, max_batch_size, max_batch_tokens, max_concurrency):
+        semaphore = asyncio.Semaphore(max(1, max_concurrency));
+
+        async def embed(start, end):
+            async with semaphore:
+                response = await scheduler_for(EMBEDDING_MODEL).call_async(
+                    lambda: async_client().embeddings.create(
+                        model = EMBEDDING_MODEL,
+                        input = texts[start:end],
+                        **_dimension_options(),
+                    ),
+                    tokens = sum(estimate_tokens(text) for text in texts[start:end]),
+                );
+            metrics.count_call(response);
+            return [item.embedding for item in response.data];
+
+        results = await asyncio.gather(*(embed(start, end) for start, end in make_batches(texts, max_batch_size, max_batch_tokens)));
+        return [embedding for batch in results for embedding in batch];
+
+class LocalProvider:
+    # localembed's CPU encoder: the whole input is encoded as one matrix, at
+    # the configured size. Encoding is cheaper than a cache lookup.
+    cached = False;
+
+    def embed(self, texts, max_batch_size, max_batch_tokens, max_concurrency):
+        return list(localembed.encode(texts, EMBEDDING_DIMENSIONS));
+
+    async def embed_async(self, texts, max_batch_size, max_batch_tokens, max_concurrency):
+        return self.embed(texts, max_batch_size, max_batch_tokens, max_concurrency);
+
+_PROVIDERS = {"openai": OpenAIProvider(), "local": LocalProvider()};
+
+def register_provider(name: str, provider: EmbeddingProvider):
+    # Makes provider selectable as EMBEDDING_PROVIDER=name.
+    _PROVIDERS[name] = provider;
+
+def get_provider(name: str = None) -> EmbeddingProvider:
+    name = name or EMBEDDING_PROVIDER;
+    if name not in _PROVIDERS:
+        raise ValueError(f"Unknown embedding provider: {name}");
+    return _PROVIDERS[name];
+
+@metrics.instrumented("embed")
+def get_embeddings(texts: list[str], max_batch_size: int = MAX_BATCH_SIZE,
+                   max_batch_tokens: int = MAX_BATCH_TOKENS,
+                   max_concurrency: int = MAX_CONCURRENCY,
+                   cache = None) -> list[list[float]]:
+    if not texts:
+        return [];
+    provider = get_provider();
+    if cache is not None and provider.cached:
+        return _get_cached_embeddings(texts, cache, max_batch_size, max_batch_tokens, max_concurrency);
+    return provider.embed(texts, max_batch_size, max_batch_tokens, max_concurrency);
+
+def _get_cached_embeddings(texts, cache, max_batch_size, max_batch_tokens, max_concurrency):
+    vectors = cache.get_many(EMBEDDING_MODEL, EMBEDDING_DIMENSIONS, texts);
+    # Only embed each missing text once, even if it repeats in the input.
+    missing = list(dict.fromkeys(text for text, vector in zip(texts, vectors) if vector is None));
+    if missing:
+        embedded = get_embeddings(missing, max_batch_size, max_batch_tokens, max_concurrency);
+        cache.put_many(EMBEDDING_MODEL, EMBEDDING_DIMENSIONS, missing, embedded);
+        fresh = dict(zip(missing, embedded));
+        vectors = [fresh[text] if vector is None else vector for text, vector in zip(texts, vectors)];
+    return vectors;
+
+@metrics.instrumented("embed")
+async def get_embeddings_async(texts: list[str], max_batch_size: int = MAX_BATCH_SIZE,
+                               max_batch_tokens: int = MAX_BATCH_TOKENS,
+                               max_concurrency: int = MAX_CONCURRENCY) -> list[list[float]]:
+    # Same batching as get_embeddings; at most max_concurrency requests are
+    # awaited at once.
+    if not texts:
+        return [];
+    return await get_provider().embed_async(texts, max_batch_size, max_batch_tokens, max_concurrency);
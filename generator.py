@@ -1,16 +1,83 @@
 import openai;
+import time;
+from embedder import async_client, estimate_tokens;
+from ratelimit import scheduler_for;
 from dotenv import load_dotenv;
+import metrics;
 
 load_dotenv();
 
-def generate_answer(context: list[str], query: str) -> str:
+CHAT_MODEL = "gpt-4o-mini";
+
+def _messages(context: list[str], query: str) -> list[dict]:
     context_str = "\n\n".join(context);
+    return [
+        {"role": "system", "content": "You answer questions based only on the provided context."},
+        {"role": "user", "content": f"Context:\n{context_str}\n\nQuestion: {query}"}
+    ];
+
+def _request_tokens(messages: list[dict]) -> int:
+    # Prompt tokens the request counts against the tokens-per-minute quota.
+    return sum(estimate_tokens(message["content"]) for message in messages);
+
+@metrics.instrumented("generate")
+def generate_answer(context: list[str], query: str) -> str:
+    messages = _messages(context, query);
+    response = scheduler_for(CHAT_MODEL).call(
+        lambda: openai.chat.completions.create(
+            model = CHAT_MODEL,
+            messages = messages
+        ),
+        tokens = _request_tokens(messages),
+    );
+    metrics.count_call(response);
+    return response.choices[0].message.content;
+
+@metrics.instrumented("generate")
+async def generate_answer_async(context: list[str], query: str) -> str:
+    messages = _messages(context, query);
+    response = await scheduler_for(CHAT_MODEL).call_async(
+        lambda: async_client().chat.completions.create(
+            model = CHAT_MODEL,
+            messages = messages
+        ),
+        tokens = _request_tokens(messages),
+    );
+    metrics.count_call(response);
+    return response.choices[0].message.content;
 
-    response = openai.chat.completions.create(
-        model = "gpt-4o-mini",
-        messages = [
-            {"role": "system", "content": "You answer questions based only on the provided context."},
-            {"role": "user", "content": f"Context:\n{context_str}\n\nQuestion: {query}"}
-        ]
-    )
-    return response.choices[0].message.content;
\ No newline at end of file
+@metrics.instrumented("generate")
+def stream_answer(context: list[str], query: str, timings: dict = None):
+    # Yields the answer text as it arrives. If timings is given, it gets
+    # "first_token" and "total" (seconds since the request was sent).
+    started = time.perf_counter();
+    messages = _messages(context, query);
+    # Only opening the stream is scheduled; a 429 comes back before any token.
+    stream = scheduler_for(CHAT_MODEL).call(
+        lambda: openai.chat.completions.create(
+            model = CHAT_MODEL,
+            messages = messages,
+            stream = True,
+            stream_options = {"include_usage": True}
+        ),
+        tokens = _request_tokens(messages),
+    );
+    # The usage block comes in a last chunk with no choices; the call is
+    # counted even if the caller stops reading before it.
+    final = None;
+    try:
+        for chunk in stream:
+            if getattr(chunk, "usage", None) is not None:
+                final = chunk;
+            if not chunk.choices:
+                continue;
+            delta = chunk.choices[0].delta.content;
+            if not delta:
+                continue;
+            if timings is not None and "first_token" not in timings:
+                timings["first_token"] = time.perf_counter() - started;
+            yield delta;
+    finally:
+        metrics.count_call(final);
+    if timings is not None:
+        timings["total"] = time.perf_counter() - started;
@@ -1,17 +1,268 @@
-from chunker import chunk_pdf;
-from embedder import get_embeddings;
-from vectordb import insert_chunk;
+from chunker import iter_pages, iter_chunk_spans;
+from embedder import get_embeddings, MAX_BATCH_SIZE, MAX_CONCURRENCY;
+from store import get_document, get_source_chunks, begin_document, write_chunks, finish_document;
+from queue import Queue, Empty, Full;
+import hashlib;
+import itertools;
+import threading;
+import time;
 import psycopg2;
 import os;
 from pgvector.psycopg2 import register_vector;
 
+import metrics;
+from ratelimit import priority;
+
 from dotenv import load_dotenv;
 load_dotenv();
 
-def ingest(conn, pdf_path: str):
-    chunks = chunk_pdf(pdf_path);
-    embeddings = get_embeddings(chunks);
-    for i, (chunk, embedding) in enumerate(zip(chunks, embeddings)):
-        insert_chunk(conn, chunk, embedding, pdf_path, i);
+# Chunks handed to each get_embeddings call, i.e. one API request. Small
+# enough that the first batch leaves extraction after a few dozen pages, not
+# at the end of the document; the workers below supply the concurrency.
+EMBED_BATCH_SIZE = min(64, MAX_BATCH_SIZE);
+# Threads embedding batches at once; together they make up to this many
+# concurrent requests.
+EMBED_WORKERS = MAX_CONCURRENCY;
+# Batches allowed to wait between two stages before the producer blocks.
+QUEUE_SIZE = 4;
+
+_DONE = object();
+
+def file_hash(path: str) -> str:
+    digest = hashlib.sha256();
+    with open(path, 'rb') as file:
+        for block in iter(lambda: file.read(1 << 20), b''):
+            digest.update(block);
+    return digest.hexdigest();
+
+def page_hash(text: str) -> str:
+    return hashlib.sha256(text.encode('utf-8')).hexdigest();
+
+class ChunkPlanner:
+    # Decides, chunk by chunk, whether a stored row can be kept as is. A row
+    # is reused only if the new chunk has the same text and page range and
+    # none of those pages changed.
+    def __init__(self, existing, changed_pages):
+        self.existing = existing;
+        self.changed_pages = changed_pages;
+        self.reusable = {};
+        for chunk_id, content, _, start_page, end_page in existing:
+            if start_page is not None:
+                self.reusable.setdefault((content, start_page, end_page), []).append(chunk_id);
+        self.kept = [];
+
+    def keep(self, index, content, start_page, end_page, start_offset = None, end_offset = None) -> bool:
+        # Kept rows are (id, chunk_index, start_page, end_page), plus the new
+        # offsets when they are given, since earlier pages may have changed
+        # length.
+        ids = self.reusable.get((content, start_page, end_page));
+        if not ids or _touches(start_page, end_page, self.changed_pages):
+            return False;
+        offsets = () if start_offset is None else (start_offset, end_offset);
+        self.kept.append((ids.pop(), index, start_page, end_page) + offsets);
+        return True;
+
+    def delete_ids(self) -> list[int]:
+        kept_ids = {row[0] for row in self.kept};
+        return [row[0] for row in self.existing if row[0] not in kept_ids];
+
+def _touches(start_page, end_page, pages) -> bool:
+    if start_page is None:
+        return True;
+    return any(page in pages for page in range(start_page, end_page + 1));
+
+class StageStats:
+    def __init__(self, name: str, unit: str):
+        self.name = name;
+        self.unit = unit;
+        self.items = 0;
+        self.seconds = 0.0;
+        self._lock = threading.Lock();
+        self._span = None;
+
+    def add_span(self, items: int, started: float, ended: float):
+        # For a stage run by several threads: seconds is the wall time from
+        # the first batch's start to the last one's end.
+        with self._lock:
+            self.items += items;
+            first, last = self._span or (started, ended);
+            self._span = (min(first, started), max(last, ended));
+            self.seconds = self._span[1] - self._span[0];
+
+    def __str__(self):
+        rate = self.items / self.seconds if self.seconds else 0.0;
+        return f"{self.name}: {self.items} {self.unit} in {self.seconds:.2f}s ({rate:.1f} {self.unit}/s)";
+
+def _put(queue, item, stop):
+    # Blocks while the queue is full (backpressure) but gives up once another
+    # stage has failed.
+    while not stop.is_set():
+        try:
+            queue.put(item, timeout = 0.1);
+            return;
+        except Full:
+            pass;
+
+def _drain(queue, stop, producers: int = 1):
+    # Yields items until each of the producers has sent _DONE.
+    while not stop.is_set():
+        try:
+            item = queue.get(timeout = 0.1);
+        except Empty:
+            continue;
+        if item is _DONE:
+            producers -= 1;
+            if producers == 0:
+                return;
+            continue;
+        if isinstance(item, BaseException):
+            raise item;
+        yield item;
+
+def _in_order(numbered):
+    # Re-sequences (number, item) pairs that finish out of order, so rows are
+    # written in chunk order. Later batches wait here while an earlier one is
+    # still being embedded.
+    waiting = {};
+    expected = 0;
+    for number, item in numbered:
+        waiting[number] = item;
+        while expected in waiting:
+            yield waiting.pop(expected);
+            expected += 1;
+
+def _stage(target, outbox, stop):
+    # Runs target in a thread; an exception is forwarded downstream so the
+    # writer can roll back and ingest can re-raise it.
+    def run():
+        try:
+            target();
+        except BaseException as exc:
+            _put(outbox, exc, stop);
+    # The thread runs in a copy of this context so its calls join ingest's trace.
+    thread = threading.Thread(target = metrics.run_in_context(run), daemon = True);
+    thread.start();
+    return thread;
+
+@metrics.instrumented("ingest")
+def ingest(conn, pdf_path: str, cache = None, batch_size: int = EMBED_BATCH_SIZE, verbose: bool = True,
+           embed_workers: int = EMBED_WORKERS, read_pages = None):
+    # Returns counts for the document's chunks (None if the file is
+    # unchanged). verbose=False leaves the printing to the caller.
+    # read_pages(path) replaces chunker.iter_pages, e.g. to use a shared
+    # extraction pool.
+    started = time.perf_counter();
+    fingerprint = file_hash(pdf_path);
+    # The source's lock is taken before the registry is read, so a concurrent
+    # ingest of the same file plans against what the other one committed.
+    cursor = begin_document(conn, pdf_path);
+    try:
+        known = get_document(conn, pdf_path);
+        existing = get_source_chunks(conn, pdf_path);
+    except BaseException:
+        conn.rollback();
+        raise;
+    if known is not None and known[0] == fingerprint:
+        conn.rollback();
+        if verbose:
+            print(f"{pdf_path} is unchanged, skipping ingest");
+        return None;
+
+    old_hashes = known[1] if known is not None else {};
+    page_hashes = [];
+    changed_pages = set();
+    planner = ChunkPlanner(existing, changed_pages);
+
+    extract_stats = StageStats("extract", "chunks");
+    embed_stats = StageStats("embed", "chunks");
+    write_stats = StageStats("write", "rows");
+    stop = threading.Event();
+
+    def hashed_pages():
+        # Page hashes are recorded as pages stream past, so by the time a
+        # chunk comes out every page it covers has been compared.
+        for page in (read_pages or iter_pages)(pdf_path):
+            page_hashes.append(page_hash(page));
+            if old_hashes.get(len(page_hashes)) != page_hashes[-1]:
+                changed_pages.add(len(page_hashes));
+            yield page;
+
+    def extract():
+        batch = [];
+        tick = time.perf_counter();
+        for i, span in enumerate(iter_chunk_spans(hashed_pages())):
+            content = span.text();
+            if not content.strip():
+                # A document without text (e.g. scanned pages) still comes
+                # out as one blank chunk, which the embeddings API rejects.
+                continue;
+            extract_stats.items += 1;
+            if planner.keep(i, content, span.start_page, span.end_page, span.start, span.end):
+                continue;
+            batch.append((i, content, span.start_page, span.end_page, span.start, span.end));
+            if len(batch) >= batch_size:
+                extract_stats.seconds += time.perf_counter() - tick;
+                _put(chunks_queue, (next(sequence), batch), stop);
+                tick = time.perf_counter();
+                batch = [];
+        extract_stats.seconds += time.perf_counter() - tick;
+        if batch:
+            _put(chunks_queue, (next(sequence), batch), stop);
+        for _ in range(workers):
+            _put(chunks_queue, _DONE, stop);
+
+    def embed():
+        # Each worker takes the next batch as soon as its last one is
+        # embedded. Questions being answered meanwhile get API capacity first.
+        with priority("ingest"):
+            for number, batch in _drain(chunks_queue, stop):
+                tick = time.perf_counter();
+                embeddings = get_embeddings([chunk[1] for chunk in batch], cache = cache);
+                rows = [
+                    (content, embedding, pdf_path, i, start_page, end_page, start, end)
+                    for (i, content, start_page, end_page, start, end), embedding in zip(batch, embeddings)
+                ];
+                embed_stats.add_span(len(rows), tick, time.perf_counter());
+                _put(rows_queue, (number, rows), stop);
+        _put(rows_queue, _DONE, stop);
+
+    sequence = itertools.count();
+    workers = max(1, embed_workers);
+    chunks_queue = Queue(max(QUEUE_SIZE, workers));
+    rows_queue = Queue(max(QUEUE_SIZE, workers));
+    threads = [_stage(extract, chunks_queue, stop)] + [_stage(embed, rows_queue, stop) for _ in range(workers)];
+    try:
+        # The writer runs on the calling thread, which owns the connection.
+        for rows in _in_order(_drain(rows_queue, stop, producers = workers)):
+            tick = time.perf_counter();
+            write_chunks(cursor, rows);
+            write_stats.items += len(rows);
+            write_stats.seconds += time.perf_counter() - tick;
+        tick = time.perf_counter();
+        delete_ids = planner.delete_ids();
+        finish_document(cursor, pdf_path, fingerprint, page_hashes, planner.kept, delete_ids);
+        conn.commit();
+        write_stats.seconds += time.perf_counter() - tick;
+    except BaseException:
+        stop.set();
+        conn.rollback();
+        raise;
+    finally:
+        for thread in threads:
+            thread.join();
 
-    print(f"Ingested {len(chunks)} chunks from {pdf_path}")
\ No newline at end of file
+    # Embedding and writing are traced as they happen; extraction is
+    # interleaved with waits on the queue, so only its busy time is recorded.
+    metrics.record("extract", extract_stats.seconds, chunks_extracted = extract_stats.items);
+    elapsed = time.perf_counter() - started;
+    if verbose:
+        print(f"Ingested {write_stats.items} chunks from {pdf_path} ({len(planner.kept)} unchanged, {len(delete_ids)} removed) in {elapsed:.2f}s");
+        for stats in (extract_stats, embed_stats, write_stats):
+            print(f"  {stats}");
+    return {
+        "chunks": extract_stats.items,
+        "written": write_stats.items,
+        "kept": len(planner.kept),
+        "removed": len(delete_ids),
+        "seconds": elapsed,
+    };
@@ -0,0 +1,73 @@
+import math
+import re
+from collections import Counter, defaultdict
+
+# Keeps codes like "E-1042", "v2.3" or "part_no" together as one token.
+TOKEN = re.compile(r"[a-z0-9]+(?:[-_.][a-z0-9]+)*")
+
+def tokenize(text: str) -> list[str]:
+    return TOKEN.findall(text.lower())
+
+class BM25Index:
+    # Okapi BM25 over an in-memory inverted index, for backends without
+    # Postgres full-text search.
+
+    def __init__(self, k1: float = 1.2, b: float = 0.75):
+        self.k1 = k1
+        self.b = b
+        self.postings = defaultdict(dict)  # term -> {doc id: term frequency}
+        self.lengths = {}
+        self.terms = {}  # doc id -> its distinct terms, for removal
+        self.total_length = 0
+
+    def __len__(self):
+        return len(self.lengths)
+
+    def add(self, doc_id, text: str):
+        if doc_id in self.lengths:
+            self.remove(doc_id)
+        terms = Counter(tokenize(text))
+        for term, count in terms.items():
+            self.postings[term][doc_id] = count
+        length = sum(terms.values())
+        self.terms[doc_id] = list(terms)
+        self.lengths[doc_id] = length
+        self.total_length += length
+
+    def remove(self, doc_id):
+        length = self.lengths.pop(doc_id, None)
+        if length is None:
+            return
+        self.total_length -= length
+        for term in self.terms.pop(doc_id):
+            docs = self.postings[term]
+            del docs[doc_id]
+            if not docs:
+                del self.postings[term]
+
+    def search(self, query: str, top_k: int = 10) -> list[tuple]:
+        # Returns (doc id, score) pairs, best first.
+        if not self.lengths:
+            return []
+        n = len(self.lengths)
+        average = self.total_length / n
+        scores = defaultdict(float)
+        for term in set(tokenize(query)):
+            docs = self.postings.get(term)
+            if not docs:
+                continue
+            idf = math.log(1 + (n - len(docs) + 0.5) / (len(docs) + 0.5))
+            for doc_id, tf in docs.items():
+                norm = self.k1 * (1 - self.b + self.b * self.lengths[doc_id] / average)
+                scores[doc_id] += idf * tf * (self.k1 + 1) / (tf + norm)
+        return sorted(scores.items(), key=lambda item: item[1], reverse=True)[:top_k]
+
+def reciprocal_rank_fusion(rankings, k: int = 60) -> list:
+    # Fuses ranked lists of ids: each id scores sum(1 / (k + rank)) over the
+    # lists it appears in (rank starting at 1). Best first; ties keep the
+    # order ids were first seen in.
+    scores = {}
+    for ranking in rankings:
+        for rank, doc_id in enumerate(ranking, 1):
+            scores[doc_id] = scores.get(doc_id, 0.0) + 1.0 / (k + rank)
+    return sorted(scores, key=lambda doc_id: scores[doc_id], reverse=True)
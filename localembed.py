@@ -0,0 +1,70 @@
+import re
+import zlib
+from functools import lru_cache
+
+import numpy as np
+
+# Feature-hashing text encoder that runs on the CPU with no model download or
+# network access. Words, word pairs and character trigrams are hashed (with a
+# sign, so collisions cancel out on average) into a fixed number of buckets,
+# counts are damped to log(1 + count) and each row is scaled to unit length,
+# so cosine distance behaves like it does for API embeddings. Weights don't
+# depend on the corpus: vectors stored at ingest stay valid as it grows.
+MODEL = "local-hashing-v1"
+
+WORD_WEIGHT = 1.0
+PAIR_WEIGHT = 0.5
+TRIGRAM_WEIGHT = 0.25
+
+_WORD = re.compile(r"\w+")
+# Too common to say anything about a chunk on their own; still used in pairs.
+# Texts with no words all get the unit vector of this feature (an all-zero
+# vector has no cosine distance to anything).
+NO_WORDS = "<no words>"
+
+STOPWORDS = frozenset("""
+    a an and are as at be but by for from has have he her his i if in into is it
+    its of on or our she so that the their them then there these they this to
+    was we were what when which who will with you your
+""".split())
+
+@lru_cache(maxsize=65536)
+def _word_features(word: str) -> tuple:
+    # The word itself (unless it's a stopword) and its character trigrams,
+    # which match words sharing a stem ("embedding", "embeddings").
+    padded = f"<{word}>"
+    trigrams = [("#" + padded[i:i + 3], TRIGRAM_WEIGHT) for i in range(len(padded) - 2)]
+    return tuple(trigrams if word in STOPWORDS else [(word, WORD_WEIGHT), *trigrams])
+
+def _features(text: str) -> list:
+    # (feature, weight) pairs for one text.
+    words = _WORD.findall(text.lower())
+    features = [feature for word in words for feature in _word_features(word)]
+    features.extend((first + " " + second, PAIR_WEIGHT) for first, second in zip(words, words[1:]))
+    return features
+
+def encode(texts: list[str], dimensions: int) -> np.ndarray:
+    # Returns a (len(texts), dimensions) float32 matrix, one unit-length row
+    # per text. Each distinct feature in the batch is hashed once; counting
+    # and scaling are whole-matrix ops.
+    per_text = [_features(text) or [(NO_WORDS, WORD_WEIGHT)] for text in texts]
+    ids = {}
+    columns = [ids.setdefault(feature, len(ids)) for features in per_text for feature, _ in features]
+    matrix = np.zeros((len(texts), dimensions), dtype=np.float32)
+    if not texts:
+        return matrix
+
+    rows = np.repeat(np.arange(len(texts)), [len(features) for features in per_text])
+    weights = np.fromiter((weight for features in per_text for _, weight in features), dtype=np.float64, count=len(columns))
+    hashes = np.fromiter((zlib.crc32(feature.encode()) for feature in ids), dtype=np.int64, count=len(ids))
+    buckets = hashes % dimensions
+    signs = np.where((hashes // dimensions) & 1, -1.0, 1.0)
+    feature = np.asarray(columns, dtype=np.int64)
+    cells = rows * dimensions + buckets[feature]
+    counts = np.bincount(cells, weights=signs[feature] * weights, minlength=matrix.size)
+    matrix[:] = counts.reshape(matrix.shape)
+
+    np.copysign(np.log1p(np.abs(matrix)), matrix, out=matrix)
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    np.divide(matrix, norms, out=matrix, where=norms > 0)
+    return matrix
@@ -0,0 +1,266 @@
+import contextlib
+import contextvars
+import functools
+import inspect
+import itertools
+import os
+import threading
+import time
+from collections import deque
+
+# Off unless METRICS=true; see enable(). While off, instrumented functions
+# cost one flag check per call.
+METRICS_ENABLED = os.getenv("METRICS", "false").lower() == "true"
+# Finished traces kept in memory for to_json().
+TRACE_LIMIT = int(os.getenv("METRICS_TRACE_LIMIT", "100"))
+# Upper bounds (seconds) of the stage duration histogram buckets.
+BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+_enabled = METRICS_ENABLED
+_current = contextvars.ContextVar("askpdf_span", default=None)
+
+class Trace:
+    # One top-level call (an ask, an ingest) and every instrumented call made
+    # under it, including from threads started with run_in_context.
+    def __init__(self, name: str):
+        self.name = name
+        self.started_at = time.time()
+        self.started = time.perf_counter()
+        self.seconds = None
+        self.spans = []
+        self.counts = {}
+        self._lock = threading.Lock()
+
+    def add(self, span):
+        with self._lock:
+            self.spans.append(span)
+
+    def count(self, span, name: str, value):
+        with self._lock:
+            span.counts[name] = span.counts.get(name, 0) + value
+            self.counts[name] = self.counts.get(name, 0) + value
+
+    def to_dict(self) -> dict:
+        with self._lock:
+            spans = sorted(self.spans, key=lambda span: (span.started, span.parent is not None))
+            return {
+                "name": self.name,
+                "started_at": self.started_at,
+                "seconds": self.seconds,
+                "counts": dict(self.counts),
+                "spans": [span.to_dict(self.started) for span in spans],
+            }
+
+class Span:
+    __slots__ = ("stage", "trace", "parent", "started", "seconds", "counts")
+
+    def __init__(self, stage: str, trace: Trace, parent, started: float, seconds: float = None):
+        self.stage = stage
+        self.trace = trace
+        self.parent = parent
+        self.started = started
+        self.seconds = seconds
+        self.counts = {}
+
+    def to_dict(self, trace_started: float) -> dict:
+        return {
+            "stage": self.stage,
+            "parent": self.parent.stage if self.parent is not None else None,
+            "offset": self.started - trace_started,
+            "seconds": self.seconds,
+            **self.counts,
+        }
+
+class Registry:
+    # Process-wide aggregates: a duration histogram per stage, counters per
+    # (name, stage), and the most recent traces.
+    def __init__(self, trace_limit: int = TRACE_LIMIT):
+        self._lock = threading.Lock()
+        self.histograms = {}  # stage -> [bucket counts..., +Inf count], sum
+        self.counters = {}
+        self.traces = deque(maxlen=trace_limit)
+
+    def observe(self, stage: str, seconds: float):
+        with self._lock:
+            histogram = self.histograms.get(stage)
+            if histogram is None:
+                histogram = self.histograms[stage] = [[0] * (len(BUCKETS) + 1), 0.0]
+            buckets = histogram[0]
+            for i, bound in enumerate(BUCKETS):
+                if seconds <= bound:
+                    buckets[i] += 1
+                    break
+            else:
+                buckets[-1] += 1
+            histogram[1] += seconds
+
+    def add(self, name: str, stage: str, value):
+        with self._lock:
+            key = (name, stage)
+            self.counters[key] = self.counters.get(key, 0) + value
+
+    def finish(self, trace: Trace):
+        with self._lock:
+            self.traces.append(trace)
+
+    def reset(self):
+        with self._lock:
+            self.histograms.clear()
+            self.counters.clear()
+            self.traces.clear()
+
+    def to_json(self) -> dict:
+        with self._lock:
+            histograms = {
+                stage: {
+                    "count": sum(buckets),
+                    "sum": total,
+                    "buckets": dict(zip([*map(str, BUCKETS), "+Inf"], _cumulative(buckets))),
+                }
+                for stage, (buckets, total) in self.histograms.items()
+            }
+            counters = {}
+            for (name, stage), value in self.counters.items():
+                counters.setdefault(name, {})[stage] = value
+            traces = list(self.traces)
+        return {
+            "histograms": histograms,
+            "counters": counters,
+            "traces": [trace.to_dict() for trace in traces],
+        }
+
+    def to_prometheus(self) -> str:
+        with self._lock:
+            histograms = sorted(self.histograms.items())
+            counters = sorted(self.counters.items())
+        lines = [
+            "# HELP askpdf_stage_seconds Time spent in each instrumented stage.",
+            "# TYPE askpdf_stage_seconds histogram",
+        ]
+        for stage, (buckets, total) in histograms:
+            for bound, count in zip([*map(str, BUCKETS), "+Inf"], _cumulative(buckets)):
+                lines.append(f'askpdf_stage_seconds_bucket{{stage="{stage}",le="{bound}"}} {count}')
+            lines.append(f'askpdf_stage_seconds_sum{{stage="{stage}"}} {total}')
+            lines.append(f'askpdf_stage_seconds_count{{stage="{stage}"}} {sum(buckets)}')
+        for name, group in itertools.groupby(counters, key=lambda item: item[0][0]):
+            lines.append(f"# TYPE askpdf_{name}_total counter")
+            for (_, stage), value in group:
+                lines.append(f'askpdf_{name}_total{{stage="{stage}"}} {value}')
+        return "\n".join(lines) + "\n"
+
+def _cumulative(buckets):
+    total = 0
+    for count in buckets:
+        total += count
+        yield total
+
+REGISTRY = Registry()
+
+def enable(on: bool = True):
+    global _enabled
+    _enabled = on
+
+def enabled() -> bool:
+    return _enabled
+
+@contextlib.contextmanager
+def span(stage: str):
+    # Times the block as a stage of the current trace, or starts a trace if
+    # there is none. A stage nested in itself (a recursive call) is timed once.
+    if not _enabled:
+        yield None
+        return
+    parent = _current.get()
+    if parent is not None and parent.stage == stage:
+        yield parent
+        return
+    trace = parent.trace if parent is not None else Trace(stage)
+    current = Span(stage, trace, parent, time.perf_counter())
+    token = _current.set(current)
+    try:
+        yield current
+    finally:
+        current.seconds = time.perf_counter() - current.started
+        _current.reset(token)
+        trace.add(current)
+        REGISTRY.observe(stage, current.seconds)
+        if parent is None:
+            trace.seconds = current.seconds
+            REGISTRY.finish(trace)
+
+def instrumented(stage: str):
+    # Decorator form of span() for functions, coroutines and generators.
+    def decorate(func):
+        if inspect.iscoroutinefunction(func):
+            async def wrapper(*args, **kwargs):
+                if not _enabled:
+                    return await func(*args, **kwargs)
+                with span(stage):
+                    return await func(*args, **kwargs)
+        elif inspect.isgeneratorfunction(func):
+            def wrapper(*args, **kwargs):
+                if not _enabled:
+                    return (yield from func(*args, **kwargs))
+                with span(stage):
+                    return (yield from func(*args, **kwargs))
+        else:
+            def wrapper(*args, **kwargs):
+                if not _enabled:
+                    return func(*args, **kwargs)
+                with span(stage):
+                    return func(*args, **kwargs)
+        return functools.wraps(func)(wrapper)
+    return decorate
+
+def record(stage: str, seconds: float, **counts):
+    # Adds a stage that was timed elsewhere (e.g. summed over a loop) to the
+    # current trace.
+    if not _enabled:
+        return
+    parent = _current.get()
+    if parent is None:
+        return
+    started = max(parent.started, time.perf_counter() - seconds)
+    done = Span(stage, parent.trace, parent, started, seconds)
+    parent.trace.add(done)
+    REGISTRY.observe(stage, seconds)
+    for name, value in counts.items():
+        REGISTRY.add(name, stage, value)
+        parent.trace.count(done, name, value)
+
+def count(name: str, value=1):
+    # Adds value to counter name, labelled with the current stage.
+    if not _enabled:
+        return
+    current = _current.get()
+    REGISTRY.add(name, current.stage if current is not None else "", value)
+    if current is not None:
+        current.trace.count(current, name, value)
+
+def count_call(response):
+    # One API call and the tokens its usage block reports.
+    if not _enabled:
+        return
+    count("api_calls")
+    usage = getattr(response, "usage", None)
+    for field, name in (("prompt_tokens", "input_tokens"), ("completion_tokens", "output_tokens")):
+        value = getattr(usage, field, None)
+        if isinstance(value, int):
+            count(name, value)
+
+def run_in_context(func):
+    # Wraps func to run in a copy of the caller's context, so calls it makes
+    # on another thread join the caller's trace.
+    return functools.partial(contextvars.copy_context().run, func)
+
+def last_trace():
+    return REGISTRY.traces[-1].to_dict() if REGISTRY.traces else None
+
+def to_json() -> dict:
+    return REGISTRY.to_json()
+
+def to_prometheus() -> str:
+    return REGISTRY.to_prometheus()
+
+def reset():
+    REGISTRY.reset()
@@ -0,0 +1,504 @@
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+
+import numpy as np
+
+from lexical import BM25Index, reciprocal_rank_fusion
+
+# On-disk layout of a NumpyStore directory:
+#   vectors.f32   unit-length float32 embeddings, one row per chunk
+#   rows.bin      fixed-width chunk metadata, one record per vector row
+#   contents.txt  chunk texts, addressed by (offset, length) from rows.bin
+#   meta.json     dimensions and the rows.bin format
+#   registry.db   SQLite tables of source names, the document registry and
+#                 batch ingest checkpoints, one row per source, so a commit
+#                 or checkpoint writes only the record that changed
+# Every other file is only ever appended to or patched in place, so opening
+# a store maps the files without reading them.
+_ROW_FIELDS_V1 = [
+    ("offset", "<i8"),
+    ("length", "<i4"),
+    ("source", "<i4"),
+    ("chunk_index", "<i4"),
+    ("start_page", "<i4"),
+    ("end_page", "<i4"),
+    ("alive", "u1"),
+]
+ROW_DTYPE = np.dtype(_ROW_FIELDS_V1 + [
+    # Character range of the chunk in the document text.
+    ("start_offset", "<i8"),
+    ("end_offset", "<i8"),
+])
+ROW_FORMAT = 2
+NO_PAGE = -1
+NO_OFFSET = -1
+
+class NumpyStore:
+    # Drop-in stand-in for a Postgres connection; use it with the functions
+    # below, which mirror vectordb. Writes become visible on commit().
+
+    def __init__(self, path: str):
+        self.path = path
+        os.makedirs(path, exist_ok=True)
+        self._lock = threading.RLock()
+        self._pending = None
+        self._lexical = None  # BM25Index over alive rows, built on first use
+
+        self._version = None  # document_version, until the next commit
+
+        meta_path = self._file("meta.json")
+        if os.path.exists(meta_path):
+            with open(meta_path) as file:
+                self.meta = json.load(file)
+        else:
+            self.meta = {"dimensions": None, "row_format": ROW_FORMAT}
+        self._open_registry()
+        self.sources = [name for name, in self._db.execute("SELECT name FROM sources ORDER BY id")]
+        self._source_ids = {name: i for i, name in enumerate(self.sources)}
+
+        for name in ("vectors.f32", "rows.bin", "contents.txt"):
+            open(self._file(name), "ab").close()
+        self._migrate()
+        self._finish_resize()
+        self._recover()
+        self._map()
+
+    def _file(self, name: str) -> str:
+        return os.path.join(self.path, name)
+
+    def _open_registry(self):
+        self._db = sqlite3.connect(self._file("registry.db"), check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.executescript("""
+            CREATE TABLE IF NOT EXISTS sources (
+                id INTEGER PRIMARY KEY,
+                name TEXT NOT NULL UNIQUE
+            );
+            CREATE TABLE IF NOT EXISTS documents (
+                source TEXT PRIMARY KEY,
+                file_hash TEXT NOT NULL,
+                pages TEXT NOT NULL
+            );
+            CREATE TABLE IF NOT EXISTS checkpoints (
+                source TEXT PRIMARY KEY,
+                file_size INTEGER NOT NULL,
+                modified_at REAL NOT NULL,
+                status TEXT NOT NULL,
+                chunks INTEGER,
+                error TEXT
+            );
+        """)
+        # Stores written before registry.db kept all of this in meta.json.
+        # It is copied over first and only then dropped from meta.json, so
+        # an interrupted move is redone on the next open.
+        legacy = [key for key in ("sources", "documents", "checkpoints") if key in self.meta]
+        if legacy:
+            with self._db:
+                self._db.executemany(
+                    "INSERT OR REPLACE INTO sources (id, name) VALUES (?, ?)",
+                    enumerate(self.meta.get("sources", [])),
+                )
+                self._db.executemany(
+                    "INSERT OR REPLACE INTO documents VALUES (?, ?, ?)",
+                    [(source, entry["file_hash"], json.dumps(entry["pages"]))
+                     for source, entry in self.meta.get("documents", {}).items()],
+                )
+                self._db.executemany(
+                    "INSERT OR REPLACE INTO checkpoints VALUES (?, ?, ?, ?, ?, ?)",
+                    [(source, e["file_size"], e["modified_at"], e["status"], e["chunks"], e["error"])
+                     for source, e in self.meta.get("checkpoints", {}).items()],
+                )
+            for key in legacy:
+                del self.meta[key]
+            self._write_meta()
+
+    def _migrate(self):
+        # Stores written before offsets were tracked have narrower rows.bin
+        # records. They are widened into rows.bin.new, meta.json is switched
+        # to the new format, then the file is moved into place; a crash at
+        # any point is finished or redone on the next open.
+        if self.meta.get("row_format", 1) == ROW_FORMAT:
+            if os.path.exists(self._file("rows.bin.new")):
+                os.replace(self._file("rows.bin.new"), self._file("rows.bin"))
+            return
+        old_dtype = np.dtype(_ROW_FIELDS_V1)
+        count = os.path.getsize(self._file("rows.bin")) // old_dtype.itemsize
+        old = np.fromfile(self._file("rows.bin"), dtype=old_dtype, count=count)
+        rows = np.full(count, NO_OFFSET, dtype=ROW_DTYPE)
+        for name in old_dtype.names:
+            rows[name] = old[name]
+        rows.tofile(self._file("rows.bin.new"))
+        self.meta["row_format"] = ROW_FORMAT
+        self._write_meta()
+        os.replace(self._file("rows.bin.new"), self._file("rows.bin"))
+
+    def _finish_resize(self):
+        # resize() writes vectors.f32.new, then meta.json with the new width,
+        # then moves the file into place. The new file is only used if
+        # meta.json got written.
+        resized = self._file("vectors.f32.new")
+        if not os.path.exists(resized):
+            return
+        rows = os.path.getsize(self._file("rows.bin")) // ROW_DTYPE.itemsize
+        if os.path.getsize(resized) == rows * 4 * (self.meta["dimensions"] or 0):
+            os.replace(resized, self._file("vectors.f32"))
+        else:
+            os.remove(resized)
+
+    def resize(self, dimensions: int, block: int = 65536):
+        # Keeps the first dimensions values of every vector, rescaled to unit
+        # length (see vectordb.resize_embeddings).
+        with self._lock:
+            current = self.meta["dimensions"]
+            if current is None or dimensions == current:
+                return
+            if not 0 < dimensions < current:
+                raise ValueError(f"Can only shorten {current}-dimensional embeddings, got {dimensions}")
+            with open(self._file("vectors.f32.new"), "wb") as file:
+                for start in range(0, self.count, block):
+                    vectors = np.array(self.vectors[start:start + block, :dimensions])
+                    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+                    vectors /= np.where(norms == 0, 1, norms)
+                    file.write(vectors.tobytes())
+            self.meta["dimensions"] = dimensions
+            self._write_meta()
+            self.vectors = None
+            os.replace(self._file("vectors.f32.new"), self._file("vectors.f32"))
+            self._map()
+
+    def _write_meta(self):
+        tmp = self._file("meta.json.tmp")
+        with open(tmp, "w") as file:
+            json.dump(self.meta, file)
+        os.replace(tmp, self._file("meta.json"))
+
+    def _recover(self):
+        # A crash can leave trailing bytes from an append that never got its
+        # rows.bin record; cut every file back to the last whole row.
+        dims = self.meta["dimensions"]
+        rows = 0
+        if dims:
+            rows = min(
+                os.path.getsize(self._file("rows.bin")) // ROW_DTYPE.itemsize,
+                os.path.getsize(self._file("vectors.f32")) // (4 * dims),
+            )
+        os.truncate(self._file("vectors.f32"), rows * 4 * (dims or 0))
+        os.truncate(self._file("rows.bin"), rows * ROW_DTYPE.itemsize)
+
+    def _map(self):
+        count = os.path.getsize(self._file("rows.bin")) // ROW_DTYPE.itemsize
+        self.count = count
+        if count == 0:
+            self.rows = np.zeros(0, dtype=ROW_DTYPE)
+            self.vectors = np.zeros((0, self.meta["dimensions"] or 0), dtype=np.float32)
+            return
+        self.rows = np.memmap(self._file("rows.bin"), dtype=ROW_DTYPE, mode="r+", shape=(count,))
+        self.vectors = np.memmap(
+            self._file("vectors.f32"), dtype=np.float32, mode="r",
+            shape=(count, self.meta["dimensions"]),
+        )
+
+    def source_id(self, source: str) -> int:
+        # New names are saved right away, so no row on disk ever refers to
+        # a source id the registry doesn't have.
+        if source not in self._source_ids:
+            with self._db:
+                self._db.execute("INSERT INTO sources (id, name) VALUES (?, ?)", (len(self.sources), source))
+            self._source_ids[source] = len(self.sources)
+            self.sources.append(source)
+        return self._source_ids[source]
+
+    def append(self, rows) -> list[int]:
+        # Appends (content, embedding, source, chunk_index[, start_page,
+        # end_page[, start_offset, end_offset]]) rows as not-yet-visible
+        # records and returns their ids.
+        rows = list(rows)
+        if not rows:
+            return []
+        with self._lock:
+            vectors = np.asarray([row[1] for row in rows], dtype=np.float32)
+            if self.meta["dimensions"] is None:
+                self.meta["dimensions"] = vectors.shape[1]
+                self._write_meta()
+            elif vectors.shape[1] != self.meta["dimensions"]:
+                raise ValueError(
+                    f"Expected {self.meta['dimensions']}-dimensional embeddings, got {vectors.shape[1]}"
+                )
+            norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+            vectors /= np.where(norms == 0, 1, norms)
+
+            encoded = [row[0].encode("utf-8") for row in rows]
+            lengths = np.array([len(content) for content in encoded], dtype=np.int64)
+            records = np.zeros(len(rows), dtype=ROW_DTYPE)
+            records["offset"] = os.path.getsize(self._file("contents.txt")) + np.cumsum(lengths) - lengths
+            records["length"] = lengths
+            records["source"] = [self.source_id(row[2]) for row in rows]
+            records["chunk_index"] = [row[3] for row in rows]
+            records["start_page"] = [_stored_page(row[4] if len(row) > 4 else None) for row in rows]
+            records["end_page"] = [_stored_page(row[5] if len(row) > 5 else None) for row in rows]
+            records["start_offset"] = [row[6] if len(row) > 6 else NO_OFFSET for row in rows]
+            records["end_offset"] = [row[7] if len(row) > 7 else NO_OFFSET for row in rows]
+
+            with open(self._file("contents.txt"), "ab") as file:
+                file.write(b"".join(encoded))
+            with open(self._file("vectors.f32"), "ab") as file:
+                file.write(vectors.tobytes())
+            with open(self._file("rows.bin"), "ab") as file:
+                file.write(records.tobytes())
+
+            first = self.count
+            self._map()
+            return list(range(first, first + len(rows)))
+
+    def _snapshot(self):
+        # append() and resize() replace the mapped arrays (and count) as a
+        # group; readers that don't hold the lock take all three at once so
+        # they never mix an old map with a new count.
+        with self._lock:
+            return self.rows, self.vectors, self.count
+
+    def content(self, chunk_id: int) -> str:
+        return self._content(self._snapshot()[0][chunk_id])
+
+    def _content(self, record) -> str:
+        with open(self._file("contents.txt"), "rb") as file:
+            file.seek(int(record["offset"]))
+            return file.read(int(record["length"])).decode("utf-8")
+
+    def row(self, chunk_id: int) -> tuple:
+        record = self._snapshot()[0][chunk_id]
+        return (
+            chunk_id,
+            self._content(record),
+            self.sources[int(record["source"])],
+            int(record["chunk_index"]),
+        )
+
+    def search(self, query_embedding, top_k: int = 5, with_distance: bool = False) -> list[tuple]:
+        ids, scores = self._nearest(query_embedding, top_k)
+        if with_distance:
+            return [self.row(i) + (float(1 - score),) for i, score in zip(ids, scores)]
+        return [self.row(i) for i in ids]
+
+    def nearest(self, query_embedding, top_k: int = 5) -> list[int]:
+        return self._nearest(query_embedding, top_k)[0]
+
+    def _nearest(self, query_embedding, top_k):
+        # Ids of the top_k alive rows by cosine similarity, and their scores.
+        rows, vectors, count = self._snapshot()
+        if count == 0 or top_k <= 0:
+            return [], []
+        query = np.array(query_embedding, dtype=np.float32)
+        query /= np.linalg.norm(query) or 1
+        scores = vectors @ query
+        scores[rows["alive"] == 0] = -np.inf
+
+        k = min(top_k, count)
+        candidates = np.argpartition(-scores, k - 1)[:k]
+        best = candidates[np.argsort(-scores[candidates])]
+        best = [int(i) for i in best if scores[i] != -np.inf]
+        return best, [scores[i] for i in best]
+
+    def nearest_many(self, query_embeddings, top_k: int = 5) -> list[list[int]]:
+        return [ids for ids, _ in self._nearest_many(query_embeddings, top_k)]
+
+    def _nearest_many(self, query_embeddings, top_k):
+        # (ids, scores) per query; scores every query against every row in
+        # one matrix product.
+        rows, vectors, count = self._snapshot()
+        if count == 0 or top_k <= 0:
+            return [([], []) for _ in query_embeddings]
+        queries = np.array(query_embeddings, dtype=np.float32)
+        norms = np.linalg.norm(queries, axis=1, keepdims=True)
+        queries /= np.where(norms == 0, 1, norms)
+        scores = queries @ vectors.T
+        scores[:, rows["alive"] == 0] = -np.inf
+
+        k = min(top_k, count)
+        candidates = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+        results = []
+        for row_scores, row_candidates in zip(scores, candidates):
+            best = row_candidates[np.argsort(-row_scores[row_candidates])]
+            best = [int(i) for i in best if row_scores[i] != -np.inf]
+            results.append((best, [row_scores[i] for i in best]))
+        return results
+
+    def lexical(self) -> BM25Index:
+        with self._lock:
+            if self._lexical is None:
+                index = BM25Index()
+                for chunk_id in np.nonzero(self.rows["alive"] == 1)[0]:
+                    index.add(int(chunk_id), self.content(int(chunk_id)))
+                self._lexical = index
+            return self._lexical
+
+    def hybrid_search(self, query: str, query_embedding, top_k: int = 5,
+                      candidates: int = 50, rrf_k: int = 60, with_distance: bool = False) -> list[tuple]:
+        # with_distance adds the vector leg's cosine distance, or None for
+        # hits only the full-text leg found.
+        vector_ids, scores = self._nearest(query_embedding, candidates)
+        lexical_ids = [chunk_id for chunk_id, _ in self.lexical().search(query, candidates)]
+        fused = reciprocal_rank_fusion([vector_ids, lexical_ids], rrf_k)
+        if with_distance:
+            distances = {i: float(1 - score) for i, score in zip(vector_ids, scores)}
+            return [self.row(i) + (distances.get(i),) for i in fused[:top_k]]
+        return [self.row(i) for i in fused[:top_k]]
+
+    def cursor(self):
+        return self
+
+    def commit(self):
+        with self._lock:
+            pending, self._pending = self._pending, None
+            if pending is not None:
+                pending.apply()
+                if self._lexical is not None:
+                    for chunk_id in pending.delete_ids:
+                        self._lexical.remove(chunk_id)
+                    for chunk_id in pending.new_ids:
+                        self._lexical.add(chunk_id, self.content(chunk_id))
+            # Row flags go to disk before the registry entry, which is what
+            # marks the document as ingested.
+            if isinstance(self.rows, np.memmap):
+                self.rows.flush()
+            if pending is not None and pending.registry is not None:
+                file_hash, pages = pending.registry
+                with self._db:
+                    self._db.execute(
+                        "INSERT OR REPLACE INTO documents VALUES (?, ?, ?)",
+                        (pending.source, file_hash, json.dumps(pages)),
+                    )
+                self._version = None
+
+    def rollback(self):
+        # Rows appended by the abandoned transaction stay on disk but are
+        # never marked alive.
+        with self._lock:
+            self._pending = None
+
+    def close(self):
+        self.rows = self.vectors = None
+        self._db.close()
+
+class _Transaction:
+    # Collects a document swap until the store commits it.
+    def __init__(self, store: NumpyStore, source: str):
+        self.store = store
+        self.source = source
+        self.new_ids = []
+        self.kept_rows = []
+        self.delete_ids = []
+        self.registry = None
+
+    def apply(self):
+        rows = self.store.rows
+        rows["alive"][self.delete_ids] = 0
+        for chunk_id, chunk_index, start_page, end_page, *offsets in self.kept_rows:
+            rows["chunk_index"][chunk_id] = chunk_index
+            rows["start_page"][chunk_id] = _stored_page(start_page)
+            rows["end_page"][chunk_id] = _stored_page(end_page)
+            if offsets:
+                rows["start_offset"][chunk_id], rows["end_offset"][chunk_id] = offsets
+        rows["alive"][self.new_ids] = 1
+
+def insert_chunk(conn: NumpyStore, content, embedding, source, chunk_index):
+    return insert_chunks(conn, [(content, embedding, source, chunk_index)])[0]
+
+def insert_chunks(conn: NumpyStore, rows, method: str = None) -> list[int]:
+    with conn._lock:
+        ids = conn.append(rows)
+        conn._pending = _Transaction(conn, None)
+        conn._pending.new_ids = ids
+        conn.commit()
+    return ids
+
+def search_chunks(conn: NumpyStore, query_embedding, top_k: int = 5, with_distance: bool = False,
+                  **settings):
+    # Index settings (ef_search, probes, exact, quantization, prefix) don't
+    # apply: search is always exact.
+    return conn.search(query_embedding, top_k, with_distance)
+
+def search_chunks_many(conn: NumpyStore, query_embeddings, top_k: int = 5, with_distance: bool = False):
+    if len(query_embeddings) == 0:
+        return []
+    results = conn._nearest_many(query_embeddings, top_k)
+    if with_distance:
+        return [[conn.row(i) + (float(1 - score),) for i, score in zip(ids, scores)] for ids, scores in results]
+    return [[conn.row(i) for i in ids] for ids, _ in results]
+
+def hybrid_search_chunks(conn: NumpyStore, query: str, query_embedding, top_k: int = 5,
+                         candidates: int = 50, rrf_k: int = 60, with_distance: bool = False):
+    return conn.hybrid_search(query, query_embedding, top_k, candidates, rrf_k, with_distance)
+
+def resize_embeddings(conn: NumpyStore, dimensions: int):
+    conn.resize(dimensions)
+
+def get_document(conn: NumpyStore, source: str):
+    with conn._lock:
+        document = conn._db.execute(
+            "SELECT file_hash, pages FROM documents WHERE source = ?", (source,)
+        ).fetchone()
+    if document is None:
+        return None
+    return document[0], {n: h for n, h in enumerate(json.loads(document[1]), 1)}
+
+def document_version(conn: NumpyStore) -> str:
+    with conn._lock:
+        if conn._version is None:
+            documents = conn._db.execute("SELECT source, file_hash FROM documents ORDER BY source")
+            entries = ",".join(f"{source}:{file_hash}" for source, file_hash in documents)
+            conn._version = hashlib.md5(entries.encode("utf-8")).hexdigest()
+        return conn._version
+
+def get_checkpoints(conn: NumpyStore) -> dict:
+    with conn._lock:
+        rows = conn._db.execute("SELECT source, file_size, modified_at, status FROM checkpoints").fetchall()
+    return {source: (file_size, modified_at, status) for source, file_size, modified_at, status in rows}
+
+def save_checkpoint(conn: NumpyStore, source: str, file_size: int, modified_at: float, status: str,
+                    chunks: int = None, error: str = None):
+    with conn._lock, conn._db:
+        conn._db.execute(
+            "INSERT OR REPLACE INTO checkpoints VALUES (?, ?, ?, ?, ?, ?)",
+            (source, file_size, modified_at, status, chunks, error),
+        )
+
+def get_source_chunks(conn: NumpyStore, source: str):
+    source_id = conn._source_ids.get(source)
+    rows, _, count = conn._snapshot()
+    if source_id is None or count == 0:
+        return []
+    ids = np.nonzero((rows["source"] == source_id) & (rows["alive"] == 1))[0]
+    ids = ids[np.argsort(rows["chunk_index"][ids], kind="stable")]
+    return [
+        (
+            int(i), conn._content(rows[i]), int(rows[i]["chunk_index"]),
+            _page(rows[i]["start_page"]), _page(rows[i]["end_page"]),
+        )
+        for i in ids
+    ]
+
+def _page(value):
+    return None if value == NO_PAGE else int(value)
+
+def _stored_page(page):
+    return NO_PAGE if page is None else page
+
+def begin_document(conn: NumpyStore, source: str):
+    with conn._lock:
+        conn._pending = _Transaction(conn, source)
+        return conn._pending
+
+def write_chunks(cursor: _Transaction, rows, method: str = None) -> list[int]:
+    ids = cursor.store.append(rows)
+    cursor.new_ids.extend(ids)
+    return ids
+
+def finish_document(cursor: _Transaction, source: str, file_hash: str, page_hashes: list[str],
+                    kept_rows=(), delete_ids=()):
+    cursor.kept_rows = list(kept_rows)
+    cursor.delete_ids = list(delete_ids)
+    cursor.registry = (file_hash, list(page_hashes))
@@ -0,0 +1,75 @@
+import os
+
+from chunker import SENTENCE_BOUNDARY
+from embedder import estimate_tokens
+
+# Estimated prompt tokens for retrieved context. The best passage is sent
+# even if it is larger on its own.
+CONTEXT_TOKEN_BUDGET = int(os.getenv("CONTEXT_TOKEN_BUDGET", "2000"))
+# Cosine distance above which a hit is not worth sending; unset keeps all hits.
+CONTEXT_MAX_DISTANCE = float(os.getenv("CONTEXT_MAX_DISTANCE")) if os.getenv("CONTEXT_MAX_DISTANCE") else None
+
+def pack_context(hits, token_budget: int = CONTEXT_TOKEN_BUDGET,
+                 max_distance: float = CONTEXT_MAX_DISTANCE) -> list[str]:
+    # hits are search rows (id, content, source, chunk_index[, distance]),
+    # best first. Hits farther than max_distance are dropped (hybrid hits only
+    # the full-text leg found have no distance and are kept); consecutive
+    # chunks of a source are merged into one passage without the sentences
+    # their overlap repeats; passages are then taken in order of their best
+    # hit while they fit the budget.
+    if max_distance is not None:
+        hits = [hit for hit in hits if _distance(hit) is None or _distance(hit) <= max_distance]
+
+    by_source = {}  # source -> {chunk_index: (rank, content)}
+    for rank, hit in enumerate(hits):
+        by_source.setdefault(hit[2], {}).setdefault(hit[3], (rank, hit[1]))
+
+    passages = []  # (best rank, text)
+    for chunks in by_source.values():
+        run = None
+        previous = None
+        for index in sorted(chunks):
+            rank, content = chunks[index]
+            if run is not None and index == previous + 1:
+                run = (min(run[0], rank), merge_overlap(run[1], content))
+            else:
+                if run is not None:
+                    passages.append(run)
+                run = (rank, content)
+            previous = index
+        passages.append(run)
+    passages.sort(key=lambda passage: passage[0])
+
+    packed = []
+    used = 0
+    for _, text in passages:
+        tokens = estimate_tokens(text)
+        if packed and used + tokens > token_budget:
+            continue
+        packed.append(text)
+        used += tokens
+    return packed
+
+def merge_overlap(first: str, second: str) -> str:
+    # Joins two consecutive chunks, dropping the leading sentences of second
+    # that repeat the end of first.
+    if _ends_with_sentences(first, second):
+        return first
+    overlap = 0
+    for match in SENTENCE_BOUNDARY.finditer(second):
+        prefix = second[:match.start()]
+        if len(prefix) > len(first):
+            break
+        if _ends_with_sentences(first, prefix):
+            overlap = match.end()
+    return first + " " + second[overlap:]
+
+def _ends_with_sentences(text: str, tail: str) -> bool:
+    # True if text ends with tail and tail starts where a sentence does.
+    if not text.endswith(tail):
+        return False
+    head = text[:len(text) - len(tail)]
+    return head == "" or (head[-1].isspace() and head.rstrip()[-1:] in (".", "!", "?"))
+
+def _distance(hit):
+    return hit[4] if len(hit) > 4 else None
@@ -0,0 +1,330 @@
+import asyncio
+import contextlib
+import contextvars
+import heapq
+import itertools
+import os
+import random
+import re
+import threading
+import time
+
+import openai
+
+import metrics
+
+# Starting quotas per model until the API's rate-limit headers report the
+# real ones.
+OPENAI_RPM = int(os.getenv("OPENAI_RPM", "3000"))
+OPENAI_TPM = int(os.getenv("OPENAI_TPM", "1000000"))
+# Adaptive concurrency starts here and climbs by one per limit's worth of
+# successes, up to the maximum; a 429 halves it.
+OPENAI_INITIAL_CONCURRENCY = int(os.getenv("OPENAI_INITIAL_CONCURRENCY", "4"))
+OPENAI_MAX_CONCURRENCY = int(os.getenv("OPENAI_MAX_CONCURRENCY", "32"))
+OPENAI_MAX_RETRIES = int(os.getenv("OPENAI_MAX_RETRIES", "6"))
+
+# Lower runs first when requests wait for a slot.
+PRIORITIES = {"query": 0, "ingest": 1}
+
+_priority = contextvars.ContextVar("askpdf_priority", default="query")
+_active = contextvars.ContextVar("askpdf_scheduler", default=None)
+
+class TokenBucket:
+    # Refills at per_minute / 60 per second up to capacity. take() reserves
+    # right away and returns how long the caller must wait for the reservation
+    # to be covered, so callers are served in the order they asked.
+    def __init__(self, per_minute: float, capacity: float = None, clock=time.monotonic):
+        self.rate = per_minute / 60
+        self.capacity = per_minute if capacity is None else capacity
+        self.level = self.capacity
+        self._clock = clock
+        self._updated = clock()
+        self._lock = threading.Lock()
+
+    def _refill(self):
+        now = self._clock()
+        self.level = min(self.capacity, self.level + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def take(self, amount: float) -> float:
+        with self._lock:
+            self._refill()
+            self.level -= amount
+            return max(0.0, -self.level / self.rate) if self.rate else 0.0
+
+    def sync(self, limit: float = None, remaining: float = None):
+        # Adopts the quota and remaining allowance the server reported.
+        with self._lock:
+            self._refill()
+            if limit:
+                self.rate = limit / 60
+                self.capacity = limit
+            if remaining is not None:
+                self.level = min(self.level, remaining)
+
+class _Waiter:
+    __slots__ = ("event", "loop", "future", "granted", "cancelled")
+
+    def __init__(self, loop=None):
+        self.loop = loop
+        self.future = loop.create_future() if loop is not None else None
+        self.event = threading.Event() if loop is None else None
+        self.granted = False
+        self.cancelled = False
+
+    def wake(self):
+        self.granted = True
+        if self.event is not None:
+            self.event.set()
+        else:
+            self.loop.call_soon_threadsafe(_resolve, self.future)
+
+def _resolve(future):
+    if not future.done():
+        future.set_result(None)
+
+class AdaptiveSlots:
+    # Concurrency limit shared by threads and event loops. Freed slots go to
+    # the waiter with the lowest (priority, arrival).
+    def __init__(self, limit: int, ceiling: int):
+        self.limit = max(1, min(limit, ceiling))
+        self.ceiling = ceiling
+        self.active = 0
+        self._waiting = []
+        self._order = itertools.count()
+        self._lock = threading.Lock()
+
+    def _grant(self):
+        while self._waiting and self.active < self.limit:
+            waiter = heapq.heappop(self._waiting)[2]
+            if waiter.cancelled:
+                continue
+            self.active += 1
+            waiter.wake()
+
+    def _enqueue(self, priority: int, waiter: _Waiter) -> bool:
+        # True if the slot was taken without waiting.
+        with self._lock:
+            if self.active < self.limit and not self._waiting:
+                self.active += 1
+                return True
+            heapq.heappush(self._waiting, (priority, next(self._order), waiter))
+            return False
+
+    def acquire(self, priority: int = 0):
+        waiter = _Waiter()
+        if not self._enqueue(priority, waiter):
+            waiter.event.wait()
+
+    async def acquire_async(self, priority: int = 0):
+        waiter = _Waiter(asyncio.get_running_loop())
+        if self._enqueue(priority, waiter):
+            return
+        try:
+            await waiter.future
+        except asyncio.CancelledError:
+            with self._lock:
+                waiter.cancelled = True
+                if waiter.granted:
+                    self.active -= 1
+                    self._grant()
+            raise
+
+    def release(self):
+        with self._lock:
+            self.active -= 1
+            self._grant()
+
+    def resize(self, limit: int):
+        with self._lock:
+            self.limit = max(1, min(limit, self.ceiling))
+            self._grant()
+
+class Scheduler:
+    # Sends one model's API calls: each waits for a concurrency slot (by
+    # priority), then for request and token quota, and is retried with
+    # jittered exponential backoff on 429s, timeouts and 5xx responses.
+    def __init__(self, requests_per_minute: float = OPENAI_RPM, tokens_per_minute: float = OPENAI_TPM,
+                 initial_concurrency: int = OPENAI_INITIAL_CONCURRENCY,
+                 max_concurrency: int = OPENAI_MAX_CONCURRENCY, max_retries: int = OPENAI_MAX_RETRIES,
+                 base_delay: float = 0.5, max_delay: float = 30.0, clock=time.monotonic):
+        self.requests = TokenBucket(requests_per_minute, clock=clock)
+        self.tokens = TokenBucket(tokens_per_minute, clock=clock)
+        self.slots = AdaptiveSlots(initial_concurrency, max_concurrency)
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._successes = 0
+        self._backed_off_at = None
+        self.calls = 0
+        self.throttled = 0
+        self.retries = 0
+
+    def call(self, func, tokens: int = 0, priority: str = None):
+        # func() makes the request; its result is returned.
+        level = PRIORITIES[priority or _priority.get()]
+        for attempt in itertools.count():
+            self.slots.acquire(level)
+            try:
+                time.sleep(self._quota_wait(tokens))
+                token = _active.set(self)
+                try:
+                    result = func()
+                finally:
+                    _active.reset(token)
+            except Exception as exc:
+                delay = self._failed(exc, attempt)
+            else:
+                self._succeeded()
+                return result
+            finally:
+                self.slots.release()
+            time.sleep(delay)
+
+    async def call_async(self, func, tokens: int = 0, priority: str = None):
+        # call() for coroutines: func() returns the awaitable request.
+        level = PRIORITIES[priority or _priority.get()]
+        for attempt in itertools.count():
+            await self.slots.acquire_async(level)
+            try:
+                await asyncio.sleep(self._quota_wait(tokens))
+                token = _active.set(self)
+                try:
+                    result = await func()
+                finally:
+                    _active.reset(token)
+            except Exception as exc:
+                delay = self._failed(exc, attempt)
+            else:
+                self._succeeded()
+                return result
+            finally:
+                self.slots.release()
+            await asyncio.sleep(delay)
+
+    def _quota_wait(self, tokens: int) -> float:
+        return max(self.requests.take(1), self.tokens.take(tokens))
+
+    def _succeeded(self):
+        # Additive increase: one more slot per limit's worth of successes.
+        with self._lock:
+            self.calls += 1
+            self._successes += 1
+            if self._successes >= self.slots.limit:
+                self._successes = 0
+                self.slots.resize(self.slots.limit + 1)
+
+    def _failed(self, exc: Exception, attempt: int) -> float:
+        # Seconds to wait before retrying exc, or re-raises it.
+        if not _retryable(exc) or attempt >= self.max_retries:
+            raise exc
+        response = getattr(exc, "response", None)
+        headers = getattr(response, "headers", None) or {}
+        if headers:
+            self.observe_headers(headers)
+        with self._lock:
+            self.retries += 1
+            if isinstance(exc, openai.RateLimitError):
+                self.throttled += 1
+                self._back_off()
+        metrics.count("retries")
+        delay = random.uniform(0, min(self.max_delay, self.base_delay * 2 ** attempt))
+        return max(delay, _retry_after(headers))
+
+    def _back_off(self):
+        # Multiplicative decrease, once per burst of 429s from requests that
+        # were already in flight together.
+        now = self._clock()
+        if self._backed_off_at is not None and now - self._backed_off_at < self.base_delay:
+            return
+        self._backed_off_at = now
+        self._successes = 0
+        self.slots.resize(self.slots.limit // 2)
+
+    def observe_headers(self, headers):
+        # x-ratelimit-{limit,remaining}-{requests,tokens} as sent by the API.
+        for kind, bucket in (("requests", self.requests), ("tokens", self.tokens)):
+            limit = _number(headers.get(f"x-ratelimit-limit-{kind}"))
+            remaining = _number(headers.get(f"x-ratelimit-remaining-{kind}"))
+            if limit is not None or remaining is not None:
+                bucket.sync(limit, remaining)
+
+    def stats(self) -> dict:
+        return {
+            "calls": self.calls,
+            "retries": self.retries,
+            "throttled": self.throttled,
+            "concurrency": self.slots.limit,
+            "requests_per_minute": self.requests.rate * 60,
+            "tokens_per_minute": self.tokens.rate * 60,
+        }
+
+def _retryable(exc: Exception) -> bool:
+    if isinstance(exc, openai.RateLimitError):
+        # Out of credit rather than over the rate; waiting won't help.
+        return getattr(exc, "code", None) != "insufficient_quota"
+    return isinstance(exc, (openai.APIConnectionError, openai.InternalServerError))
+
+def _number(value):
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return None
+
+_DURATION_PART = re.compile(r"(\d+(?:\.\d+)?)(ms|h|m|s)")
+_DURATION_UNITS = {"h": 3600, "m": 60, "s": 1, "ms": 0.001}
+
+def parse_duration(value: str) -> float:
+    # "6m0s", "1.5s", "20ms" -> seconds (the x-ratelimit-reset-* format).
+    return sum(float(number) * _DURATION_UNITS[unit] for number, unit in _DURATION_PART.findall(value or ""))
+
+def _retry_after(headers) -> float:
+    milliseconds = _number(headers.get("retry-after-ms"))
+    if milliseconds is not None:
+        return milliseconds / 1000
+    seconds = _number(headers.get("retry-after"))
+    if seconds is not None:
+        return seconds
+    resets = [parse_duration(headers.get(f"x-ratelimit-reset-{kind}")) for kind in ("requests", "tokens")
+              if _number(headers.get(f"x-ratelimit-remaining-{kind}")) == 0]
+    return max(resets, default=0.0)
+
+_schedulers = {}
+_schedulers_lock = threading.Lock()
+
+def scheduler_for(model: str) -> Scheduler:
+    # One scheduler per model, shared by every caller in the process.
+    with _schedulers_lock:
+        if model not in _schedulers:
+            _schedulers[model] = Scheduler()
+        return _schedulers[model]
+
+@contextlib.contextmanager
+def priority(name: str):
+    # API calls made inside the block (and in threads started with
+    # metrics.run_in_context) wait for slots at this priority.
+    if name not in PRIORITIES:
+        raise ValueError(f"Unknown priority: {name}")
+    token = _priority.set(name)
+    try:
+        yield
+    finally:
+        _priority.reset(token)
+
+def _observe_response(response):
+    scheduler = _active.get()
+    if scheduler is not None:
+        scheduler.observe_headers(response.headers)
+
+async def _observe_response_async(response):
+    _observe_response(response)
+
+def http_client():
+    # HTTP client for openai that feeds every response's rate-limit headers
+    # to the scheduler that sent the request.
+    return openai.DefaultHttpxClient(event_hooks={"response": [_observe_response]})
+
+def async_http_client():
+    return openai.DefaultAsyncHttpxClient(event_hooks={"response": [_observe_response_async]})
@@ -1,7 +1,84 @@
-from embedder import get_embeddings;
-from vectordb import search_chunks;
+from embedder import get_embeddings, get_embeddings_async, EMBEDDING_MODEL, EMBEDDING_DIMENSIONS;
+from store import search_chunks, search_chunks_many, hybrid_search_chunks, search_chunks_async, hybrid_search_chunks_async;
+from packer import pack_context;
+import os;
 
-def retrieve(conn, query: str, top_k: int = 5):
-    embeddings = get_embeddings([query]);
-    chunk_tuples = search_chunks(conn, embeddings[0], top_k);
-    return [chunk_tuple[1] for chunk_tuple in chunk_tuples];
\ No newline at end of file
+# Fuse full-text matches with vector search (helps exact codes and names).
+HYBRID_SEARCH = os.getenv("HYBRID_SEARCH", "false").lower() == "true";
+
+def embed_query(query: str, query_cache = None) -> list[float]:
+    if query_cache is None:
+        return get_embeddings([query])[0];
+    embedding = query_cache.get(EMBEDDING_MODEL, EMBEDDING_DIMENSIONS, query);
+    if embedding is None:
+        embedding = get_embeddings([query])[0];
+        query_cache.put(EMBEDDING_MODEL, EMBEDDING_DIMENSIONS, query, embedding);
+    return embedding;
+
+def retrieve(conn, query: str, top_k: int = 5, hybrid: bool = None, query_embedding: list[float] = None,
+             query_cache = None, pack: bool = False):
+    # query_embedding skips the embedding call when the caller already has it.
+    # pack=True returns packer.pack_context passages instead of raw chunks.
+    hybrid = HYBRID_SEARCH if hybrid is None else hybrid;
+    if query_embedding is None:
+        query_embedding = embed_query(query, query_cache);
+    if hybrid:
+        chunk_tuples = hybrid_search_chunks(conn, query, query_embedding, top_k, with_distance = pack);
+    elif pack:
+        chunk_tuples = search_chunks(conn, query_embedding, top_k, with_distance = True);
+    else:
+        chunk_tuples = search_chunks(conn, query_embedding, top_k);
+    return _contents(chunk_tuples, pack);
+
+def _contents(chunk_tuples, pack: bool) -> list[str]:
+    if pack:
+        return pack_context(chunk_tuples);
+    return [chunk_tuple[1] for chunk_tuple in chunk_tuples];
+
+
+async def retrieve_async(conn, query: str, top_k: int = 5, hybrid: bool = None, query_cache = None,
+                         pack: bool = False):
+    # retrieve for an event loop: conn is an AsyncConnection from
+    # store.connect_async (or a NumpyStore).
+    hybrid = HYBRID_SEARCH if hybrid is None else hybrid;
+    query_embedding = None;
+    if query_cache is not None:
+        query_embedding = query_cache.get(EMBEDDING_MODEL, EMBEDDING_DIMENSIONS, query);
+    if query_embedding is None:
+        query_embedding = (await get_embeddings_async([query]))[0];
+        if query_cache is not None:
+            query_cache.put(EMBEDDING_MODEL, EMBEDDING_DIMENSIONS, query, query_embedding);
+    if hybrid:
+        chunk_tuples = await hybrid_search_chunks_async(conn, query, query_embedding, top_k, with_distance = pack);
+    elif pack:
+        chunk_tuples = await search_chunks_async(conn, query_embedding, top_k, with_distance = True);
+    else:
+        chunk_tuples = await search_chunks_async(conn, query_embedding, top_k);
+    return _contents(chunk_tuples, pack);
+
+def retrieve_many(conn, queries: list[str], top_k: int = 5, query_cache = None,
+                  pack: bool = False, hybrid: bool = None) -> list[list[str]]:
+    # Batched counterpart of retrieve: the queries are embedded in as few API
+    # calls as the batch limits allow and searched in a single statement.
+    # Hybrid search has no batched form, so it runs once per query.
+    hybrid = HYBRID_SEARCH if hybrid is None else hybrid;
+    if not queries:
+        return [];
+    embeddings = embed_queries(queries, query_cache);
+    if hybrid:
+        results = [hybrid_search_chunks(conn, query, embedding, top_k, with_distance = pack)
+                   for query, embedding in zip(queries, embeddings)];
+    else:
+        results = search_chunks_many(conn, embeddings, top_k, with_distance = pack);
+    return [_contents(chunk_tuples, pack) for chunk_tuples in results];
+
+def embed_queries(queries: list[str], query_cache = None) -> list[list[float]]:
+    if query_cache is None:
+        return get_embeddings(queries);
+    embeddings = [query_cache.get(EMBEDDING_MODEL, EMBEDDING_DIMENSIONS, query) for query in queries];
+    missing = [i for i, embedding in enumerate(embeddings) if embedding is None];
+    if missing:
+        for i, embedding in zip(missing, get_embeddings([queries[i] for i in missing])):
+            embeddings[i] = embedding;
+            query_cache.put(EMBEDDING_MODEL, EMBEDDING_DIMENSIONS, queries[i], embedding);
+    return embeddings;
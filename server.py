@@ -0,0 +1,142 @@
+import json
+import os
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from dotenv import load_dotenv
+
+import metrics
+from answercache import AnswerCache
+from embedcache import EmbeddingCache, QueryCache
+from ingest import ingest
+from main import ask
+from retriever import retrieve
+from store import ConnectionPool
+
+load_dotenv()
+
+SERVER_HOST = os.getenv("SERVER_HOST", "127.0.0.1")
+SERVER_PORT = int(os.getenv("SERVER_PORT", "8000"))
+# Requests handled at once (idle keep-alive connections don't count); also the
+# number of pooled database connections.
+SERVER_WORKERS = int(os.getenv("SERVER_WORKERS", "16"))
+
+class AskServer(ThreadingHTTPServer):
+    # Each client connection gets its own thread, which mostly waits on the
+    # socket; at most `workers` requests are handled at once. An idle
+    # keep-alive connection therefore holds a thread but not a worker slot.
+    # Embedding and chat calls go through the openai module's shared client,
+    # whose HTTP connections are kept alive across requests and threads.
+    daemon_threads = True
+    # Connections the kernel queues while every accept is in progress.
+    request_queue_size = 128
+
+    def __init__(self, address, pool: ConnectionPool, workers: int = SERVER_WORKERS,
+                 embedding_cache: EmbeddingCache = None):
+        super().__init__(address, RequestHandler)
+        self.pool = pool
+        self.embedding_cache = embedding_cache
+        self.query_cache = QueryCache(disk=embedding_cache)
+        self.answer_cache = AnswerCache(
+            threshold=float(os.getenv("ANSWER_CACHE_THRESHOLD", "0.95")),
+            ttl=float(os.getenv("ANSWER_CACHE_TTL", "3600")),
+        )
+        self.ingest_lock = threading.Lock()
+        self.slots = threading.BoundedSemaphore(workers)
+
+def _ask(server: AskServer, body: dict) -> dict:
+    with server.pool.connection() as conn:
+        answer = ask(conn, body["question"], server.answer_cache, server.query_cache)
+    return {"answer": answer}
+
+def _retrieve(server: AskServer, body: dict) -> dict:
+    with server.pool.connection() as conn:
+        chunks = retrieve(conn, body["query"], int(body.get("top_k", 5)), query_cache=server.query_cache)
+    return {"chunks": chunks}
+
+def _ingest(server: AskServer, body: dict) -> dict:
+    path = body["path"]
+    if not os.path.isfile(path):
+        raise FileNotFoundError(path)
+    with server.pool.connection() as conn:
+        if server.pool.shared:
+            with server.ingest_lock:
+                ingest(conn, path, cache=server.embedding_cache)
+        else:
+            ingest(conn, path, cache=server.embedding_cache)
+    return {"ingested": path}
+
+ROUTES = {"/ask": _ask, "/retrieve": _retrieve, "/ingest": _ingest}
+
+class RequestHandler(BaseHTTPRequestHandler):
+    # JSON in, JSON out. HTTP/1.1 keeps client connections open between
+    # requests; an idle one is closed after timeout seconds.
+    protocol_version = "HTTP/1.1"
+    timeout = 10
+
+    def do_POST(self):
+        route = ROUTES.get(self.path)
+        if route is None:
+            self._send(404, {"error": f"Unknown endpoint: {self.path}"})
+            return
+        try:
+            length = int(self.headers.get("Content-Length", 0))
+            body = json.loads(self.rfile.read(length) or b"{}")
+            if not isinstance(body, dict):
+                raise ValueError("Request body must be a JSON object")
+        except ValueError as exc:
+            self._send(400, {"error": str(exc)})
+            return
+        try:
+            with self.server.slots:
+                result = route(self.server, body)
+        except KeyError as exc:
+            self._send(400, {"error": f"Missing field: {exc.args[0]}"})
+        except FileNotFoundError as exc:
+            self._send(404, {"error": f"No such file: {exc.args[0]}"})
+        except Exception as exc:
+            self._send(500, {"error": str(exc)})
+        else:
+            self._send(200, result)
+
+    def do_GET(self):
+        # Aggregate metrics: Prometheus text at /metrics, JSON (with recent
+        # traces) at /metrics.json. Empty unless METRICS=true.
+        if self.path == "/metrics":
+            self._send(200, metrics.to_prometheus(), "text/plain; version=0.0.4")
+        elif self.path == "/metrics.json":
+            self._send(200, metrics.to_json())
+        else:
+            self._send(404, {"error": f"Unknown endpoint: {self.path}"})
+
+    def _send(self, status: int, payload, content_type: str = "application/json"):
+        if isinstance(payload, str):
+            data = payload.encode("utf-8")
+        else:
+            data = json.dumps(payload).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, format, *args):
+        # Per-request access logs would dominate the output under load.
+        pass
+
+def serve(host: str = SERVER_HOST, port: int = SERVER_PORT, workers: int = SERVER_WORKERS):
+    pool = ConnectionPool(workers)
+    cache = EmbeddingCache(os.getenv("EMBEDDING_CACHE_PATH", ".askpdf_cache.db"))
+    server = AskServer((host, port), pool, workers, embedding_cache=cache)
+    print(f"Serving on http://{host}:{server.server_port} with {workers} workers")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        cache.close()
+        pool.close()
+
+if __name__ == "__main__":
+    serve()
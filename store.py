@@ -0,0 +1,169 @@
+import os
+from contextlib import contextmanager
+
+import psycopg
+import psycopg2
+from psycopg2.pool import ThreadedConnectionPool
+from pgvector.psycopg import register_vector_async
+from pgvector.psycopg2 import register_vector
+from dotenv import load_dotenv
+
+import metrics
+import npstore
+import vectordb
+
+load_dotenv()
+
+# "postgres" (default) or "numpy" for the memory-mapped local store.
+VECTOR_BACKEND = os.getenv("VECTOR_BACKEND", "postgres")
+NUMPY_STORE_PATH = os.getenv("NUMPY_STORE_PATH", ".askpdf_store")
+
+def connect(backend: str = None):
+    backend = backend or VECTOR_BACKEND
+    if backend == "numpy":
+        return npstore.NumpyStore(NUMPY_STORE_PATH)
+    if backend == "postgres":
+        conn = psycopg2.connect(os.getenv("DATABASE_URL"))
+        vectordb.create_schema(conn)
+        register_vector(conn)
+        return conn
+    raise ValueError(f"Unknown vector backend: {backend}")
+
+async def connect_async(backend: str = None):
+    # psycopg 3 AsyncConnection for the async query path. It runs one query
+    # at a time, so give each concurrent task group its own connection. The
+    # numpy store is returned as is; its searches are in-process.
+    backend = backend or VECTOR_BACKEND
+    if backend == "numpy":
+        return npstore.NumpyStore(NUMPY_STORE_PATH)
+    if backend == "postgres":
+        conn = await psycopg.AsyncConnection.connect(os.getenv("DATABASE_URL"), autocommit=True)
+        await register_vector_async(conn)
+        return conn
+    raise ValueError(f"Unknown vector backend: {backend}")
+
+class _VectorConnectionPool(ThreadedConnectionPool):
+    def _connect(self, key=None):
+        conn = super()._connect(key)
+        register_vector(conn)
+        return conn
+
+class ConnectionPool:
+    # Thread-safe pool for servers. Postgres connections get register_vector
+    # once, when opened; the numpy store is shared, as it does its own locking.
+    # psycopg2 closes connections returned above minconn, so all size
+    # connections are kept open.
+
+    def __init__(self, size: int, backend: str = None):
+        backend = backend or VECTOR_BACKEND
+        if backend == "numpy":
+            self._store = npstore.NumpyStore(NUMPY_STORE_PATH)
+            self._pool = None
+            # One store with a single pending transaction: callers must not
+            # ingest through it concurrently.
+            self.shared = True
+        elif backend == "postgres":
+            self._store = None
+            self.shared = False
+            self._pool = _VectorConnectionPool(size, size, os.getenv("DATABASE_URL"))
+            conn = self._pool.getconn()
+            try:
+                vectordb.create_schema(conn)
+            finally:
+                self._pool.putconn(conn)
+        else:
+            raise ValueError(f"Unknown vector backend: {backend}")
+
+    @contextmanager
+    def connection(self):
+        if self._pool is None:
+            yield self._store
+            return
+        conn = self._pool.getconn()
+        try:
+            yield conn
+        finally:
+            # An open transaction is rolled back by the pool.
+            self._pool.putconn(conn)
+
+    def close(self):
+        if self._pool is None:
+            self._store.close()
+        else:
+            self._pool.closeall()
+
+def backend_for(conn):
+    # The connection (or the transaction handle from begin_document) decides
+    # which module's functions run.
+    if isinstance(conn, (npstore.NumpyStore, npstore._Transaction)):
+        return npstore
+    return vectordb
+
+@metrics.instrumented("write")
+def insert_chunk(conn, content, embedding, source, chunk_index):
+    chunk_id = backend_for(conn).insert_chunk(conn, content, embedding, source, chunk_index)
+    metrics.count("rows_written")
+    return chunk_id
+
+@metrics.instrumented("write")
+def insert_chunks(conn, rows, method: str = "copy") -> list[int]:
+    ids = backend_for(conn).insert_chunks(conn, rows, method)
+    metrics.count("rows_written", len(ids))
+    return ids
+
+@metrics.instrumented("search")
+def search_chunks(conn, query_embedding: list[float], top_k: int = 5, **settings):
+    return backend_for(conn).search_chunks(conn, query_embedding, top_k, **settings)
+
+@metrics.instrumented("search")
+async def search_chunks_async(conn, query_embedding: list[float], top_k: int = 5, **settings):
+    if backend_for(conn) is npstore:
+        return npstore.search_chunks(conn, query_embedding, top_k, **settings)
+    return await vectordb.search_chunks_async(conn, query_embedding, top_k, **settings)
+
+@metrics.instrumented("search")
+def search_chunks_many(conn, query_embeddings: list[list[float]], top_k: int = 5, with_distance: bool = False):
+    return backend_for(conn).search_chunks_many(conn, query_embeddings, top_k, with_distance)
+
+@metrics.instrumented("search")
+def hybrid_search_chunks(conn, query: str, query_embedding: list[float], top_k: int = 5, **options):
+    return backend_for(conn).hybrid_search_chunks(conn, query, query_embedding, top_k, **options)
+
+@metrics.instrumented("search")
+async def hybrid_search_chunks_async(conn, query: str, query_embedding: list[float], top_k: int = 5,
+                                     **options):
+    if backend_for(conn) is npstore:
+        return npstore.hybrid_search_chunks(conn, query, query_embedding, top_k, **options)
+    return await vectordb.hybrid_search_chunks_async(conn, query, query_embedding, top_k, **options)
+
+def resize_embeddings(conn, dimensions: int):
+    return backend_for(conn).resize_embeddings(conn, dimensions)
+
+def get_document(conn, source: str):
+    return backend_for(conn).get_document(conn, source)
+
+def document_version(conn) -> str:
+    return backend_for(conn).document_version(conn)
+
+def get_checkpoints(conn) -> dict:
+    return backend_for(conn).get_checkpoints(conn)
+
+def save_checkpoint(conn, source: str, file_size: int, modified_at: float, status: str,
+                    chunks: int = None, error: str = None):
+    return backend_for(conn).save_checkpoint(conn, source, file_size, modified_at, status, chunks, error)
+
+def get_source_chunks(conn, source: str):
+    return backend_for(conn).get_source_chunks(conn, source)
+
+def begin_document(conn, source: str):
+    return backend_for(conn).begin_document(conn, source)
+
+@metrics.instrumented("write")
+def write_chunks(cursor, rows, method: str = "copy") -> list[int]:
+    ids = backend_for(cursor).write_chunks(cursor, rows, method)
+    metrics.count("rows_written", len(ids))
+    return ids
+
+def finish_document(cursor, source: str, file_hash: str, page_hashes: list[str],
+                    kept_rows=(), delete_ids=()):
+    return backend_for(cursor).finish_document(cursor, source, file_hash, page_hashes, kept_rows, delete_ids)
@@ -0,0 +1,2 @@
+# Builds small text PDFs on disk so tests can exercise real pypdf parsing.
+from benchmark import make_pdf
@@ -0,0 +1,63 @@
+import pytest
+from unittest.mock import patch
+from answercache import AnswerCache
+
+
+class TestAnswerCache:
+    def test_miss_on_empty_cache(self):
+        cache = AnswerCache()
+
+        assert cache.get([1.0, 0.0], "v1") is None
+
+    def test_similar_question_hits(self):
+        cache = AnswerCache(threshold=0.9)
+        cache.put([1.0, 0.0], "v1", "answer")
+
+        assert cache.get([0.99, 0.05], "v1") == "answer"
+
+    def test_dissimilar_question_misses(self):
+        cache = AnswerCache(threshold=0.9)
+        cache.put([1.0, 0.0], "v1", "answer")
+
+        assert cache.get([0.5, 0.5], "v1") is None
+
+    def test_returns_most_similar_answer(self):
+        cache = AnswerCache(threshold=0.5)
+        cache.put([1.0, 0.0], "v1", "east")
+        cache.put([0.0, 1.0], "v1", "north")
+
+        assert cache.get([0.2, 1.0], "v1") == "north"
+
+    def test_new_document_version_invalidates(self):
+        cache = AnswerCache()
+        cache.put([1.0, 0.0], "v1", "answer")
+
+        assert cache.get([1.0, 0.0], "v2") is None
+        assert len(cache) == 0
+
+    def test_entries_expire_after_ttl(self):
+        cache = AnswerCache(ttl=10)
+        with patch('answercache.time.monotonic', return_value=100.0):
+            cache.put([1.0, 0.0], "v1", "answer")
+        with patch('answercache.time.monotonic', return_value=105.0):
+            assert cache.get([1.0, 0.0], "v1") == "answer"
+        with patch('answercache.time.monotonic', return_value=111.0):
+            assert cache.get([1.0, 0.0], "v1") is None
+
+    def test_evicts_least_recently_used(self):
+        cache = AnswerCache(max_entries=2)
+        with patch('answercache.time.monotonic', side_effect=[1.0, 2.0, 3.0, 3.0, 4.0]):
+            cache.put([1.0, 0.0, 0.0], "v1", "a")
+            cache.put([0.0, 1.0, 0.0], "v1", "b")
+            cache.get([1.0, 0.0, 0.0], "v1")  # a is now more recent than b
+            cache.put([0.0, 0.0, 1.0], "v1", "c")
+
+        assert cache.answers == ["a", "c"]
+
+    def test_stats_reports_hit_ratio(self):
+        cache = AnswerCache()
+        cache.put([1.0, 0.0], "v1", "answer")
+        cache.get([1.0, 0.0], "v1")
+        cache.get([0.0, 1.0], "v1")
+
+        assert cache.stats() == {"hits": 1, "misses": 1, "hit_ratio": 0.5, "entries": 1}
@@ -0,0 +1,151 @@
+import os
+import pytest
+from unittest.mock import patch
+import npstore
+from npstore import NumpyStore
+from batchingest import batch_ingest, find_pdfs
+from chunker import iter_pages
+from tests.pdf_fixtures import make_pdf
+
+
+def fake_embeddings(texts, cache=None):
+    return [[1.0, float(len(text))] for text in texts]
+
+
+class FakePool:
+    # ConnectionPool over one numpy store.
+    shared = True
+
+    def __init__(self, store):
+        self.store = store
+
+    def connection(self):
+        from contextlib import nullcontext
+        return nullcontext(self.store)
+
+
+@pytest.fixture
+def corpus(tmp_path):
+    docs = tmp_path / "docs"
+    (docs / "nested").mkdir(parents=True)
+    make_pdf(docs / "a.pdf", ["All about dogs."])
+    make_pdf(docs / "nested" / "b.PDF", ["All about cats.", "More about cats."])
+    (docs / "notes.txt").write_text("not a pdf")
+    return docs
+
+
+def run(store, patterns, lines=None, **kwargs):
+    lines = [] if lines is None else lines
+    with patch('ingest.get_embeddings', side_effect=fake_embeddings):
+        return batch_ingest(FakePool(store), [str(p) for p in patterns], workers=2, out=lines.append, **kwargs)
+
+
+def alive_sources(store):
+    alive = store.rows["alive"] == 1
+    return sorted(store.sources[i] for i in store.rows["source"][alive])
+
+
+class TestFindPdfs:
+    def test_directories_globs_and_files(self, corpus):
+        in_directory = find_pdfs([str(corpus)])
+        by_glob = find_pdfs([str(corpus / "**" / "*.pdf")])
+        named = find_pdfs([str(corpus / "a.pdf"), str(corpus / "a.pdf")])
+
+        assert in_directory == [str(corpus / "a.pdf"), str(corpus / "nested" / "b.PDF")]
+        assert by_glob == [str(corpus / "a.pdf")]
+        assert named == [str(corpus / "a.pdf")]
+
+
+class TestBatchIngest:
+    def test_ingests_every_file_and_checkpoints_it(self, corpus, tmp_path):
+        store = NumpyStore(str(tmp_path / "store"))
+        lines = []
+
+        progress = run(store, [corpus], lines)
+
+        assert progress.files == 2 and not progress.failed
+        assert set(npstore.get_checkpoints(store)) == {str(corpus / "a.pdf"), str(corpus / "nested" / "b.PDF")}
+        assert {status for _, _, status in npstore.get_checkpoints(store).values()} == {"done"}
+        assert "files/s" in lines[-1]
+
+    def test_rerun_skips_checkpointed_files(self, corpus, tmp_path):
+        store = NumpyStore(str(tmp_path / "store"))
+        run(store, [corpus])
+        rows = store.count
+
+        with patch('batchingest.ingest') as mock_ingest:
+            progress = run(store, [corpus])
+
+        mock_ingest.assert_not_called()
+        assert progress.total == 0
+        assert store.count == rows
+
+    def test_resumes_after_interruption_without_duplicates(self, corpus, tmp_path):
+        store = NumpyStore(str(tmp_path / "store"))
+        first = str(corpus / "a.pdf")
+        # A run that stopped after committing a.pdf but before its checkpoint.
+        with patch('ingest.get_embeddings', side_effect=fake_embeddings):
+            from ingest import ingest
+            ingest(store, first, verbose=False)
+
+        progress = run(store, [corpus])
+
+        assert progress.unchanged == 1
+        assert alive_sources(store) == [first, str(corpus / "nested" / "b.PDF")]
+
+    def test_changed_file_is_ingested_again(self, corpus, tmp_path):
+        store = NumpyStore(str(tmp_path / "store"))
+        run(store, [corpus])
+        make_pdf(corpus / "a.pdf", ["All about wolves, at length."])
+        os.utime(corpus / "a.pdf", (1, 1))
+
+        progress = run(store, [corpus])
+
+        assert progress.total == 1
+        assert alive_sources(store).count(str(corpus / "a.pdf")) == 1
+
+    def test_corrupt_and_empty_files_are_reported_not_raised(self, corpus, tmp_path):
+        store = NumpyStore(str(tmp_path / "store"))
+        (corpus / "broken.pdf").write_bytes(b"%PDF-1.4 this is not a pdf")
+        make_pdf(corpus / "blank.pdf", [""])
+        lines = []
+
+        progress = run(store, [corpus], lines)
+
+        assert [path for path, _ in progress.failed] == [str(corpus / "broken.pdf")]
+        assert progress.empty == [str(corpus / "blank.pdf")]
+        assert any("skipped" in line and "broken.pdf" in line for line in lines)
+        assert npstore.get_checkpoints(store)[str(corpus / "blank.pdf")][2] == "empty"
+        assert len(set(alive_sources(store))) == 2
+
+    def test_failed_files_are_retried_only_when_asked(self, corpus, tmp_path):
+        store = NumpyStore(str(tmp_path / "store"))
+        (corpus / "broken.pdf").write_bytes(b"not a pdf")
+        run(store, [corpus])
+
+        assert run(store, [corpus]).total == 0
+        assert run(store, [corpus], retry_failed=True).total == 1
+
+    def test_missing_file_is_reported(self, tmp_path):
+        store = NumpyStore(str(tmp_path / "store"))
+
+        progress = run(store, [tmp_path / "missing.pdf"])
+
+        assert progress.failed == [(str(tmp_path / "missing.pdf"), "file not found")]
+
+    @patch('batchingest.EXTRACT_WORKERS', 4)
+    def test_files_share_one_extraction_pool(self, corpus, tmp_path):
+        store = NumpyStore(str(tmp_path / "store"))
+        seen = []
+
+        def read_pages(path, workers=None, pool=None):
+            seen.append((workers, pool))
+            return iter_pages(path)
+
+        with patch('batchingest.extraction_pool') as mock_pool, \
+                patch('batchingest.iter_pages', side_effect=read_pages):
+            run(store, [corpus])
+
+        mock_pool.assert_called_once_with()
+        mock_pool.return_value.shutdown.assert_called_once()
+        assert seen == [(2, mock_pool.return_value)] * 2
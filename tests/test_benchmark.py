@@ -0,0 +1,141 @@
+import json
+import pytest
+import benchmark
+import npstore
+from benchmark import (
+    bench_ask, bench_chunking, bench_ingest, bench_search, compare_results, fake_embedding,
+    fake_models, percentiles, synthetic_text
+)
+
+
+@pytest.fixture
+def store(tmp_path):
+    return npstore.NumpyStore(str(tmp_path / "store"))
+
+
+class TestSyntheticData:
+    def test_text_is_deterministic_and_sized(self):
+        text = synthetic_text(300, seed=3)
+
+        assert text == synthetic_text(300, seed=3)
+        assert text != synthetic_text(300, seed=4)
+        assert len(text.split()) == 300
+        assert text[-1] in ".!?"
+
+    def test_fake_embedding_is_a_stable_unit_vector(self):
+        vector = fake_embedding("hello", 8)
+
+        assert vector == fake_embedding("hello", 8)
+        assert sum(x * x for x in vector) == pytest.approx(1.0)
+
+
+class TestFakeModels:
+    def test_replaces_embedding_and_chat_calls(self):
+        from embedder import get_embeddings
+        from generator import generate_answer
+
+        with fake_models(embed_latency=0, chat_latency=0):
+            embeddings = get_embeddings(["a", "b"])
+            answer = generate_answer(["some context here"], "question?")
+
+        assert embeddings[0] == fake_embedding("a")
+        assert "some context here" in answer
+
+    def test_restores_the_real_clients(self):
+        import openai
+        create = openai.embeddings.create
+
+        with fake_models(embed_latency=0, chat_latency=0):
+            assert isinstance(openai.embeddings.create, benchmark.FakeEmbeddings)
+            assert isinstance(openai.chat.completions.create, benchmark.FakeChat)
+
+        assert openai.embeddings.create == create
+        assert not isinstance(openai.chat.completions.create, benchmark.FakeChat)
+
+
+class TestBenchmarks:
+    def test_chunking_reports_throughput(self):
+        results = bench_chunking([2000], repeat=1)
+
+        assert results[0]["words"] == 2000
+        assert results[0]["chunks"] > 0
+        assert results[0]["chunks_per_sec"] > 0
+
+    def test_ingest_writes_synthetic_pdf(self, store, tmp_path):
+        with fake_models(embed_latency=0, chat_latency=0):
+            results = bench_ingest(store, [3], workdir=str(tmp_path))
+
+        assert results[0]["pages"] == 3
+        assert results[0]["chunks"] == store.count > 0
+        assert results[0]["mb_per_min"] > 0
+
+    def test_search_grows_store_to_each_size(self, store):
+        results = bench_search(store, [50, 200], queries=5, dimensions=8, batch=64)
+
+        assert [r["rows"] for r in results] == [50, 200]
+        assert store.count == 200
+        assert results[0]["p50_ms"] <= results[0]["p99_ms"]
+
+    def test_ask_runs_end_to_end(self, store):
+        with fake_models(embed_latency=0, chat_latency=0):
+            bench_search(store, [20], queries=0)
+            result = bench_ask(store, questions=3)
+
+        assert result["questions"] == 3
+        assert result["p50_ms"] > 0
+
+
+class TestPercentiles:
+    def test_percentiles_of_samples(self):
+        result = percentiles([float(i) for i in range(1, 101)])
+
+        assert result["p50_ms"] == pytest.approx(50.5)
+        assert result["p99_ms"] == pytest.approx(99.01)
+
+    def test_single_sample(self):
+        assert percentiles([3.0]) == {"p50_ms": 3.0, "p95_ms": 3.0, "p99_ms": 3.0}
+
+
+class TestCompareResults:
+    def test_reports_metrics_worse_than_tolerance(self):
+        baseline = {"results": {
+            "chunking": [{"words": 100, "chunks_per_sec": 1000.0}],
+            "search": [{"rows": 10, "index": None, "p50_ms": 1.0, "p99_ms": 2.0}],
+        }}
+        current = {"results": {
+            "chunking": [{"words": 100, "chunks_per_sec": 850.0}],
+            "search": [{"rows": 10, "index": None, "p50_ms": 1.05, "p99_ms": 3.0}],
+        }}
+
+        regressions = compare_results(current, baseline, tolerance=0.1)
+
+        assert [(r["benchmark"], r["metric"]) for r in regressions] == [
+            ("chunking", "chunks_per_sec"), ("search", "p99_ms"),
+        ]
+        assert regressions[0]["case"] == {"words": 100}
+
+    def test_improvements_and_unmatched_runs_pass(self):
+        baseline = {"results": {"ask": {"questions": 5, "p50_ms": 10.0},
+                                "chunking": [{"words": 100, "chunks_per_sec": 1000.0}]}}
+        current = {"results": {"ask": {"questions": 5, "p50_ms": 5.0},
+                               "chunking": [{"words": 999, "chunks_per_sec": 1.0}]}}
+
+        assert compare_results(current, baseline) == []
+
+
+class TestMain:
+    def test_writes_results_and_fails_on_regression(self, tmp_path, capsys):
+        output = tmp_path / "results.json"
+        baseline = tmp_path / "baseline.json"
+        baseline.write_text(json.dumps({"results": {
+            "chunking": [{"words": 500, "chunks_per_sec": 1e12}],
+        }}))
+
+        code = benchmark.main([
+            "--only", "chunking", "--words", "500",
+            "--output", str(output), "--baseline", str(baseline),
+        ])
+
+        assert code == 1
+        assert json.loads(output.read_text())["results"]["chunking"][0]["words"] == 500
+        assert "REGRESSION chunking" in capsys.readouterr().out
@@ -1,6 +1,41 @@
 import pytest
 from unittest.mock import Mock, patch, mock_open
-from chunker import chunk_text, chunk_pdf, chunk_by_sentences
+from chunker import (
+    chunk_text, chunk_pdf, chunk_by_sentences, chunk_pages, extract_pages, iter_pages,
+    stream_pdf, chunk_spans, iter_chunk_spans, materialize, SENTENCE_BOUNDARY
+)
+from tests.pdf_fixtures import make_pdf
+
+
+def reference_chunks(pages, max_chunk_size, overlap):
+    # The original algorithm: split the joined pages into sentences, pack them
+    # greedily and attribute each chunk to the pages of its first and last
+    # characters (an empty sentence to the page of the one before it).
+    from bisect import bisect_right
+    text = "".join(pages)
+    page_ends = [sum(len(page) for page in pages[:i + 1]) for i in range(len(pages))]
+
+    def page(offset):
+        return min(bisect_right(page_ends, offset), len(pages) - 1) + 1 if pages else None
+
+    sentences, start = [], 0
+    for match in list(SENTENCE_BOUNDARY.finditer(text)) + [None]:
+        end = len(text) if match is None else match.start()
+        first = start if end > start else max(start - 1, 0)
+        sentences.append((text[start:end], page(first), page(max(end - 1, first))))
+        start = None if match is None else match.end()
+
+    chunks, window, size = [], [], 0
+    for sentence, start_page, end_page in sentences:
+        words = len(sentence.split())
+        if size + words > max_chunk_size and window:
+            chunks.append((" ".join(s[0] for s in window), window[0][1], window[-1][2]))
+            window = window[-overlap:] if overlap > 0 else []
+            size = sum(len(s[0].split()) for s in window)
+        window.append((sentence, start_page, end_page))
+        size += words
+    chunks.append((" ".join(s[0] for s in window), window[0][1], window[-1][2]))
+    return chunks
 
 
 class TestChunkText:
@@ -161,3 +196,248 @@ class TestChunkBySentences:
         
         # Should create chunks with overlap
         assert len(result) >= 2
+
+
+class TestExtractPages:
+    @patch('chunker.PdfReader')
+    @patch('builtins.open', mock_open())
+    def test_returns_text_per_page(self, mock_reader):
+        mock_page1 = Mock()
+        mock_page1.extract_text.return_value = "first"
+        mock_page2 = Mock()
+        mock_page2.extract_text.return_value = "second"
+        mock_reader.return_value.pages = [mock_page1, mock_page2]
+
+        assert extract_pages("test.pdf") == ["first", "second"]
+
+
+class TestChunkPages:
+    def test_matches_chunk_by_sentences_on_joined_text(self):
+        pages = ["One two. Three four. ", "Five six. Seven", " eight. Nine ten."]
+        expected = chunk_by_sentences("".join(pages), max_chunk_size=4, overlap=1)
+
+        result = chunk_pages(pages, max_chunk_size=4, overlap=1)
+
+        assert [chunk for chunk, _, _ in result] == expected
+
+    def test_records_page_range_of_each_chunk(self):
+        pages = ["One two. Three four. ", "Five six. Seven eight."]
+
+        result = chunk_pages(pages, max_chunk_size=4, overlap=0)
+
+        assert result == [
+            ("One two. Three four.", 1, 1),
+            ("Five six. Seven eight.", 2, 2),
+        ]
+
+    def test_chunk_crossing_page_boundary_spans_both_pages(self):
+        pages = ["Start of a sentence ", "that ends here."]
+
+        result = chunk_pages(pages, max_chunk_size=100, overlap=0)
+
+        assert result == [("Start of a sentence that ends here.", 1, 2)]
+
+    def test_skips_empty_pages(self):
+        pages = ["First page. ", "", "Third page."]
+
+        result = chunk_pages(pages, max_chunk_size=2, overlap=0)
+
+        assert [(start, end) for _, start, end in result] == [(1, 1), (3, 3)]
+
+    def test_no_pages_gives_single_empty_chunk(self):
+        assert chunk_pages([]) == [("", None, None)]
+
+
+class TestChunkSpans:
+    def test_spans_materialize_to_the_same_chunks(self):
+        text = "One two.  Three four!\nFive six? Seven eight. Nine ten."
+
+        spans = chunk_spans(text, max_chunk_size=4, overlap=1)
+
+        assert [materialize(text, start, end) for start, end in spans] == (
+            chunk_by_sentences(text, max_chunk_size=4, overlap=1)
+        )
+        assert spans[0] == (0, text.index("four!") + 5)
+
+    def test_offsets_are_into_the_joined_pages(self):
+        pages = ["One two. Three four. ", "Five six. Seven eight."]
+
+        spans = list(iter_chunk_spans(pages, max_chunk_size=4, overlap=0))
+
+        text = "".join(pages)
+        assert [(s.start, s.end, s.start_page, s.end_page) for s in spans] == [
+            (0, 20, 1, 1),
+            (21, len(text), 2, 2),
+        ]
+        assert text[spans[1].start:spans[1].end] == "Five six. Seven eight."
+
+    def test_matches_sentence_pipeline_on_random_pages(self):
+        import random
+        rng = random.Random(7)
+        pieces = ["a", "bc", " ", "  ", "\n", ".", "!", "?", "x.", " .", ". ", "\u00a0",
+                  "\t", "\u3000", "\u2029", "\u00e9", "\u2019", ".\u3000"]
+        for _ in range(2000):
+            pages = ["".join(rng.choice(pieces) for _ in range(rng.randint(0, 20)))
+                     for _ in range(rng.randint(0, 4))]
+            size, overlap = rng.randint(1, 6), rng.randint(0, 3)
+
+            expected = reference_chunks(pages, size, overlap)
+
+            assert chunk_pages(pages, size, overlap) == expected
+
+    def test_only_the_current_window_is_held(self):
+        pages = [f"Sentence number {i} on its page. " for i in range(1000)]
+
+        spans = list(iter_chunk_spans(pages, max_chunk_size=12, overlap=1))
+
+        assert len(spans) > 100
+        assert max(len(span._source) for span in spans) < 200
+
+
+class TestStreamingPipeline:
+    def test_sentences_split_across_pages_match_joined_text(self):
+        pages = ["One. Two", " halves. Three.", "  Four!", "Five?"]
+        expected = "".join(pages)
+
+        sentences = [chunk for chunk, _, _ in chunk_pages(pages, max_chunk_size=1, overlap=0)]
+
+        import re
+        assert sentences == re.split(r'(?<=[.!?])\s+', expected)
+
+    def test_whitespace_at_page_end_is_not_split_early(self):
+        pages = ["First.  ", "  Second."]
+
+        sentences = [chunk for chunk, _, _ in chunk_pages(pages, max_chunk_size=1, overlap=0)]
+
+        assert sentences == ["First.", "Second."]
+
+    def test_first_chunk_is_yielded_before_last_page_is_read(self):
+        pages_read = []
+
+        def pages():
+            for i in range(100):
+                pages_read.append(i)
+                yield f"Sentence number {i} is here. "
+
+        spans = iter_chunk_spans(pages(), max_chunk_size=10, overlap=0)
+        first = next(spans).text()
+
+        assert first.startswith("Sentence number 0")
+        assert len(pages_read) < 5
+
+    def test_only_overlap_window_is_carried(self):
+        pages = [f"s{i} w w. " for i in range(10)]
+
+        chunks = chunk_pages(pages, max_chunk_size=6, overlap=1)
+
+        assert chunks[0][0] == "s0 w w. s1 w w."
+        assert chunks[1][0] == "s1 w w. s2 w w."
+
+    @patch('chunker.PdfReader')
+    @patch('builtins.open', mock_open())
+    def test_stream_pdf_reads_pages_lazily(self, mock_reader):
+        accessed = []
+
+        def make_page(i):
+            page = Mock()
+            page.extract_text.side_effect = lambda: accessed.append(i) or f"Page {i} text. "
+            return page
+
+        mock_reader.return_value.pages = [make_page(i) for i in range(50)]
+
+        stream = stream_pdf("big.pdf", max_chunk_size=3, overlap=0)
+        chunk, start_page, end_page = next(stream)
+
+        assert chunk == "Page 0 text."
+        assert (start_page, end_page) == (1, 1)
+        assert len(accessed) < 50
+
+
+class TestParallelExtraction:
+    def _pdf(self, tmp_path, page_count):
+        pages = [
+            f"Page {i} starts here. It has a few sentences!\nDoes it end? Yes, on page {i}."
+            for i in range(page_count)
+        ]
+        return make_pdf(tmp_path / "doc.pdf", pages)
+
+    @patch('chunker.PARALLEL_MIN_PAGES', 64)
+    def test_parallel_output_matches_serial(self, tmp_path):
+        path = self._pdf(tmp_path, 80)
+
+        serial = extract_pages(path, workers=1)
+        parallel = extract_pages(path, workers=3)
+
+        assert len(serial) == 80
+        assert parallel == serial
+
+    @patch('chunker.PARALLEL_MIN_PAGES', 64)
+    def test_parallel_chunks_match_serial(self, tmp_path):
+        path = self._pdf(tmp_path, 70)
+
+        serial = list(stream_pdf(path, max_chunk_size=40, workers=1))
+        parallel = list(stream_pdf(path, max_chunk_size=40, workers=2))
+
+        assert parallel == serial
+
+    @patch('chunker.ProcessPoolExecutor')
+    def test_small_files_fall_back_to_serial(self, mock_executor, tmp_path):
+        path = self._pdf(tmp_path, 3)
+
+        pages = extract_pages(path, workers=8)
+
+        assert len(pages) == 3
+        mock_executor.assert_not_called()
+
+    @patch('chunker.PARALLEL_MIN_PAGES', 64)
+    def test_workers_are_spawned_with_bounded_ranges_in_flight(self, tmp_path):
+        from concurrent.futures import Future
+        from chunker import RANGES_IN_FLIGHT
+        path = self._pdf(tmp_path, 200)
+        submitted, executors = [], []
+
+        class FakeExecutor:
+            def __init__(self, max_workers, mp_context):
+                self.start_method = mp_context.get_start_method()
+            def __enter__(self):
+                executors.append(self)
+                return self
+            def __exit__(self, *exc):
+                return False
+            def submit(self, fn, task):
+                submitted.append(task)
+                future = Future()
+                future.set_result(fn(task))
+                return future
+
+        with patch('chunker.ProcessPoolExecutor', FakeExecutor):
+            pages = iter_pages(path, workers=2)
+            first = next(pages)
+            in_flight = len(submitted)
+            rest = list(pages)
+
+        assert executors[0].start_method == "spawn"
+        assert in_flight == 2 * RANGES_IN_FLIGHT + 1
+        assert [first] + rest == extract_pages(path, workers=1)
+
+    def test_shared_pool_takes_small_files_too(self, tmp_path):
+        from chunker import extraction_pool
+        path = self._pdf(tmp_path, 20)
+
+        with extraction_pool(2) as pool, patch.object(pool, 'submit', wraps=pool.submit) as submit, \
+                patch('chunker.extraction_pool') as mock_pool:
+            pages = list(iter_pages(path, workers=1, pool=pool))
+
+        assert pages == extract_pages(path, workers=1)
+        assert submit.called
+        mock_pool.assert_not_called()
+
+    def test_page_ranges_cover_every_page_in_order(self):
+        from chunker import _page_ranges
+
+        ranges = _page_ranges("doc.pdf", 1000, workers=4)
+
+        assert ranges[0][1] == 0
+        assert ranges[-1][2] == 1000
+        assert all(a[2] == b[1] for a, b in zip(ranges, ranges[1:]))
+        assert len(ranges) == 16
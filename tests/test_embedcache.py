@@ -0,0 +1,171 @@
+import pytest
+from unittest.mock import Mock, patch
+from embedcache import EmbeddingCache, QueryCache, normalize_query
+
+
+@pytest.fixture
+def cache(tmp_path):
+    cache = EmbeddingCache(str(tmp_path / "cache.db"), max_entries=100)
+    yield cache
+    cache.close()
+
+
+class TestEmbeddingCache:
+    def test_miss_returns_none(self, cache):
+        result = cache.get_many("model", 3, ["unknown"])
+
+        assert result == [None]
+        assert cache.misses == 1
+        assert cache.hits == 0
+
+    def test_round_trips_vectors_as_float32(self, cache):
+        cache.put_many("model", 3, ["hello"], [[0.5, 0.25, -1.0]])
+
+        result = cache.get_many("model", 3, ["hello"])
+
+        assert result == [[0.5, 0.25, -1.0]]
+        assert cache.hits == 1
+
+    def test_bulk_lookup_preserves_order(self, cache):
+        cache.put_many("model", 1, ["a", "b", "c"], [[1.0], [2.0], [3.0]])
+
+        result = cache.get_many("model", 1, ["c", "x", "a"])
+
+        assert result == [[3.0], None, [1.0]]
+
+    def test_key_includes_model_and_dimensions(self, cache):
+        cache.put_many("model-a", 1, ["text"], [[1.0]])
+
+        assert cache.get_many("model-b", 1, ["text"]) == [None]
+        assert cache.get_many("model-a", 2, ["text"]) == [None]
+        assert cache.get_many("model-a", 1, ["text"]) == [[1.0]]
+
+    def test_repeated_texts_count_as_hits(self, cache):
+        cache.get_many("model", 1, ["header", "body", "header", "header"])
+
+        # Two distinct misses; the repeated header only needs embedding once
+        assert cache.misses == 2
+        assert cache.hits == 2
+
+    def test_evicts_least_recently_used(self, tmp_path):
+        cache = EmbeddingCache(str(tmp_path / "small.db"), max_entries=2)
+        with patch('embedcache.time.time', side_effect=[1.0, 2.0, 3.0, 4.0]):
+            cache.put_many("m", 1, ["a"], [[1.0]])
+            cache.put_many("m", 1, ["b"], [[2.0]])
+            cache.get_many("m", 1, ["a"])  # "a" is now more recent than "b"
+            cache.put_many("m", 1, ["c"], [[3.0]])
+
+        assert len(cache) == 2
+        assert cache.get_many("m", 1, ["a", "b", "c"]) == [[1.0], None, [3.0]]
+        cache.close()
+
+    def test_persists_across_instances(self, tmp_path):
+        path = str(tmp_path / "persist.db")
+        first = EmbeddingCache(path)
+        first.put_many("m", 2, ["kept"], [[1.0, 2.0]])
+        first.close()
+
+        second = EmbeddingCache(path)
+        assert second.get_many("m", 2, ["kept"]) == [[1.0, 2.0]]
+        second.close()
+
+    def test_stats_reports_hit_ratio(self, cache):
+        cache.put_many("m", 1, ["a"], [[1.0]])
+        cache.get_many("m", 1, ["a", "a", "b", "a"])
+
+        stats = cache.stats()
+
+        assert stats["hits"] == 3
+        assert stats["misses"] == 1
+        assert stats["hit_ratio"] == 0.75
+        assert stats["entries"] == 1
+
+
+class TestCachedGetEmbeddings:
+    @patch('embedder.openai.embeddings.create')
+    def test_only_misses_go_to_the_api(self, mock_create, cache):
+        from embedder import get_embeddings, EMBEDDING_MODEL, EMBEDDING_DIMENSIONS
+        cache.put_many(EMBEDDING_MODEL, EMBEDDING_DIMENSIONS, ["cached"], [[1.0]])
+        mock_create.return_value = Mock(data=[Mock(embedding=[2.0])])
+
+        result = get_embeddings(["cached", "new"], cache=cache)
+
+        assert result == [[1.0], [2.0]]
+        mock_create.assert_called_once_with(model=EMBEDDING_MODEL, input=["new"])
+
+    @patch('embedder.openai.embeddings.create')
+    def test_duplicate_chunks_are_embedded_once(self, mock_create, cache):
+        mock_create.return_value = Mock(
+            data=[Mock(embedding=[1.0]), Mock(embedding=[2.0])]
+        )
+
+        from embedder import get_embeddings
+        result = get_embeddings(["footer", "page", "footer"], cache=cache)
+
+        assert result == [[1.0], [2.0], [1.0]]
+        assert mock_create.call_args[1]["input"] == ["footer", "page"]
+
+    @patch('embedder.openai.embeddings.create')
+    def test_second_run_is_served_from_cache(self, mock_create, cache):
+        mock_create.return_value = Mock(data=[Mock(embedding=[0.5])])
+
+        from embedder import get_embeddings
+        get_embeddings(["chunk"], cache=cache)
+        result = get_embeddings(["chunk"], cache=cache)
+
+        assert result == [[0.5]]
+        assert mock_create.call_count == 1
+
+
+class TestQueryCache:
+    def test_miss_then_hit(self):
+        cache = QueryCache()
+        assert cache.get("model", 2, "What is AI?") is None
+        cache.put("model", 2, "What is AI?", [1.0, 0.0])
+
+        assert cache.get("model", 2, "What is AI?") == [1.0, 0.0]
+
+    def test_normalizes_case_and_whitespace(self):
+        cache = QueryCache()
+        cache.put("model", 2, "What is  AI?", [1.0, 0.0])
+
+        assert cache.get("model", 2, "  what is\tai? ") == [1.0, 0.0]
+        assert normalize_query("Ｗhat  IS\nai") == "what is ai"
+
+    def test_key_includes_model_and_dimensions(self):
+        cache = QueryCache()
+        cache.put("model", 2, "query", [1.0, 0.0])
+
+        assert cache.get("other", 2, "query") is None
+        assert cache.get("model", 3, "query") is None
+
+    def test_evicts_least_recently_used(self):
+        cache = QueryCache(max_entries=2)
+        cache.put("model", 1, "a", [1.0])
+        cache.put("model", 1, "b", [2.0])
+        cache.get("model", 1, "a")
+        cache.put("model", 1, "c", [3.0])
+
+        assert cache.get("model", 1, "b") is None
+        assert cache.get("model", 1, "a") == [1.0]
+
+    def test_disk_tier_survives_restart(self, cache):
+        QueryCache(disk=cache).put("model", 2, "Query", [0.5, 0.25])
+        restarted = QueryCache(disk=cache)
+
+        assert restarted.get("model", 2, "query") == [0.5, 0.25]
+        assert restarted.stats()["disk_hits"] == 1
+
+    def test_disk_entries_do_not_collide_with_chunk_texts(self, cache):
+        QueryCache(disk=cache).put("model", 1, "Query", [0.5])
+
+        assert cache.get_many("model", 1, ["query"]) == [None]
+
+    def test_stats_reports_hit_ratio(self):
+        cache = QueryCache()
+        cache.put("model", 1, "a", [1.0])
+        cache.get("model", 1, "a")
+        cache.get("model", 1, "b")
+
+        stats = cache.stats()
+        assert (stats["hits"], stats["misses"], stats["hit_ratio"]) == (1, 1, 0.5)
@@ -1,4 +1,6 @@
 import pytest
+import threading
+import time
 from unittest.mock import Mock, patch
 
 
@@ -56,6 +58,22 @@ class TestGetEmbeddings:
             input=["test"]
         )
 
+    @patch('embedder.EMBEDDING_DIMENSIONS', 256)
+    @patch('embedder.openai.embeddings.create')
+    def test_requests_configured_dimensions(self, mock_create):
+        mock_embedding = Mock()
+        mock_embedding.embedding = [0.0] * 256
+        mock_create.return_value = Mock(data=[mock_embedding])
+
+        from embedder import get_embeddings
+        get_embeddings(["test"])
+
+        mock_create.assert_called_once_with(
+            model="text-embedding-3-small",
+            input=["test"],
+            dimensions=256,
+        )
+
     @patch('embedder.openai.embeddings.create')
     def test_empty_list_returns_empty_result(self, mock_create):
         mock_response = Mock()
@@ -66,3 +84,241 @@ class TestGetEmbeddings:
         result = get_embeddings([])
         
         assert result == []
+
+
+class TestLocalProvider:
+    @patch('embedder.EMBEDDING_PROVIDER', 'local')
+    @patch('embedder.EMBEDDING_DIMENSIONS', 64)
+    @patch('embedder.openai.embeddings.create')
+    def test_encodes_without_the_api(self, mock_create):
+        from embedder import get_embeddings
+        cache = Mock()
+        result = get_embeddings(["first text", "second text"], cache=cache)
+
+        assert len(result) == 2
+        assert all(len(vector) == 64 for vector in result)
+        mock_create.assert_not_called()
+        cache.get_many.assert_not_called()
+
+    @patch('embedder.EMBEDDING_PROVIDER', 'local')
+    @patch('embedder.EMBEDDING_DIMENSIONS', 64)
+    def test_async_matches_sync(self):
+        import asyncio
+        from embedder import get_embeddings, get_embeddings_async
+
+        result = asyncio.run(get_embeddings_async(["some text"]))
+
+        assert list(result[0]) == list(get_embeddings(["some text"])[0])
+
+    @patch('embedder.EMBEDDING_PROVIDER', 'unknown')
+    def test_unknown_provider(self):
+        from embedder import get_embeddings
+        with pytest.raises(ValueError):
+            get_embeddings(["text"])
+
+
+class TestProviderRegistry:
+    @patch.dict('embedder._PROVIDERS')
+    @patch('embedder.EMBEDDING_PROVIDER', 'custom')
+    def test_registered_provider_serves_both_paths(self):
+        import asyncio
+        from embedder import get_embeddings, get_embeddings_async, register_provider
+
+        class Custom:
+            cached = True
+
+            def embed(self, texts, max_batch_size, max_batch_tokens, max_concurrency):
+                return [[float(len(text))] for text in texts]
+
+            async def embed_async(self, texts, max_batch_size, max_batch_tokens, max_concurrency):
+                return self.embed(texts, max_batch_size, max_batch_tokens, max_concurrency)
+
+        register_provider("custom", Custom())
+
+        assert get_embeddings(["ab", "abc"]) == [[2.0], [3.0]]
+        assert asyncio.run(get_embeddings_async(["ab"])) == [[2.0]]
+
+    @patch.dict('embedder._PROVIDERS')
+    @patch('embedder.EMBEDDING_PROVIDER', 'custom')
+    def test_uncached_provider_skips_the_cache(self):
+        from embedder import get_embeddings, register_provider
+        provider = Mock(cached=False)
+        provider.embed.return_value = [[1.0]]
+        register_provider("custom", provider)
+        cache = Mock()
+
+        assert get_embeddings(["text"], cache=cache) == [[1.0]]
+        cache.get_many.assert_not_called()
+
+    def test_get_provider_by_name(self):
+        from embedder import LocalProvider, OpenAIProvider, get_provider
+
+        assert isinstance(get_provider("local"), LocalProvider)
+        assert isinstance(get_provider("openai"), OpenAIProvider)
+        with pytest.raises(ValueError):
+            get_provider("unknown")
+
+
+class FakeEmbeddingsEndpoint:
+    # Stands in for openai.embeddings.create: each text embeds to [len(text)],
+    # with a small delay so concurrent batches overlap.
+    def __init__(self, delay=0.0):
+        self.delay = delay
+        self.calls = []
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self.lock = threading.Lock()
+
+    def __call__(self, model, input):
+        with self.lock:
+            self.calls.append(list(input))
+            self.in_flight += 1
+            self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        time.sleep(self.delay)
+        with self.lock:
+            self.in_flight -= 1
+        response = Mock()
+        response.data = [Mock(embedding=[float(len(text))]) for text in input]
+        return response
+
+
+class TestMakeBatches:
+    def test_splits_on_item_count(self):
+        from embedder import make_batches
+        batches = make_batches(["a"] * 10, max_batch_size=4, max_batch_tokens=1000)
+
+        assert batches == [(0, 4), (4, 8), (8, 10)]
+
+    def test_splits_on_token_budget(self):
+        from embedder import make_batches
+        # 40 characters is ~11 estimated tokens
+        texts = ["x" * 40] * 6
+        batches = make_batches(texts, max_batch_size=100, max_batch_tokens=25)
+
+        assert batches == [(0, 2), (2, 4), (4, 6)]
+
+    def test_oversized_text_gets_its_own_batch(self):
+        from embedder import make_batches
+        texts = ["small", "x" * 4000, "small"]
+        batches = make_batches(texts, max_batch_size=100, max_batch_tokens=50)
+
+        assert batches == [(0, 1), (1, 2), (2, 3)]
+
+    def test_empty_input_has_no_batches(self):
+        from embedder import make_batches
+        assert make_batches([]) == []
+
+
+class TestBatchedEmbeddings:
+    def test_results_are_in_input_order_across_batches(self):
+        fake = FakeEmbeddingsEndpoint(delay=0.01)
+        texts = ["x" * n for n in range(1, 51)]
+
+        with patch('embedder.openai.embeddings.create', side_effect=fake):
+            from embedder import get_embeddings
+            result = get_embeddings(texts, max_batch_size=7, max_concurrency=4)
+
+        assert result == [[float(n)] for n in range(1, 51)]
+        assert len(fake.calls) == 8
+        assert all(len(call) <= 7 for call in fake.calls)
+
+    def test_in_flight_requests_respect_concurrency_limit(self):
+        fake = FakeEmbeddingsEndpoint(delay=0.02)
+
+        with patch('embedder.openai.embeddings.create', side_effect=fake):
+            from embedder import get_embeddings
+            get_embeddings(["t"] * 40, max_batch_size=2, max_concurrency=3)
+
+        assert fake.max_in_flight == 3
+
+    def test_concurrency_reduces_wall_time(self):
+        fake = FakeEmbeddingsEndpoint(delay=0.05)
+
+        with patch('embedder.openai.embeddings.create', side_effect=fake):
+            from embedder import get_embeddings
+            start = time.perf_counter()
+            get_embeddings(["t"] * 8, max_batch_size=1, max_concurrency=8)
+            elapsed = time.perf_counter() - start
+
+        # Serially this would take 8 * 50ms
+        assert elapsed < 0.25
+
+    def test_serial_when_concurrency_is_one(self):
+        fake = FakeEmbeddingsEndpoint(delay=0.005)
+
+        with patch('embedder.openai.embeddings.create', side_effect=fake):
+            from embedder import get_embeddings
+            get_embeddings(["t"] * 6, max_batch_size=2, max_concurrency=1)
+
+        assert fake.max_in_flight == 1
+        assert len(fake.calls) == 3
+
+    def test_batch_errors_propagate(self):
+        with patch('embedder.openai.embeddings.create', side_effect=RuntimeError("boom")):
+            from embedder import get_embeddings
+            with pytest.raises(RuntimeError):
+                get_embeddings(["a", "b"], max_batch_size=1, max_concurrency=2)
+
+    def test_rate_limited_batches_are_retried(self):
+        import openai
+        import ratelimit
+        throttled = openai.RateLimitError("rate limited", response=Mock(status_code=429, headers={}), body=None)
+        fake = FakeEmbeddingsEndpoint()
+        attempts = []
+
+        def create(model, input):
+            attempts.append(input)
+            if len(attempts) == 1:
+                raise throttled
+            return fake(model, input)
+
+        with patch('embedder.openai.embeddings.create', side_effect=create), \
+             patch('embedder.scheduler_for', return_value=ratelimit.Scheduler(base_delay=0.001)):
+            from embedder import get_embeddings
+            result = get_embeddings(["ab", "c"], max_batch_size=1, max_concurrency=1)
+
+        assert result == [[2.0], [1.0]]
+        assert len(attempts) == 3
+
+
+class TestGetEmbeddingsAsync:
+    def test_batches_and_preserves_order(self):
+        import asyncio
+        from unittest.mock import AsyncMock
+        from embedder import get_embeddings_async
+
+        async def create(model, input):
+            await asyncio.sleep(0.01 if input[0] == "a" else 0)
+            return Mock(data=[Mock(embedding=[text]) for text in input])
+
+        client = Mock()
+        client.embeddings.create = AsyncMock(side_effect=create)
+        with patch('embedder.async_client', return_value=client):
+            result = asyncio.run(get_embeddings_async(["a", "b", "c"], max_batch_size=1))
+
+        assert result == [["a"], ["b"], ["c"]]
+        assert client.embeddings.create.await_count == 3
+
+    def test_concurrency_is_bounded(self):
+        import asyncio
+        from embedder import get_embeddings_async
+        state = {"active": 0, "peak": 0}
+
+        async def create(model, input):
+            state["active"] += 1
+            state["peak"] = max(state["peak"], state["active"])
+            await asyncio.sleep(0.01)
+            state["active"] -= 1
+            return Mock(data=[Mock(embedding=[0.0]) for _ in input])
+
+        client = Mock()
+        client.embeddings.create = create
+        with patch('embedder.async_client', return_value=client):
+            asyncio.run(get_embeddings_async(["x"] * 10, max_batch_size=1, max_concurrency=3))
+
+        assert state["peak"] == 3
+
+    def test_empty_input(self):
+        import asyncio
+        from embedder import get_embeddings_async
+        assert asyncio.run(get_embeddings_async([])) == []
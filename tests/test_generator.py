@@ -128,3 +128,72 @@ class TestGenerateAnswer:
         
         # Should still work, just with empty context
         assert result == "I don't have context to answer."
+
+
+def _stream_chunk(content):
+    chunk = Mock()
+    chunk.choices = [Mock()]
+    chunk.choices[0].delta.content = content
+    return chunk
+
+
+class TestStreamAnswer:
+    @patch('generator.openai.chat.completions.create')
+    def test_yields_deltas_in_order(self, mock_create):
+        mock_create.return_value = iter([
+            _stream_chunk(None), _stream_chunk("The "), _stream_chunk("answer"), _stream_chunk(""),
+        ])
+
+        from generator import stream_answer
+        assert list(stream_answer(["context"], "query")) == ["The ", "answer"]
+
+    @patch('generator.openai.chat.completions.create')
+    def test_requests_stream_with_same_messages(self, mock_create):
+        mock_create.return_value = iter([])
+
+        from generator import stream_answer
+        list(stream_answer(["first chunk", "second chunk"], "query"))
+
+        call_kwargs = mock_create.call_args[1]
+        assert call_kwargs["stream"] is True
+        assert call_kwargs["stream_options"] == {"include_usage": True}
+        assert call_kwargs["model"] == "gpt-4o-mini"
+        assert "first chunk\n\nsecond chunk" in call_kwargs["messages"][1]["content"]
+
+    @patch('generator.openai.chat.completions.create')
+    def test_skips_chunks_without_choices(self, mock_create):
+        usage = Mock()
+        usage.choices = []
+        mock_create.return_value = iter([_stream_chunk("Hi"), usage])
+
+        from generator import stream_answer
+        assert list(stream_answer(["context"], "query")) == ["Hi"]
+
+    @patch('generator.openai.chat.completions.create')
+    def test_records_timings(self, mock_create):
+        mock_create.return_value = iter([_stream_chunk("a"), _stream_chunk("b")])
+
+        from generator import stream_answer
+        timings = {}
+        list(stream_answer(["context"], "query", timings))
+
+        assert 0 <= timings["first_token"] <= timings["total"]
+
+
+class TestGenerateAnswerAsync:
+    def test_returns_llm_response_with_same_messages(self):
+        import asyncio
+        from unittest.mock import AsyncMock
+        client = Mock()
+        mock_choice = Mock()
+        mock_choice.message.content = "async answer"
+        client.chat.completions.create = AsyncMock(return_value=Mock(choices=[mock_choice]))
+
+        from generator import generate_answer_async
+        with patch('generator.async_client', return_value=client):
+            result = asyncio.run(generate_answer_async(["first chunk", "second chunk"], "query"))
+
+        assert result == "async answer"
+        call_kwargs = client.chat.completions.create.call_args[1]
+        assert call_kwargs["model"] == "gpt-4o-mini"
+        assert "first chunk\n\nsecond chunk" in call_kwargs["messages"][1]["content"]
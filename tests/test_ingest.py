@@ -1,99 +1,420 @@
 import pytest
-from unittest.mock import Mock, patch
-
-
-class TestIngest:
-    @patch('ingest.insert_chunk')
-    @patch('ingest.get_embeddings')
-    @patch('ingest.chunk_pdf')
-    def test_ingests_pdf_and_stores_chunks(
-        self, mock_chunk_pdf, mock_get_embeddings, mock_insert_chunk
-    ):
-        mock_chunk_pdf.return_value = ["chunk1", "chunk2", "chunk3"]
-        mock_get_embeddings.return_value = [[0.1]*1536, [0.2]*1536, [0.3]*1536]
-        mock_conn = Mock()
-        
-        from ingest import ingest
-        ingest(mock_conn, "test.pdf")
-        
-        # Verify chunk_pdf was called with the path
-        mock_chunk_pdf.assert_called_once_with("test.pdf")
-        
+import threading
+import time
+from unittest.mock import Mock, patch, mock_open
+from chunker import ChunkSpan, iter_chunk_spans
+
+
+def _fake_chunk_spans(chunks):
+    # Stands in for chunker.iter_chunk_spans: drains the page stream (so
+    # pages get hashed) and then yields the canned (content, start_page,
+    # end_page) chunks as spans laid end to end.
+    def fake(pages, *args, **kwargs):
+        for _ in pages:
+            pass
+        offset = 0
+        for content, start_page, end_page in chunks:
+            yield ChunkSpan(offset, offset + len(content), start_page, end_page, content, offset)
+            offset += len(content) + 1
+    return fake
+
+
+def _patch_ingest(pages, chunks, known=None, existing=(), fingerprint="hash"):
+    # Patches every collaborator of ingest.ingest and returns the patchers.
+    written = []
+    patchers = {
+        "file_hash": patch('ingest.file_hash', return_value=fingerprint),
+        "get_document": patch('ingest.get_document', return_value=known),
+        "iter_pages": patch('ingest.iter_pages', side_effect=lambda path: iter(pages)),
+        "iter_chunk_spans": patch('ingest.iter_chunk_spans', side_effect=_fake_chunk_spans(chunks)),
+        "get_source_chunks": patch('ingest.get_source_chunks', return_value=list(existing)),
+        "get_embeddings": patch(
+            'ingest.get_embeddings',
+            side_effect=lambda texts, cache=None: [[float(len(t))] for t in texts],
+        ),
+        "begin_document": patch('ingest.begin_document'),
+        "write_chunks": patch(
+            'ingest.write_chunks', side_effect=lambda cursor, rows: written.extend(rows)
+        ),
+        "finish_document": patch('ingest.finish_document'),
+    }
+    return patchers, written
+
+
+class _IngestTest:
+    def run_ingest(self, path="test.pdf", batch_size=None, **kwargs):
+        patchers, written = _patch_ingest(**kwargs)
+        mocks = {name: p.start() for name, p in patchers.items()}
+        try:
+            from ingest import ingest
+            conn = Mock()
+            if batch_size is None:
+                ingest(conn, path)
+            else:
+                ingest(conn, path, batch_size=batch_size)
+        finally:
+            for p in patchers.values():
+                p.stop()
+        mocks["conn"] = conn
+        mocks["rows"] = written
+        return mocks
+
+
+class TestIngest(_IngestTest):
+    def test_ingests_pdf_and_stores_chunks(self):
+        mocks = self.run_ingest(
+            pages=["page"],
+            chunks=[("chunk1", 1, 1), ("chunk2", 1, 1), ("chunk3", 1, 1)],
+        )
+
+        # Verify pages were read from the path
+        mocks["iter_pages"].assert_called_once_with("test.pdf")
+
         # Verify embeddings were generated for chunks
-        mock_get_embeddings.assert_called_once_with(["chunk1", "chunk2", "chunk3"])
-        
-        # Verify each chunk was inserted
-        assert mock_insert_chunk.call_count == 3
-
-    @patch('ingest.insert_chunk')
-    @patch('ingest.get_embeddings')
-    @patch('ingest.chunk_pdf')
-    def test_inserts_chunks_with_correct_parameters(
-        self, mock_chunk_pdf, mock_get_embeddings, mock_insert_chunk
-    ):
-        mock_chunk_pdf.return_value = ["content A", "content B"]
-        mock_get_embeddings.return_value = [[0.1, 0.2], [0.3, 0.4]]
-        mock_conn = Mock()
-        
-        from ingest import ingest
-        ingest(mock_conn, "document.pdf")
-        
-        # Verify insert_chunk called with correct args for each chunk
-        calls = mock_insert_chunk.call_args_list
-        
-        # First chunk
-        assert calls[0][0] == (mock_conn, "content A", [0.1, 0.2], "document.pdf", 0)
-        
-        # Second chunk
-        assert calls[1][0] == (mock_conn, "content B", [0.3, 0.4], "document.pdf", 1)
-
-    @patch('ingest.insert_chunk')
-    @patch('ingest.get_embeddings')
-    @patch('ingest.chunk_pdf')
-    def test_handles_empty_pdf(
-        self, mock_chunk_pdf, mock_get_embeddings, mock_insert_chunk
-    ):
-        mock_chunk_pdf.return_value = []
-        mock_get_embeddings.return_value = []
-        mock_conn = Mock()
-        
-        from ingest import ingest
-        ingest(mock_conn, "empty.pdf")
-        
-        # No chunks to insert
-        mock_insert_chunk.assert_not_called()
-
-    @patch('ingest.insert_chunk')
-    @patch('ingest.get_embeddings')
-    @patch('ingest.chunk_pdf')
-    def test_uses_pdf_path_as_source(
-        self, mock_chunk_pdf, mock_get_embeddings, mock_insert_chunk
-    ):
-        mock_chunk_pdf.return_value = ["chunk"]
-        mock_get_embeddings.return_value = [[0.1]]
-        mock_conn = Mock()
-        
-        from ingest import ingest
-        ingest(mock_conn, "/path/to/my/document.pdf")
-        
-        # Source should be the full pdf path
-        call_args = mock_insert_chunk.call_args[0]
-        assert call_args[3] == "/path/to/my/document.pdf"
-
-    @patch('ingest.insert_chunk')
-    @patch('ingest.get_embeddings')
-    @patch('ingest.chunk_pdf')
-    def test_chunk_indices_are_sequential(
-        self, mock_chunk_pdf, mock_get_embeddings, mock_insert_chunk
-    ):
-        mock_chunk_pdf.return_value = ["a", "b", "c", "d"]
-        mock_get_embeddings.return_value = [[0.1], [0.2], [0.3], [0.4]]
-        mock_conn = Mock()
-        
-        from ingest import ingest
-        ingest(mock_conn, "test.pdf")
-        
-        # Verify chunk indices are 0, 1, 2, 3
-        calls = mock_insert_chunk.call_args_list
-        indices = [call[0][4] for call in calls]
+        mocks["get_embeddings"].assert_called_once_with(
+            ["chunk1", "chunk2", "chunk3"], cache=None
+        )
+
+        # All chunks are written and committed once
+        assert len(mocks["rows"]) == 3
+        mocks["finish_document"].assert_called_once()
+        mocks["conn"].commit.assert_called_once()
+
+    def test_inserts_chunks_with_correct_parameters(self):
+        mocks = self.run_ingest(
+            path="document.pdf",
+            pages=["a", "b"],
+            chunks=[("content A", 1, 1), ("content B", 1, 2)],
+        )
+
+        cursor, source, fingerprint, page_hashes = mocks["finish_document"].call_args[0][:4]
+        assert cursor == mocks["begin_document"].return_value
+        assert source == "document.pdf"
+        assert len(page_hashes) == 2
+
+        rows = mocks["rows"]
+        assert rows[0] == ("content A", [9.0], "document.pdf", 0, 1, 1, 0, 9)
+        assert rows[1] == ("content B", [9.0], "document.pdf", 1, 1, 2, 10, 19)
+
+    def test_handles_empty_pdf(self):
+        mocks = self.run_ingest(pages=[], chunks=[])
+
+        assert mocks["rows"] == []
+        mocks["get_embeddings"].assert_not_called()
+        mocks["conn"].commit.assert_called_once()
+
+    def test_skips_blank_chunks(self):
+        mocks = self.run_ingest(pages=["  "], chunks=[("  \n", 1, 1)])
+
+        assert mocks["rows"] == []
+        mocks["get_embeddings"].assert_not_called()
+
+    def test_returns_chunk_counts(self):
+        patchers, _ = _patch_ingest(pages=["p"], chunks=[("a", 1, 1), ("b", 1, 1)])
+        for p in patchers.values():
+            p.start()
+        try:
+            from ingest import ingest
+            result = ingest(Mock(), "doc.pdf", verbose=False)
+        finally:
+            for p in patchers.values():
+                p.stop()
+
+        assert (result["chunks"], result["written"], result["kept"], result["removed"]) == (2, 2, 0, 0)
+
+    def test_uses_pdf_path_as_source(self):
+        mocks = self.run_ingest(
+            path="/path/to/my/document.pdf", pages=["p"], chunks=[("chunk", 1, 1)]
+        )
+
+        assert mocks["rows"][0][2] == "/path/to/my/document.pdf"
+
+    def test_chunk_indices_are_sequential(self):
+        mocks = self.run_ingest(
+            pages=["p"], chunks=[(c, 1, 1) for c in ["a", "b", "c", "d"]]
+        )
+
+        indices = [row[3] for row in mocks["rows"]]
         assert indices == [0, 1, 2, 3]
+
+
+class TestIncrementalIngest(_IngestTest):
+    def test_unchanged_file_is_a_no_op(self):
+        mocks = self.run_ingest(
+            pages=["p"], chunks=[], known=("same", {1: "x"}), fingerprint="same"
+        )
+
+        mocks["iter_pages"].assert_not_called()
+        mocks["get_embeddings"].assert_not_called()
+        mocks["write_chunks"].assert_not_called()
+        mocks["conn"].rollback.assert_called_once()
+        mocks["conn"].commit.assert_not_called()
+
+        order = [call[0] for call in mocks["begin_document"].mock_calls[:1]]
+        assert order == [""]
+        # get_document and get_source_chunks ran after the lock was taken.
+        assert mocks["begin_document"].call_count == 1
+
+    def test_only_chunks_on_changed_pages_are_embedded(self):
+        from ingest import page_hash
+        known = ("old", {1: page_hash("one"), 2: "stale"})
+        existing = [
+            (10, "first", 0, 1, 1),
+            (11, "second old", 1, 2, 2),
+        ]
+        mocks = self.run_ingest(
+            pages=["one", "two"],
+            chunks=[("first", 1, 1), ("second new", 2, 2)],
+            known=known,
+            existing=existing,
+        )
+
+        mocks["get_embeddings"].assert_called_once_with(["second new"], cache=None)
+        assert [row[0] for row in mocks["rows"]] == ["second new"]
+        kept, delete_ids = mocks["finish_document"].call_args[0][4:6]
+        assert kept == [(10, 0, 1, 1, 0, 5)]
+        assert delete_ids == [11]
+
+    def test_legacy_rows_without_pages_are_replaced(self):
+        existing = [(1, "chunk", 0, None, None), (2, "chunk", 0, None, None)]
+        mocks = self.run_ingest(
+            pages=["p"], chunks=[("chunk", 1, 1)], existing=existing
+        )
+
+        assert len(mocks["rows"]) == 1
+        kept, delete_ids = mocks["finish_document"].call_args[0][4:6]
+        assert kept == []
+        assert sorted(delete_ids) == [1, 2]
+
+
+class TestPipelinedIngest(_IngestTest):
+    def test_embeds_in_batches(self):
+        mocks = self.run_ingest(
+            pages=["p"], chunks=[(f"c{i}", 1, 1) for i in range(7)], batch_size=3
+        )
+
+        batches = [c[0][0] for c in mocks["get_embeddings"].call_args_list]
+        assert batches == [["c0", "c1", "c2"], ["c3", "c4", "c5"], ["c6"]]
+        assert [row[3] for row in mocks["rows"]] == list(range(7))
+
+    def test_first_batch_is_written_before_extraction_finishes(self):
+        events = []
+
+        def pages():
+            for i in range(200):
+                events.append(("page", i))
+                yield f"Sentence {i}. "
+
+        with patch('ingest.file_hash', return_value="h"), \
+             patch('ingest.get_document', return_value=None), \
+             patch('ingest.get_source_chunks', return_value=[]), \
+             patch('ingest.iter_pages', side_effect=lambda path: pages()), \
+             patch('ingest.iter_chunk_spans', side_effect=lambda p: iter_chunk_spans(p, max_chunk_size=1, overlap=0)), \
+             patch('ingest.get_embeddings', side_effect=lambda texts, cache=None: [[0.0]] * len(texts)), \
+             patch('ingest.begin_document'), \
+             patch('ingest.write_chunks', side_effect=lambda cursor, rows: events.append(("write", len(rows)))), \
+             patch('ingest.finish_document'):
+            from ingest import ingest
+            ingest(Mock(), "doc.pdf", batch_size=2)
+
+        first_write = events.index(("write", 2))
+        pages_before_write = [e for e in events[:first_write] if e[0] == "page"]
+        # Bounded queues keep extraction at most a few batches ahead
+        assert len(pages_before_write) < 50
+
+    def test_default_batches_overlap_extraction(self):
+        from ingest import EMBED_BATCH_SIZE
+        chunks = [(f"c{i}", 1, 1) for i in range(EMBED_BATCH_SIZE * 20)]
+        patchers, written = _patch_ingest(pages=["p"], chunks=chunks)
+        mocks = {name: p.start() for name, p in patchers.items()}
+        extracted = []
+
+        def spans(pages):
+            for i, span in enumerate(_fake_chunk_spans(chunks)(pages)):
+                extracted.append(i)
+                yield span
+        mocks["iter_chunk_spans"].side_effect = spans
+        embedded_while_extracting = []
+        mocks["get_embeddings"].side_effect = lambda texts, cache=None: (
+            embedded_while_extracting.append(len(extracted) < len(chunks)) or [[0.0]] * len(texts)
+        )
+        try:
+            from ingest import ingest
+            ingest(Mock(), "doc.pdf")
+        finally:
+            for p in patchers.values():
+                p.stop()
+
+        assert embedded_while_extracting[0]
+        assert len(written) == len(chunks)
+
+    def test_batches_are_embedded_concurrently(self):
+        patchers, written = _patch_ingest(pages=["p"], chunks=[(f"c{i}", 1, 1) for i in range(8)])
+        mocks = {name: p.start() for name, p in patchers.items()}
+
+        def slow(texts, cache=None):
+            time.sleep(0.05)
+            return [[float(len(t))] for t in texts]
+        mocks["get_embeddings"].side_effect = slow
+        try:
+            from ingest import ingest
+            start = time.perf_counter()
+            ingest(Mock(), "doc.pdf", batch_size=1, embed_workers=8)
+            elapsed = time.perf_counter() - start
+        finally:
+            for p in patchers.values():
+                p.stop()
+
+        # One worker would take 8 * 50ms
+        assert elapsed < 0.25
+        assert [row[3] for row in written] == list(range(8))
+
+    def test_embedding_failure_rolls_back_and_propagates(self):
+        patchers, written = _patch_ingest(pages=["p"], chunks=[("a", 1, 1), ("b", 1, 1)])
+        mocks = {name: p.start() for name, p in patchers.items()}
+        mocks["get_embeddings"].side_effect = RuntimeError("rate limited")
+        try:
+            from ingest import ingest
+            conn = Mock()
+            with pytest.raises(RuntimeError, match="rate limited"):
+                ingest(conn, "doc.pdf")
+        finally:
+            for p in patchers.values():
+                p.stop()
+
+        conn.rollback.assert_called_once()
+        conn.commit.assert_not_called()
+        mocks["finish_document"].assert_not_called()
+
+    def test_write_failure_stops_upstream_stages(self):
+        patchers, written = _patch_ingest(
+            pages=["p"], chunks=[(f"c{i}", 1, 1) for i in range(50)]
+        )
+        mocks = {name: p.start() for name, p in patchers.items()}
+        mocks["write_chunks"].side_effect = RuntimeError("disk full")
+        try:
+            from ingest import ingest
+            conn = Mock()
+            with pytest.raises(RuntimeError, match="disk full"):
+                ingest(conn, "doc.pdf", batch_size=1)
+        finally:
+            for p in patchers.values():
+                p.stop()
+
+        conn.rollback.assert_called_once()
+        # Extraction stopped well before embedding all 50 single-chunk batches
+        assert mocks["get_embeddings"].call_count < 50
+
+    def test_reports_per_stage_throughput(self, capsys):
+        self.run_ingest(pages=["p"], chunks=[("a", 1, 1), ("b", 1, 1)])
+
+        out = capsys.readouterr().out
+        assert "Ingested 2 chunks from test.pdf" in out
+        assert "extract: 2 chunks" in out
+        assert "embed: 2 chunks" in out
+        assert "write: 2 rows" in out
+
+
+class FakeLockedStore:
+    # A registry and chunk table behind one per-source lock, standing in for
+    # Postgres and its advisory lock. Writes become visible on commit.
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.registry = {}
+        self.table = []
+
+    def patches(self):
+        return [
+            patch('ingest.begin_document', side_effect=self.begin_document),
+            patch('ingest.get_document', side_effect=lambda conn, source: self.registry.get(source)),
+            patch('ingest.get_source_chunks', side_effect=lambda conn, source: [
+                (i, row[0], row[3], row[4], row[5]) for i, row in enumerate(self.table) if row[2] == source
+            ]),
+            patch('ingest.write_chunks', side_effect=lambda cursor, rows: cursor.rows.extend(rows)),
+            patch('ingest.finish_document', side_effect=self.finish_document),
+        ]
+
+    def connect(self):
+        conn = Mock(rows=[], document=None)
+        conn.commit.side_effect = lambda: self.commit(conn)
+        conn.rollback.side_effect = lambda: self.lock.release()
+        return conn
+
+    def begin_document(self, conn, source):
+        self.lock.acquire()
+        return conn
+
+    def finish_document(self, cursor, source, fingerprint, page_hashes, kept, delete_ids):
+        cursor.document = (source, (fingerprint, dict(enumerate(page_hashes, 1))))
+
+    def commit(self, conn):
+        self.table.extend(conn.rows)
+        self.registry[conn.document[0]] = conn.document[1]
+        self.lock.release()
+
+
+class TestConcurrentIngest:
+    def test_interleaved_ingests_of_a_new_source_write_it_once(self):
+        store = FakeLockedStore()
+        # Both ingests get past hashing the file before either takes the lock.
+        hashed = threading.Barrier(2)
+
+        def file_hash(path):
+            hashed.wait(timeout=5)
+            return "hash"
+
+        patchers = store.patches() + [
+            patch('ingest.file_hash', side_effect=file_hash),
+            patch('ingest.iter_pages', side_effect=lambda path: iter(["page"])),
+            patch('ingest.iter_chunk_spans', side_effect=_fake_chunk_spans([("a", 1, 1), ("b", 1, 1)])),
+            patch('ingest.get_embeddings', side_effect=lambda texts, cache=None: [[1.0] for _ in texts]),
+        ]
+        for p in patchers:
+            p.start()
+        try:
+            from ingest import ingest
+            results = []
+            threads = [
+                threading.Thread(target=lambda: results.append(ingest(store.connect(), "new.pdf", verbose=False)))
+                for _ in range(2)
+            ]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+        finally:
+            for p in patchers:
+                p.stop()
+
+        assert [row[0] for row in store.table] == ["a", "b"]
+        # The second one finds the file already ingested.
+        assert results.count(None) == 1
+
+
+class TestChunkPlanner:
+    def test_reuses_duplicate_content_once_per_stored_row(self):
+        from ingest import ChunkPlanner
+        planner = ChunkPlanner([(1, "footer", 0, 1, 1)], changed_pages={2})
+
+        reused = [planner.keep(0, "footer", 1, 1), planner.keep(1, "footer", 2, 2)]
+
+        assert reused == [True, False]
+        assert planner.kept == [(1, 0, 1, 1)]
+        assert planner.delete_ids() == []
+
+    def test_chunk_spanning_a_changed_page_is_not_reused(self):
+        from ingest import ChunkPlanner
+        planner = ChunkPlanner([(1, "span", 0, 1, 2)], changed_pages={2})
+
+        assert planner.keep(0, "span", 1, 2) is False
+        assert planner.kept == []
+        assert planner.delete_ids() == [1]
+
+
+class TestFileHash:
+    @patch('builtins.open', mock_open(read_data=b"pdf bytes"))
+    def test_hashes_file_contents(self):
+        import hashlib
+        from ingest import file_hash
+
+        assert file_hash("doc.pdf") == hashlib.sha256(b"pdf bytes").hexdigest()
@@ -0,0 +1,72 @@
+import pytest
+from lexical import tokenize, BM25Index, reciprocal_rank_fusion
+
+
+class TestTokenize:
+    def test_lowercases_words(self):
+        assert tokenize("Hello World") == ["hello", "world"]
+
+    def test_keeps_codes_together(self):
+        assert tokenize("Error E-1042 in v2.3 (part_no)") == ["error", "e-1042", "in", "v2.3", "part_no"]
+
+    def test_drops_trailing_punctuation(self):
+        assert tokenize("The end.") == ["the", "end"]
+
+
+class TestBM25Index:
+    def _index(self):
+        index = BM25Index()
+        index.add(1, "The pump overheats when error E-1042 is shown.")
+        index.add(2, "Replace the filter every six months.")
+        index.add(3, "The pump and the filter are in the base unit.")
+        return index
+
+    def test_exact_code_ranks_first(self):
+        result = self._index().search("what does E-1042 mean", top_k=3)
+
+        assert result[0][0] == 1
+        assert len(result) == 1
+
+    def test_rarer_terms_weigh_more(self):
+        result = self._index().search("pump filter base", top_k=3)
+
+        assert result[0][0] == 3
+
+    def test_no_matching_terms(self):
+        assert self._index().search("warranty") == []
+
+    def test_remove_document(self):
+        index = self._index()
+
+        index.remove(1)
+
+        assert index.search("E-1042") == []
+        assert len(index) == 2
+        assert "e-1042" not in index.postings
+
+    def test_re_adding_replaces_document(self):
+        index = self._index()
+
+        index.add(2, "Nothing about filters here.")
+
+        assert [doc for doc, _ in index.search("months")] == []
+
+    def test_empty_index(self):
+        assert BM25Index().search("anything") == []
+
+
+class TestReciprocalRankFusion:
+    def test_items_in_both_lists_win(self):
+        fused = reciprocal_rank_fusion([[1, 2, 3], [3, 4, 1]], k=60)
+
+        assert fused[:2] == [1, 3]
+        assert set(fused) == {1, 2, 3, 4}
+
+    def test_scores_by_rank(self):
+        # 2 is first in one list; 1 is second in both (1/62 * 2 > 1/61)
+        fused = reciprocal_rank_fusion([[2, 1], [3, 1]], k=60)
+
+        assert fused[0] == 1
+
+    def test_empty_lists(self):
+        assert reciprocal_rank_fusion([[], []]) == []
@@ -0,0 +1,60 @@
+import time
+import numpy as np
+import localembed
+
+
+class TestEncode:
+    def test_rows_are_unit_length_at_requested_size(self):
+        vectors = localembed.encode(["first text", "a second, longer text"], 256)
+
+        assert vectors.shape == (2, 256)
+        assert vectors.dtype == np.float32
+        assert np.allclose(np.linalg.norm(vectors, axis=1), 1.0)
+
+    def test_is_deterministic_and_batch_independent(self):
+        texts = ["pgvector stores embeddings", "bananas are yellow"]
+
+        batch = localembed.encode(texts, 128)
+        single = localembed.encode(texts[1:], 128)
+
+        assert np.array_equal(batch, localembed.encode(texts, 128))
+        assert np.allclose(batch[1], single[0])
+
+    def test_related_texts_are_closer(self):
+        documents = localembed.encode([
+            "Vector search uses pgvector and cosine distance.",
+            "The embeddings are cached on disk in SQLite.",
+            "Bananas are a yellow fruit rich in potassium.",
+        ], 1536)
+        queries = localembed.encode([
+            "cosine distance vector search",
+            "how are embeddings cached",
+            "what colour are bananas",
+        ], 1536)
+
+        similarity = queries @ documents.T
+
+        assert list(similarity.argmax(axis=1)) == [0, 1, 2]
+
+    def test_shared_stems_match(self):
+        a, b, c = localembed.encode(["embedding", "embeddings", "potassium"], 512)
+
+        assert a @ b > a @ c
+
+    def test_texts_without_words_share_a_unit_vector(self):
+        vectors = localembed.encode(["", "?!", "words"], 64)
+
+        assert np.allclose(np.linalg.norm(vectors, axis=1), 1.0)
+        assert np.array_equal(vectors[0], vectors[1])
+        assert not np.isnan(1 - vectors @ vectors[2]).any()
+
+    def test_empty_batch(self):
+        assert localembed.encode([], 64).shape == (0, 64)
+
+    def test_query_encoding_is_fast(self):
+        localembed.encode(["warm up"], 1536)
+        start = time.perf_counter()
+        for _ in range(100):
+            localembed.encode(["what is the refund policy for damaged items?"], 1536)
+
+        assert (time.perf_counter() - start) / 100 < 0.001
@@ -0,0 +1,191 @@
+import threading
+import time
+import pytest
+from unittest.mock import Mock, patch
+
+
+class TestAsk:
+    @patch('main.generate_answer')
+    @patch('main.retrieve')
+    def test_returns_generated_answer(self, mock_retrieve, mock_generate):
+        mock_retrieve.return_value = ["context"]
+        mock_generate.return_value = "answer"
+
+        from main import ask
+        assert ask(Mock(), "question") == "answer"
+
+    @patch('main.generate_answer')
+    @patch('main.retrieve')
+    def test_no_context_skips_generation(self, mock_retrieve, mock_generate):
+        mock_retrieve.return_value = []
+
+        from main import ask
+        assert ask(Mock(), "question") == "No relevant information found."
+        mock_generate.assert_not_called()
+
+
+class TestAskMany:
+    @patch('main.generate_answer')
+    @patch('main.retrieve_many')
+    def test_answers_in_question_order(self, mock_retrieve_many, mock_generate):
+        mock_retrieve_many.return_value = [["ctx a"], [], ["ctx c"]]
+
+        def slow_generate(context, question):
+            # Earlier questions finish last
+            time.sleep(0.03 if question == "a" else 0.0)
+            return f"answer to {question}"
+        mock_generate.side_effect = slow_generate
+
+        from main import ask_many
+        result = ask_many(Mock(), ["a", "b", "c"])
+
+        assert result == ["answer to a", "No relevant information found.", "answer to c"]
+        mock_retrieve_many.assert_called_once()
+
+    @patch('main.generate_answer')
+    @patch('main.retrieve_many')
+    def test_generation_concurrency_is_bounded(self, mock_retrieve_many, mock_generate):
+        mock_retrieve_many.return_value = [["ctx"]] * 12
+        lock = threading.Lock()
+        state = {"in_flight": 0, "peak": 0}
+
+        def generate(context, question):
+            with lock:
+                state["in_flight"] += 1
+                state["peak"] = max(state["peak"], state["in_flight"])
+            time.sleep(0.01)
+            with lock:
+                state["in_flight"] -= 1
+            return "ok"
+        mock_generate.side_effect = generate
+
+        from main import ask_many
+        ask_many(Mock(), [f"q{i}" for i in range(12)], max_concurrency=3)
+
+        assert state["peak"] == 3
+
+
+class TestAskManyMatchesAsk:
+    @pytest.mark.parametrize("hybrid", [False, True])
+    def test_same_answers_as_ask(self, hybrid, tmp_path):
+        from main import ask, ask_many
+        from npstore import NumpyStore, insert_chunks
+        store = NumpyStore(str(tmp_path / "store"))
+        insert_chunks(store, [
+            ("General safety guidance for the unit.", [1.0, 0.0], "doc.pdf", 0),
+            ("Error E-1042 means the pump overheated.", [0.0, 1.0], "doc.pdf", 1),
+            ("Cleaning and maintenance schedule.", [0.9, 0.1], "doc.pdf", 2),
+            ("Replace the filter every month.", [0.7, 0.7], "manual.pdf", 0),
+        ])
+        store.commit()
+        questions = ["What does E-1042 mean?", "How do I clean it?", "When is the filter replaced?"]
+        vectors = {questions[0]: [1.0, 0.05], questions[1]: [0.9, 0.1], questions[2]: [0.0, 1.0]}
+
+        with patch('retriever.HYBRID_SEARCH', hybrid), \
+                patch('retriever.get_embeddings', side_effect=lambda texts: [vectors[t] for t in texts]), \
+                patch('main.generate_answer', side_effect=lambda context, question: " | ".join(context)):
+            one_by_one = [ask(store, question) for question in questions]
+            batched = ask_many(store, questions)
+
+        assert batched == one_by_one
+
+
+class TestAskStream:
+    @patch('main.stream_answer')
+    @patch('main.retrieve')
+    def test_streams_generated_answer(self, mock_retrieve, mock_stream):
+        mock_retrieve.return_value = ["context"]
+        mock_stream.return_value = iter(["The ", "answer"])
+
+        from main import ask_stream
+        timings = {}
+        assert "".join(ask_stream(Mock(), "question", timings)) == "The answer"
+        mock_stream.assert_called_once_with(["context"], "question", timings)
+
+    @patch('main.stream_answer')
+    @patch('main.retrieve')
+    def test_no_context_skips_generation(self, mock_retrieve, mock_stream):
+        mock_retrieve.return_value = []
+
+        from main import ask_stream
+        assert list(ask_stream(Mock(), "question")) == ["No relevant information found."]
+        mock_stream.assert_not_called()
+
+
+class TestAnswerCache:
+    @patch('main.document_version', return_value="v1")
+    @patch('main.embed_query', return_value=[1.0, 0.0])
+    @patch('main.generate_answer', return_value="answer")
+    @patch('main.retrieve', return_value=["context"])
+    def test_repeated_question_skips_chat_model(self, mock_retrieve, mock_generate, mock_embed, mock_version):
+        from main import ask
+        from answercache import AnswerCache
+        cache = AnswerCache()
+
+        assert ask(Mock(), "question", cache) == "answer"
+        assert ask(Mock(), "question again", cache) == "answer"
+        mock_generate.assert_called_once()
+        mock_retrieve.assert_called_once()
+        assert mock_retrieve.call_args[1]["query_embedding"] == [1.0, 0.0]
+
+    @patch('main.document_version', side_effect=["v1", "v1", "v2"])
+    @patch('main.embed_query', return_value=[1.0, 0.0])
+    @patch('main.generate_answer', side_effect=["old", "new"])
+    @patch('main.retrieve', return_value=["context"])
+    def test_reingest_invalidates(self, mock_retrieve, mock_generate, mock_embed, mock_version):
+        from main import ask
+        from answercache import AnswerCache
+        cache = AnswerCache()
+
+        assert [ask(Mock(), "question", cache) for _ in range(3)] == ["old", "old", "new"]
+
+    @patch('main.document_version', return_value="v1")
+    @patch('main.embed_query', return_value=[1.0, 0.0])
+    @patch('main.stream_answer')
+    @patch('main.retrieve', return_value=["context"])
+    def test_streamed_answer_is_cached(self, mock_retrieve, mock_stream, mock_embed, mock_version):
+        mock_stream.return_value = iter(["The ", "answer"])
+        from main import ask_stream
+        from answercache import AnswerCache
+        cache = AnswerCache()
+
+        assert "".join(ask_stream(Mock(), "question", answer_cache=cache)) == "The answer"
+        assert list(ask_stream(Mock(), "question", answer_cache=cache)) == ["The answer"]
+        mock_stream.assert_called_once()
+
+
+class TestAskAsync:
+    def test_questions_are_in_flight_together(self):
+        import asyncio
+        from main import ask_async
+        state = {"active": 0, "peak": 0}
+
+        async def retrieve_async(conn, question, **options):
+            return [f"context for {question}"]
+
+        async def generate_answer_async(context, question):
+            state["active"] += 1
+            state["peak"] = max(state["peak"], state["active"])
+            await asyncio.sleep(0.01)
+            state["active"] -= 1
+            return f"answer to {question}"
+
+        async def run():
+            return await asyncio.gather(*(ask_async(Mock(), f"q{i}") for i in range(50)))
+
+        with patch('main.retrieve_async', retrieve_async), \
+             patch('main.generate_answer_async', generate_answer_async):
+            answers = asyncio.run(run())
+
+        assert answers == [f"answer to q{i}" for i in range(50)]
+        assert state["peak"] == 50
+
+    def test_no_context_skips_generation(self):
+        import asyncio
+        from unittest.mock import AsyncMock
+        from main import ask_async
+
+        with patch('main.retrieve_async', AsyncMock(return_value=[])), \
+             patch('main.generate_answer_async', AsyncMock()) as mock_generate:
+            assert asyncio.run(ask_async(Mock(), "q")) == "No relevant information found."
+        mock_generate.assert_not_awaited()
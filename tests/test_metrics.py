@@ -0,0 +1,189 @@
+import asyncio
+import threading
+import pytest
+from unittest.mock import Mock, patch
+import metrics
+
+
+@pytest.fixture
+def enabled():
+    metrics.reset()
+    metrics.enable()
+    yield
+    metrics.enable(False)
+    metrics.reset()
+
+
+class TestDisabled:
+    def test_records_nothing(self):
+        metrics.reset()
+
+        @metrics.instrumented("work")
+        def work():
+            metrics.count("rows_written", 3)
+            return 42
+
+        assert work() == 42
+        assert metrics.to_json() == {"histograms": {}, "counters": {}, "traces": []}
+
+
+class TestTraces:
+    def test_nested_calls_become_spans_of_one_trace(self, enabled):
+        @metrics.instrumented("search")
+        def search():
+            metrics.count("rows_read", 5)
+
+        @metrics.instrumented("ask")
+        def ask():
+            search()
+            search()
+
+        ask()
+
+        trace = metrics.last_trace()
+        assert trace["name"] == "ask"
+        assert [(s["stage"], s["parent"]) for s in trace["spans"]] == [
+            ("ask", None), ("search", "ask"), ("search", "ask"),
+        ]
+        assert trace["spans"][1]["rows_read"] == 5
+        assert trace["counts"] == {"rows_read": 10}
+
+    def test_recursive_stage_is_timed_once(self, enabled):
+        @metrics.instrumented("embed")
+        def embed(depth):
+            if depth:
+                embed(depth - 1)
+
+        embed(3)
+
+        assert len(metrics.last_trace()["spans"]) == 1
+        assert metrics.to_json()["histograms"]["embed"]["count"] == 1
+
+    def test_generators_are_timed_until_exhausted(self, enabled):
+        @metrics.instrumented("generate")
+        def stream():
+            yield "a"
+            yield "b"
+
+        assert list(stream()) == ["a", "b"]
+        assert metrics.last_trace()["name"] == "generate"
+
+    def test_coroutines(self, enabled):
+        @metrics.instrumented("embed")
+        async def embed():
+            return 1
+
+        @metrics.instrumented("ask")
+        async def ask():
+            return await embed()
+
+        assert asyncio.run(ask()) == 1
+        assert [s["stage"] for s in metrics.last_trace()["spans"]] == ["ask", "embed"]
+
+    def test_run_in_context_joins_the_callers_trace(self, enabled):
+        @metrics.instrumented("write")
+        def write():
+            pass
+
+        @metrics.instrumented("ingest")
+        def ingest():
+            thread = threading.Thread(target=metrics.run_in_context(write))
+            thread.start()
+            thread.join()
+
+        ingest()
+
+        assert [s["stage"] for s in metrics.last_trace()["spans"]] == ["ingest", "write"]
+
+    def test_record_adds_a_timed_stage(self, enabled):
+        with metrics.span("ingest"):
+            metrics.record("extract", 0.5, chunks_extracted=7)
+
+        trace = metrics.last_trace()
+        assert trace["spans"][1]["seconds"] == 0.5
+        assert trace["counts"] == {"chunks_extracted": 7}
+
+    def test_count_call_reads_usage(self, enabled):
+        response = Mock()
+        response.usage.prompt_tokens = 12
+        response.usage.completion_tokens = 30
+
+        with metrics.span("generate"):
+            metrics.count_call(response)
+
+        assert metrics.last_trace()["counts"] == {"api_calls": 1, "input_tokens": 12, "output_tokens": 30}
+
+
+class TestExport:
+    def test_histogram_buckets_are_cumulative(self, enabled):
+        metrics.REGISTRY.observe("search", 0.003)
+        metrics.REGISTRY.observe("search", 0.2)
+        metrics.REGISTRY.observe("search", 60)
+
+        histogram = metrics.to_json()["histograms"]["search"]
+
+        assert histogram["count"] == 3
+        assert histogram["buckets"]["0.005"] == 1
+        assert histogram["buckets"]["0.25"] == 2
+        assert histogram["buckets"]["+Inf"] == 3
+
+    def test_prometheus_text(self, enabled):
+        with metrics.span("write"):
+            metrics.count("rows_written", 4)
+
+        text = metrics.to_prometheus()
+
+        assert "# TYPE askpdf_stage_seconds histogram" in text
+        assert 'askpdf_stage_seconds_bucket{stage="write",le="+Inf"} 1' in text
+        assert 'askpdf_stage_seconds_count{stage="write"} 1' in text
+        assert "# TYPE askpdf_rows_written_total counter" in text
+        assert 'askpdf_rows_written_total{stage="write"} 4' in text
+
+
+class TestInstrumentedPaths:
+    @patch('main.generate_answer')
+    @patch('main.retrieve')
+    def test_ask_traces_embedding_search_and_generation(self, mock_retrieve, mock_generate, enabled):
+        import npstore
+        from main import ask, trace_summary
+        store = Mock(spec=npstore.NumpyStore)
+        mock_retrieve.side_effect = lambda conn, q, **options: metrics.count("rows_read", 2) or ["ctx"]
+        mock_generate.return_value = "answer"
+
+        assert ask(store, "question?") == "answer"
+
+        trace = metrics.last_trace()
+        assert trace["name"] == "ask"
+        assert trace_summary(trace).startswith("ask ")
+
+    @patch('generator.openai.chat.completions.create')
+    @patch('main.retrieve')
+    def test_streamed_answer_counts_its_usage(self, mock_retrieve, mock_create, enabled):
+        from main import ask_stream
+        mock_retrieve.return_value = ["ctx"]
+        chunks = [Mock(choices=[Mock()], usage=None) for _ in range(2)]
+        chunks[0].choices[0].delta.content = "The "
+        chunks[1].choices[0].delta.content = "answer"
+        final = Mock(choices=[], usage=Mock(prompt_tokens=812, completion_tokens=96))
+        mock_create.return_value = iter(chunks + [final])
+
+        assert "".join(ask_stream(Mock(), "question?")) == "The answer"
+
+        trace = metrics.last_trace()
+        assert trace["name"] == "ask"
+        assert [s["stage"] for s in trace["spans"]] == ["ask", "generate"]
+        assert trace["counts"] == {"api_calls": 1, "input_tokens": 812, "output_tokens": 96}
+
+    @patch('embedder.openai.embeddings.create')
+    def test_embedding_batches_on_threads_join_the_trace(self, mock_create, enabled):
+        from embedder import get_embeddings
+        mock_create.side_effect = lambda model, input: Mock(
+            data=[Mock(embedding=[0.0]) for _ in input], usage=Mock(prompt_tokens=len(input)),
+        )
+
+        with metrics.span("ingest"):
+            get_embeddings(["a", "b", "c"], max_batch_size=1, max_concurrency=3)
+
+        trace = metrics.last_trace()
+        assert trace["counts"] == {"api_calls": 3, "input_tokens": 3}
+        assert [s["stage"] for s in trace["spans"]] == ["ingest", "embed"]
@@ -0,0 +1,391 @@
+import json
+import os
+
+import numpy as np
+import pytest
+from unittest.mock import patch
+import npstore
+from npstore import NumpyStore, insert_chunk, insert_chunks, search_chunks
+
+
+@pytest.fixture
+def store(tmp_path):
+    return NumpyStore(str(tmp_path / "store"))
+
+
+class TestInsertAndSearch:
+    def test_insert_chunk_returns_id(self, store):
+        first = insert_chunk(store, "first", [1.0, 0.0], "doc.pdf", 0)
+        second = insert_chunk(store, "second", [0.0, 1.0], "doc.pdf", 1)
+
+        assert (first, second) == (0, 1)
+
+    def test_search_returns_nearest_by_cosine(self, store):
+        insert_chunks(store, [
+            ("east", [1.0, 0.0], "doc.pdf", 0),
+            ("north", [0.0, 1.0], "doc.pdf", 1),
+            ("north-east", [1.0, 1.0], "doc.pdf", 2),
+        ])
+
+        result = search_chunks(store, [0.0, 2.0], top_k=2)
+
+        assert result == [
+            (1, "north", "doc.pdf", 1),
+            (2, "north-east", "doc.pdf", 2),
+        ]
+
+    def test_top_k_larger_than_store(self, store):
+        insert_chunk(store, "only", [1.0, 0.0], "doc.pdf", 0)
+
+        assert len(search_chunks(store, [1.0, 0.0], top_k=5)) == 1
+
+    def test_empty_store_returns_no_matches(self, store):
+        assert search_chunks(store, [1.0, 0.0]) == []
+
+    def test_uses_argpartition_not_full_sort(self, store):
+        insert_chunks(store, [(f"c{i}", [1.0, float(i)], "d", i) for i in range(50)])
+
+        with patch('npstore.np.argpartition', wraps=np.argpartition) as mock_partition:
+            search_chunks(store, [0.0, 1.0], top_k=3)
+
+        mock_partition.assert_called_once()
+
+    def test_rejects_mismatched_dimensions(self, store):
+        insert_chunk(store, "a", [1.0, 0.0], "doc.pdf", 0)
+
+        with pytest.raises(ValueError):
+            insert_chunk(store, "b", [1.0, 0.0, 0.0], "doc.pdf", 1)
+
+
+class TestSearchChunksMany:
+    def test_matches_individual_searches(self, store):
+        insert_chunks(store, [(f"c{i}", [1.0, float(i)], "d", i) for i in range(20)])
+        queries = [[0.0, 1.0], [1.0, 0.0], [1.0, 5.0]]
+
+        result = npstore.search_chunks_many(store, queries, top_k=3)
+
+        assert result == [search_chunks(store, q, top_k=3) for q in queries]
+
+    def test_with_distance_matches_individual_searches(self, store):
+        insert_chunks(store, [(f"c{i}", [1.0, float(i)], "d", i) for i in range(20)])
+        queries = [[0.0, 1.0], [1.0, 0.0]]
+
+        result = npstore.search_chunks_many(store, queries, top_k=3, with_distance=True)
+
+        assert result == [search_chunks(store, q, top_k=3, with_distance=True) for q in queries]
+        assert all(isinstance(row[4], float) for rows in result for row in rows)
+
+
+class TestHybridSearch:
+    def _store(self, store):
+        insert_chunks(store, [
+            ("General safety guidance for the unit.", [1.0, 0.0], "doc.pdf", 0),
+            ("Error E-1042 means the pump overheated.", [0.0, 1.0], "doc.pdf", 1),
+            ("Cleaning and maintenance schedule.", [0.9, 0.1], "doc.pdf", 2),
+        ])
+        return store
+
+    def test_exact_code_is_found_even_when_vector_misses(self, store):
+        self._store(store)
+
+        result = npstore.hybrid_search_chunks(store, "E-1042", [1.0, 0.0], top_k=2)
+
+        assert 1 in [row[0] for row in result]
+
+    def test_with_distance_is_none_for_full_text_only_hits(self, store):
+        self._store(store)
+
+        result = npstore.hybrid_search_chunks(store, "E-1042", [1.0, 0.0], top_k=3, candidates=1,
+                                              with_distance=True)
+
+        distances = {row[0]: row[4] for row in result}
+        assert distances[0] == pytest.approx(0.0, abs=1e-6)
+        assert distances[1] is None
+
+    def test_lexical_index_follows_commits(self, store):
+        self._store(store)
+        npstore.hybrid_search_chunks(store, "pump", [1.0, 0.0])
+
+        cursor = npstore.begin_document(store, "doc.pdf")
+        npstore.write_chunks(cursor, [("Fan error F-7 explained.", [1.0, 0.0], "doc.pdf", 3, 1, 1)])
+        npstore.finish_document(cursor, "doc.pdf", "h", ["p"], delete_ids=[1])
+        store.commit()
+
+        result = npstore.hybrid_search_chunks(store, "F-7 E-1042", [0.0, 1.0], top_k=5)
+        ids = [row[0] for row in result]
+        assert 3 in ids
+        assert 1 not in ids
+
+
+class TestPersistence:
+    def test_reopened_store_sees_committed_chunks(self, tmp_path):
+        path = str(tmp_path / "store")
+        insert_chunks(NumpyStore(path), [
+            ("kept", [1.0, 0.0], "doc.pdf", 0),
+            ("other", [0.0, 1.0], "doc.pdf", 1),
+        ])
+
+        reopened = NumpyStore(path)
+
+        assert reopened.count == 2
+        assert isinstance(reopened.vectors, np.memmap)
+        assert search_chunks(reopened, [1.0, 0.0], top_k=1) == [(0, "kept", "doc.pdf", 0)]
+
+    def test_appends_do_not_rewrite_existing_data(self, tmp_path):
+        path = tmp_path / "store"
+        store = NumpyStore(str(path))
+        insert_chunk(store, "a", [1.0, 0.0], "doc.pdf", 0)
+        before = (path / "vectors.f32").read_bytes()
+
+        insert_chunk(store, "b", [0.0, 1.0], "doc.pdf", 1)
+
+        assert (path / "vectors.f32").read_bytes().startswith(before)
+
+    def test_torn_append_is_truncated_on_open(self, tmp_path):
+        path = tmp_path / "store"
+        insert_chunk(NumpyStore(str(path)), "a", [1.0, 0.0], "doc.pdf", 0)
+        with open(path / "vectors.f32", "ab") as file:
+            file.write(b"\x00" * 6)
+
+        reopened = NumpyStore(str(path))
+
+        assert reopened.count == 1
+        assert (path / "vectors.f32").stat().st_size == 8
+
+
+class TestDocumentTransactions:
+    def test_uncommitted_chunks_are_invisible(self, store):
+        cursor = npstore.begin_document(store, "doc.pdf")
+        npstore.write_chunks(cursor, [("draft", [1.0, 0.0], "doc.pdf", 0, 1, 1)])
+
+        assert search_chunks(store, [1.0, 0.0]) == []
+
+        store.rollback()
+        assert search_chunks(store, [1.0, 0.0]) == []
+        assert npstore.get_document(store, "doc.pdf") is None
+
+    def test_commit_swaps_chunks_and_records_fingerprint(self, store):
+        insert_chunks(store, [
+            ("stays", [1.0, 0.0], "doc.pdf", 0, 1, 1),
+            ("goes", [0.0, 1.0], "doc.pdf", 1, 2, 2),
+        ])
+
+        cursor = npstore.begin_document(store, "doc.pdf")
+        npstore.write_chunks(cursor, [("new", [0.0, 1.0], "doc.pdf", 1, 2, 2)])
+        npstore.finish_document(cursor, "doc.pdf", "hash", ["p1", "p2"],
+                                kept_rows=[(0, 0, 1, 1)], delete_ids=[1])
+        store.commit()
+
+        assert npstore.get_document(store, "doc.pdf") == ("hash", {1: "p1", 2: "p2"})
+        assert npstore.get_source_chunks(store, "doc.pdf") == [
+            (0, "stays", 0, 1, 1),
+            (2, "new", 1, 2, 2),
+        ]
+
+
+class TestIngestWithNumpyStore:
+    def test_ingest_and_retrieve_without_postgres(self, tmp_path, capsys):
+        from tests.pdf_fixtures import make_pdf
+        from ingest import ingest
+        from retriever import retrieve
+
+        def fake_embeddings(texts, cache=None):
+            return [[1.0, float("cats" in text)] for text in texts]
+
+        path = make_pdf(tmp_path / "doc.pdf", ["All about dogs. ", "All about cats."])
+        store = NumpyStore(str(tmp_path / "store"))
+
+        with patch('ingest.get_embeddings', side_effect=fake_embeddings):
+            ingest(store, path)
+            ingest(store, path)
+
+        with patch('retriever.get_embeddings', return_value=[[0.0, 1.0]]):
+            result = retrieve(store, "cats?", top_k=1)
+
+        assert "cats" in result[0]
+        assert "is unchanged, skipping ingest" in capsys.readouterr().out
+
+
+class TestCheckpoints:
+    def test_saved_checkpoints_survive_reopening(self, tmp_path):
+        path = str(tmp_path / "store")
+        store = NumpyStore(path)
+        assert npstore.get_checkpoints(store) == {}
+
+        npstore.save_checkpoint(store, "a.pdf", 100, 1.5, "done", chunks=3)
+        npstore.save_checkpoint(store, "b.pdf", 7, 2.0, "failed", error="PdfReadError: bad")
+
+        assert npstore.get_checkpoints(NumpyStore(path)) == {
+            "a.pdf": (100, 1.5, "done"),
+            "b.pdf": (7, 2.0, "failed"),
+        }
+
+
+    def test_commits_and_checkpoints_leave_meta_json_alone(self, store):
+        insert_chunk(store, "first", [1.0, 0.0], "a.pdf", 0)
+        meta = os.path.getmtime(os.path.join(store.path, "meta.json"))
+
+        with patch.object(store, '_write_meta') as write_meta:
+            cursor = npstore.begin_document(store, "b.pdf")
+            npstore.write_chunks(cursor, [("second", [0.0, 1.0], "b.pdf", 0, 1, 1)])
+            npstore.finish_document(cursor, "b.pdf", "h", ["p1"])
+            store.commit()
+            npstore.save_checkpoint(store, "b.pdf", 10, 1.0, "done", chunks=1)
+
+        write_meta.assert_not_called()
+        assert os.path.getmtime(os.path.join(store.path, "meta.json")) == meta
+        assert npstore.get_document(NumpyStore(store.path), "b.pdf") == ("h", {1: "p1"})
+
+    def test_registry_in_meta_json_is_moved_to_sqlite(self, tmp_path):
+        path = tmp_path / "store"
+        path.mkdir()
+        (path / "meta.json").write_text(json.dumps({
+            "dimensions": 2, "row_format": npstore.ROW_FORMAT, "sources": ["a.pdf", "b.pdf"],
+            "documents": {"a.pdf": {"file_hash": "h", "pages": ["p1", "p2"]}},
+            "checkpoints": {"a.pdf": {"file_size": 5, "modified_at": 1.0, "status": "done",
+                                      "chunks": 2, "error": None}},
+        }))
+
+        store = NumpyStore(str(path))
+
+        assert store.sources == ["a.pdf", "b.pdf"]
+        assert npstore.get_document(store, "a.pdf") == ("h", {1: "p1", 2: "p2"})
+        assert npstore.get_checkpoints(store) == {"a.pdf": (5, 1.0, "done")}
+        assert set(json.loads((path / "meta.json").read_text())) == {"dimensions", "row_format"}
+        assert NumpyStore(str(path)).sources == ["a.pdf", "b.pdf"]
+
+
+class TestDocumentVersion:
+    def test_changes_when_a_document_is_reingested(self, store):
+        empty = npstore.document_version(store)
+        cursor = npstore.begin_document(store, "doc.pdf")
+        npstore.finish_document(cursor, "doc.pdf", "hash-1", [])
+        store.commit()
+        first = npstore.document_version(store)
+        cursor = npstore.begin_document(store, "doc.pdf")
+        npstore.finish_document(cursor, "doc.pdf", "hash-2", [])
+        store.commit()
+
+        assert len({empty, first, npstore.document_version(store)}) == 3
+
+
+class TestSearchWithDistance:
+    def test_appends_cosine_distance(self, store):
+        insert_chunks(store, [
+            ("east", [1.0, 0.0], "doc.pdf", 0),
+            ("north", [0.0, 1.0], "doc.pdf", 1),
+        ])
+
+        result = search_chunks(store, [1.0, 0.0], top_k=2, with_distance=True)
+
+        assert [row[:4] for row in result] == [(0, "east", "doc.pdf", 0), (1, "north", "doc.pdf", 1)]
+        assert result[0][4] == pytest.approx(0.0)
+        assert result[1][4] == pytest.approx(1.0)
+
+
+class TestChunkOffsets:
+    def test_offsets_are_stored_and_updated_for_kept_rows(self, store):
+        insert_chunks(store, [("old", [1.0, 0.0], "doc.pdf", 0, 1, 1, 0, 3)])
+
+        cursor = npstore.begin_document(store, "doc.pdf")
+        npstore.finish_document(cursor, "doc.pdf", "hash", ["p"], kept_rows=[(0, 0, 1, 1, 10, 13)])
+        store.commit()
+
+        assert (store.rows["start_offset"][0], store.rows["end_offset"][0]) == (10, 13)
+
+    def test_rows_without_offsets(self, store):
+        insert_chunks(store, [("text", [1.0, 0.0], "doc.pdf", 0)])
+
+        assert store.rows["start_offset"][0] == npstore.NO_OFFSET
+
+    def test_migrates_stores_without_offsets(self, tmp_path):
+        import json
+        path = tmp_path / "old"
+        path.mkdir()
+        old_rows = np.zeros(2, dtype=np.dtype(npstore._ROW_FIELDS_V1))
+        old_rows["length"] = [5, 5]
+        old_rows["chunk_index"] = [0, 1]
+        old_rows["alive"] = 1
+        old_rows["offset"] = [0, 5]
+        old_rows.tofile(path / "rows.bin")
+        np.array([[1.0, 0.0], [0.0, 1.0]], dtype=np.float32).tofile(path / "vectors.f32")
+        (path / "contents.txt").write_bytes(b"firstsecnd")
+        (path / "meta.json").write_text(json.dumps({"dimensions": 2, "sources": ["doc.pdf"], "documents": {}}))
+
+        store = NumpyStore(str(path))
+
+        assert search_chunks(store, [0.0, 1.0], top_k=1) == [(1, "secnd", "doc.pdf", 1)]
+        assert list(store.rows["start_offset"]) == [npstore.NO_OFFSET] * 2
+        assert json.loads((path / "meta.json").read_text())["row_format"] == npstore.ROW_FORMAT
+        assert NumpyStore(str(path)).count == 2
+
+
+class TestResizeEmbeddings:
+    def test_keeps_prefix_at_unit_length(self, store):
+        insert_chunks(store, [
+            ("a", [3.0, 4.0, 5.0], "doc.pdf", 0),
+            ("b", [0.0, 1.0, 9.0], "doc.pdf", 1),
+        ])
+
+        npstore.resize_embeddings(store, 2)
+
+        assert store.vectors.shape == (2, 2)
+        np.testing.assert_allclose(store.vectors[0], [0.6, 0.8], rtol=1e-6)
+        assert search_chunks(store, [0.0, 1.0], top_k=1)[0][1] == "b"
+        insert_chunks(store, [("c", [1.0, 0.0], "doc.pdf", 2)])
+        assert NumpyStore(store.path).vectors.shape == (3, 2)
+
+    def test_cannot_grow_embeddings(self, store):
+        insert_chunks(store, [("a", [1.0, 0.0], "doc.pdf", 0)])
+
+        with pytest.raises(ValueError):
+            npstore.resize_embeddings(store, 3)
+
+    def test_interrupted_resize_is_finished_on_open(self, store):
+        insert_chunks(store, [("a", [3.0, 4.0, 5.0], "doc.pdf", 0)])
+        np.array([[0.6, 0.8]], dtype=np.float32).tofile(store._file("vectors.f32.new"))
+        store.meta["dimensions"] = 2
+        store._write_meta()
+
+        reopened = NumpyStore(store.path)
+
+        assert reopened.vectors.shape == (1, 2)
+
+    def test_resize_interrupted_before_meta_is_discarded(self, store):
+        insert_chunks(store, [("a", [3.0, 4.0, 5.0], "doc.pdf", 0)])
+        np.array([[0.6, 0.8]], dtype=np.float32).tofile(store._file("vectors.f32.new"))
+
+        reopened = NumpyStore(store.path)
+
+        assert reopened.vectors.shape == (1, 3)
+        assert not os.path.exists(store._file("vectors.f32.new"))
+
+
+class TestConcurrentReads:
+    def test_searches_during_appends_see_consistent_arrays(self, store):
+        import threading
+        insert_chunk(store, "seed", [1.0, 0.0], "doc.pdf", 0)
+        errors = []
+        done = threading.Event()
+
+        def search():
+            while not done.is_set():
+                try:
+                    search_chunks(store, [1.0, 0.0], top_k=3)
+                    npstore.search_chunks_many(store, [[0.0, 1.0]], top_k=3)
+                except Exception as exc:
+                    errors.append(exc)
+                    return
+
+        readers = [threading.Thread(target=search) for _ in range(2)]
+        for reader in readers:
+            reader.start()
+        try:
+            for i in range(300):
+                store.append([(f"c{i}", [1.0, float(i)], "doc.pdf", i)])
+        finally:
+            done.set()
+            for reader in readers:
+                reader.join()
+
+        assert errors == []
@@ -0,0 +1,91 @@
+import pytest
+from chunker import chunk_by_sentences
+from packer import pack_context, merge_overlap
+
+
+TEXT = " ".join(f"Sentence number {i} is here." for i in range(40))
+
+
+class TestMergeOverlap:
+    def test_strips_repeated_sentences(self):
+        assert merge_overlap("A one. B two. C three.", "B two. C three. D four.") == (
+            "A one. B two. C three. D four."
+        )
+
+    def test_no_overlap_joins_with_space(self):
+        assert merge_overlap("A one.", "B two.") == "A one. B two."
+
+    def test_partial_sentence_match_is_not_overlap(self):
+        assert merge_overlap("A one. B two.", "two. C three.") == "A one. B two. two. C three."
+
+    def test_contained_chunk_adds_nothing(self):
+        assert merge_overlap("A one. B two.", "B two.") == "A one. B two."
+
+    def test_consecutive_chunker_output_rebuilds_the_text(self):
+        chunks = chunk_by_sentences(TEXT, max_chunk_size=20, overlap=2)
+        merged = chunks[0]
+        for chunk in chunks[1:]:
+            merged = merge_overlap(merged, chunk)
+
+        assert len(chunks) > 3
+        assert merged == TEXT
+
+
+class TestPackContext:
+    def test_merges_adjacent_chunks_of_a_source(self):
+        chunks = chunk_by_sentences(TEXT, max_chunk_size=20, overlap=2)
+        hits = [(10 + i, chunks[i], "doc.pdf", i) for i in (2, 1)]
+
+        assert pack_context(hits) == [merge_overlap(chunks[1], chunks[2])]
+
+    def test_keeps_other_sources_and_gaps_separate(self):
+        hits = [
+            (1, "A one.", "a.pdf", 0),
+            (2, "B two.", "b.pdf", 1),
+            (3, "C three.", "a.pdf", 2),
+        ]
+
+        assert pack_context(hits) == ["A one.", "B two.", "C three."]
+
+    def test_orders_passages_by_best_hit(self):
+        hits = [
+            (1, "Best.", "b.pdf", 7),
+            (2, "Second.", "a.pdf", 0),
+            (3, "Third.", "a.pdf", 1),
+        ]
+
+        assert pack_context(hits) == ["Best.", "Second. Third."]
+
+    def test_drops_hits_beyond_distance_cutoff(self):
+        hits = [
+            (1, "Close.", "a.pdf", 0, 0.2),
+            (2, "Far.", "a.pdf", 5, 0.8),
+        ]
+
+        assert pack_context(hits, max_distance=0.5) == ["Close."]
+        assert pack_context(hits, max_distance=0.1) == []
+
+    def test_keeps_hits_without_a_distance(self):
+        hits = [
+            (1, "Far.", "a.pdf", 0, 0.8),
+            (2, "Full-text match.", "b.pdf", 0, None),
+        ]
+
+        assert pack_context(hits, max_distance=0.5) == ["Full-text match."]
+
+    def test_fills_token_budget_in_relevance_order(self):
+        hits = [
+            (1, "a" * 400, "a.pdf", 0),
+            (2, "b" * 400, "a.pdf", 5),
+            (3, "c" * 40, "a.pdf", 9),
+        ]
+
+        assert pack_context(hits, token_budget=150) == ["a" * 400, "c" * 40]
+
+    def test_best_passage_is_kept_over_budget(self):
+        hits = [(1, "a" * 4000, "a.pdf", 0)]
+
+        assert pack_context(hits, token_budget=10) == ["a" * 4000]
+
+    def test_no_hits(self):
+        assert pack_context([]) == []
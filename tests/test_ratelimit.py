@@ -0,0 +1,284 @@
+import asyncio
+import json
+import threading
+import time
+import pytest
+from unittest.mock import Mock
+import openai
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import ratelimit
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def rate_limit_error(headers=None, code=None):
+    response = Mock(status_code=429, headers=headers or {})
+    body = {"code": code} if code else None
+    return openai.RateLimitError("rate limited", response=response, body=body)
+
+
+class FakeOpenAI(BaseHTTPRequestHandler):
+    # Answers /v1/embeddings, throttling the first `throttle` requests.
+    throttle = 0
+    requests = 0
+    lock = threading.Lock()
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers["Content-Length"]))
+        with self.lock:
+            type(self).requests += 1
+            throttled = self.requests <= self.throttle
+        if throttled:
+            self._reply(429, {"error": {"message": "Rate limit reached", "type": "requests", "code": "rate_limit_exceeded"}},
+                        {"retry-after-ms": "20", "x-ratelimit-limit-requests": "600",
+                         "x-ratelimit-remaining-requests": "0", "x-ratelimit-reset-requests": "20ms"})
+        else:
+            self._reply(200, {"object": "list", "model": "test",
+                              "data": [{"object": "embedding", "index": 0, "embedding": [0.1, 0.2]}],
+                              "usage": {"prompt_tokens": 1, "total_tokens": 1}},
+                        {"x-ratelimit-limit-requests": "600", "x-ratelimit-remaining-requests": "599",
+                         "x-ratelimit-limit-tokens": "90000", "x-ratelimit-remaining-tokens": "89000"})
+
+    def _reply(self, status, payload, headers):
+        body = json.dumps(payload).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        for name, value in headers.items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def fake_server():
+    FakeOpenAI.requests = 0
+    FakeOpenAI.throttle = 0
+    server = ThreadingHTTPServer(("127.0.0.1", 0), FakeOpenAI)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield f"http://127.0.0.1:{server.server_address[1]}/v1"
+    server.shutdown()
+    server.server_close()
+
+
+class TestTokenBucket:
+    def test_waits_once_capacity_is_spent(self):
+        clock = FakeClock()
+        bucket = ratelimit.TokenBucket(60, capacity=2, clock=clock)
+
+        assert bucket.take(1) == 0
+        assert bucket.take(1) == 0
+        assert bucket.take(1) == pytest.approx(1.0)
+        assert bucket.take(1) == pytest.approx(2.0)
+
+        clock.now = 10
+        assert bucket.take(1) == 0
+
+    def test_sync_adopts_reported_quota(self):
+        bucket = ratelimit.TokenBucket(60, clock=FakeClock())
+
+        bucket.sync(limit=600, remaining=0)
+
+        assert bucket.rate == 10
+        assert bucket.take(1) == pytest.approx(0.1)
+
+
+class TestAdaptiveSlots:
+    def test_freed_slot_goes_to_higher_priority(self):
+        slots = ratelimit.AdaptiveSlots(1, 4)
+        slots.acquire()
+        order = []
+
+        def waiter(name, level):
+            slots.acquire(level)
+            order.append(name)
+            slots.release()
+
+        ingest = threading.Thread(target=waiter, args=("ingest", ratelimit.PRIORITIES["ingest"]))
+        ingest.start()
+        time.sleep(0.05)
+        query = threading.Thread(target=waiter, args=("query", ratelimit.PRIORITIES["query"]))
+        query.start()
+        time.sleep(0.05)
+        slots.release()
+        ingest.join()
+        query.join()
+
+        assert order == ["query", "ingest"]
+
+    def test_resize_is_bounded(self):
+        slots = ratelimit.AdaptiveSlots(4, 8)
+
+        slots.resize(0)
+        assert slots.limit == 1
+        slots.resize(100)
+        assert slots.limit == 8
+
+    def test_cancelled_async_waiter_gives_up_its_place(self):
+        slots = ratelimit.AdaptiveSlots(1, 1)
+
+        async def run():
+            await slots.acquire_async()
+            waiting = asyncio.ensure_future(slots.acquire_async())
+            await asyncio.sleep(0)
+            waiting.cancel()
+            with pytest.raises(asyncio.CancelledError):
+                await waiting
+            slots.release()
+            await asyncio.wait_for(slots.acquire_async(), 1)
+
+        asyncio.run(run())
+        assert slots.active == 1
+
+
+class TestScheduler:
+    def test_concurrency_climbs_with_successes(self):
+        scheduler = ratelimit.Scheduler(initial_concurrency=2, max_concurrency=3)
+
+        for _ in range(10):
+            scheduler.call(lambda: "ok")
+
+        assert scheduler.slots.limit == 3
+        assert scheduler.stats()["calls"] == 10
+
+    def test_retries_rate_limits_and_halves_concurrency(self):
+        scheduler = ratelimit.Scheduler(initial_concurrency=8, base_delay=0.001)
+        failures = [rate_limit_error(), rate_limit_error()]
+
+        def request():
+            if failures:
+                raise failures.pop()
+            return "ok"
+
+        assert scheduler.call(request) == "ok"
+        assert scheduler.retries == 2
+        assert scheduler.throttled == 2
+        assert scheduler.slots.limit < 8
+
+    def test_gives_up_after_max_retries(self):
+        scheduler = ratelimit.Scheduler(max_retries=2, base_delay=0.001)
+        attempts = []
+
+        def request():
+            attempts.append(1)
+            raise rate_limit_error()
+
+        with pytest.raises(openai.RateLimitError):
+            scheduler.call(request)
+        assert len(attempts) == 3
+
+    def test_does_not_retry_other_errors(self):
+        scheduler = ratelimit.Scheduler()
+        attempts = []
+
+        def request():
+            attempts.append(1)
+            raise ValueError("bad request")
+
+        with pytest.raises(ValueError):
+            scheduler.call(request)
+        with pytest.raises(openai.RateLimitError):
+            scheduler.call(lambda: (_ for _ in ()).throw(rate_limit_error(code="insufficient_quota")))
+        assert len(attempts) == 1
+        assert scheduler.slots.active == 0
+
+    def test_waits_at_least_retry_after(self):
+        scheduler = ratelimit.Scheduler(base_delay=0.001)
+
+        delay = scheduler._failed(rate_limit_error({"retry-after": "2"}), 0)
+
+        assert delay >= 2
+
+    def test_call_async(self):
+        scheduler = ratelimit.Scheduler(base_delay=0.001)
+        failures = [rate_limit_error()]
+
+        async def request():
+            if failures:
+                raise failures.pop()
+            return "ok"
+
+        assert asyncio.run(scheduler.call_async(request)) == "ok"
+        assert scheduler.retries == 1
+
+
+class TestHeaders:
+    def test_parse_duration(self):
+        assert ratelimit.parse_duration("6m0s") == 360
+        assert ratelimit.parse_duration("1.5s") == 1.5
+        assert ratelimit.parse_duration("20ms") == pytest.approx(0.02)
+        assert ratelimit.parse_duration("") == 0
+
+    def test_retry_after_prefers_milliseconds(self):
+        assert ratelimit._retry_after({"retry-after-ms": "250", "retry-after": "3"}) == 0.25
+        assert ratelimit._retry_after({"retry-after": "3"}) == 3
+        assert ratelimit._retry_after({"x-ratelimit-remaining-tokens": "0", "x-ratelimit-reset-tokens": "2s"}) == 2
+        assert ratelimit._retry_after({"x-ratelimit-remaining-tokens": "5", "x-ratelimit-reset-tokens": "2s"}) == 0
+
+    def test_observe_headers_syncs_buckets(self):
+        scheduler = ratelimit.Scheduler()
+
+        scheduler.observe_headers({"x-ratelimit-limit-requests": "500", "x-ratelimit-limit-tokens": "30000"})
+
+        assert scheduler.stats()["requests_per_minute"] == pytest.approx(500)
+        assert scheduler.stats()["tokens_per_minute"] == pytest.approx(30000)
+
+
+class TestPriority:
+    def test_sets_priority_for_block(self):
+        assert ratelimit._priority.get() == "query"
+        with ratelimit.priority("ingest"):
+            assert ratelimit._priority.get() == "ingest"
+        assert ratelimit._priority.get() == "query"
+
+    def test_rejects_unknown_priority(self):
+        with pytest.raises(ValueError):
+            with ratelimit.priority("urgent"):
+                pass
+
+    def test_scheduler_is_shared_per_model(self):
+        assert ratelimit.scheduler_for("model-a") is ratelimit.scheduler_for("model-a")
+        assert ratelimit.scheduler_for("model-a") is not ratelimit.scheduler_for("model-b")
+
+
+class TestFakeServer:
+    def test_recovers_from_429s(self, fake_server):
+        FakeOpenAI.throttle = 2
+        client = openai.OpenAI(base_url=fake_server, api_key="test", max_retries=0,
+                               http_client=ratelimit.http_client())
+        scheduler = ratelimit.Scheduler(initial_concurrency=8, base_delay=0.001)
+
+        response = scheduler.call(lambda: client.embeddings.create(model="test", input=["hello"]))
+
+        assert response.data[0].embedding == [0.1, 0.2]
+        assert FakeOpenAI.requests == 3
+        assert scheduler.throttled == 2
+        assert scheduler.slots.limit < 8
+        # The success's headers reached the scheduler through the client hook.
+        assert scheduler.stats()["requests_per_minute"] == pytest.approx(600)
+        assert scheduler.stats()["tokens_per_minute"] == pytest.approx(90000)
+
+    def test_async_client(self, fake_server):
+        FakeOpenAI.throttle = 1
+        scheduler = ratelimit.Scheduler(base_delay=0.001)
+
+        async def run():
+            client = openai.AsyncOpenAI(base_url=fake_server, api_key="test", max_retries=0,
+                                        http_client=ratelimit.async_http_client())
+            return await scheduler.call_async(lambda: client.embeddings.create(model="test", input=["hello"]))
+
+        response = asyncio.run(run())
+
+        assert response.data[0].embedding == [0.1, 0.2]
+        assert scheduler.throttled == 1
+        assert scheduler.stats()["tokens_per_minute"] == pytest.approx(90000)
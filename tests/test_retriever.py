@@ -1,5 +1,6 @@
 import pytest
-from unittest.mock import Mock, patch
+from unittest.mock import Mock, call, patch
+from packer import pack_context
 
 
 class TestRetrieve:
@@ -101,3 +102,181 @@ class TestRetrieve:
         assert result == ["the actual content"]
         assert 99 not in result
         assert "ignored_source.pdf" not in result
+
+
+class TestHybridRetrieve:
+    @patch('retriever.hybrid_search_chunks')
+    @patch('retriever.search_chunks')
+    @patch('retriever.get_embeddings')
+    def test_hybrid_passes_query_text_and_embedding(
+        self, mock_get_embeddings, mock_search_chunks, mock_hybrid
+    ):
+        mock_get_embeddings.return_value = [[0.5, 0.6]]
+        mock_hybrid.return_value = [(1, "E-1042 content", "doc.pdf", 0)]
+        mock_conn = Mock()
+
+        from retriever import retrieve
+        result = retrieve(mock_conn, "E-1042", top_k=3, hybrid=True)
+
+        assert result == ["E-1042 content"]
+        mock_hybrid.assert_called_once_with(mock_conn, "E-1042", [0.5, 0.6], 3, with_distance=False)
+        mock_search_chunks.assert_not_called()
+
+    @patch('retriever.HYBRID_SEARCH', True)
+    @patch('retriever.hybrid_search_chunks')
+    @patch('retriever.get_embeddings')
+    def test_hybrid_enabled_by_configuration(self, mock_get_embeddings, mock_hybrid):
+        mock_get_embeddings.return_value = [[0.1]]
+        mock_hybrid.return_value = []
+
+        from retriever import retrieve
+        retrieve(Mock(), "query")
+
+        mock_hybrid.assert_called_once()
+
+
+class TestRetrieveMany:
+    @patch('retriever.search_chunks_many')
+    @patch('retriever.get_embeddings')
+    def test_embeds_all_queries_in_one_call(self, mock_get_embeddings, mock_search_many):
+        mock_get_embeddings.return_value = [[0.1], [0.2]]
+        mock_search_many.return_value = [
+            [(1, "first answer", "doc.pdf", 0)],
+            [(2, "second answer", "doc.pdf", 1), (3, "more", "doc.pdf", 2)],
+        ]
+        mock_conn = Mock()
+
+        from retriever import retrieve_many
+        result = retrieve_many(mock_conn, ["q1", "q2"], top_k=2)
+
+        assert result == [["first answer"], ["second answer", "more"]]
+        mock_get_embeddings.assert_called_once_with(["q1", "q2"])
+        mock_search_many.assert_called_once_with(mock_conn, [[0.1], [0.2]], 2, with_distance=False)
+
+    @patch('retriever.search_chunks_many')
+    @patch('retriever.get_embeddings')
+    def test_no_queries(self, mock_get_embeddings, mock_search_many):
+        from retriever import retrieve_many
+        assert retrieve_many(Mock(), []) == []
+        mock_get_embeddings.assert_not_called()
+
+    @patch('retriever.search_chunks_many')
+    @patch('retriever.hybrid_search_chunks')
+    @patch('retriever.get_embeddings')
+    def test_hybrid_searches_each_query(self, mock_get_embeddings, mock_hybrid, mock_search_many):
+        mock_get_embeddings.return_value = [[0.1], [0.2]]
+        mock_hybrid.side_effect = [[(1, "first", "doc.pdf", 0)], [(2, "second", "doc.pdf", 1)]]
+        mock_conn = Mock()
+
+        from retriever import retrieve_many
+        result = retrieve_many(mock_conn, ["q1", "q2"], top_k=2, hybrid=True)
+
+        assert result == [["first"], ["second"]]
+        assert mock_hybrid.call_args_list == [
+            call(mock_conn, "q1", [0.1], 2, with_distance=False),
+            call(mock_conn, "q2", [0.2], 2, with_distance=False),
+        ]
+        mock_get_embeddings.assert_called_once_with(["q1", "q2"])
+        mock_search_many.assert_not_called()
+
+    @patch('retriever.pack_context', side_effect=lambda hits: pack_context(hits, max_distance=0.5))
+    @patch('retriever.search_chunks_many')
+    @patch('retriever.get_embeddings')
+    def test_pack_applies_the_distance_cutoff(self, mock_get_embeddings, mock_search_many, mock_pack):
+        mock_get_embeddings.return_value = [[0.1], [0.2]]
+        mock_search_many.return_value = [
+            [(1, "close", "doc.pdf", 0, 0.1), (2, "far", "doc.pdf", 5, 0.9)],
+            [(3, "too far", "doc.pdf", 1, 0.8)],
+        ]
+        mock_conn = Mock()
+
+        from retriever import retrieve_many
+        result = retrieve_many(mock_conn, ["q1", "q2"], pack=True)
+
+        assert result == [["close"], []]
+        mock_search_many.assert_called_once_with(mock_conn, [[0.1], [0.2]], 5, with_distance=True)
+
+
+class TestQueryCache:
+    @patch('retriever.search_chunks')
+    @patch('retriever.get_embeddings')
+    def test_repeated_query_is_embedded_once(self, mock_get_embeddings, mock_search_chunks):
+        mock_get_embeddings.return_value = [[0.1, 0.2]]
+        mock_search_chunks.return_value = []
+        from retriever import retrieve
+        from embedcache import QueryCache
+        cache = QueryCache()
+
+        retrieve(Mock(), "What is AI?", query_cache=cache)
+        retrieve(Mock(), "what is ai?", query_cache=cache)
+
+        mock_get_embeddings.assert_called_once_with(["What is AI?"])
+        assert mock_search_chunks.call_args[0][1] == [0.1, 0.2]
+
+    @patch('retriever.search_chunks_many')
+    @patch('retriever.get_embeddings')
+    def test_batch_embeds_only_uncached_queries(self, mock_get_embeddings, mock_search_many):
+        from retriever import retrieve_many
+        from embedder import EMBEDDING_MODEL, EMBEDDING_DIMENSIONS
+        from embedcache import QueryCache
+        cache = QueryCache()
+        cache.put(EMBEDDING_MODEL, EMBEDDING_DIMENSIONS, "q1", [0.1])
+        mock_get_embeddings.return_value = [[0.2]]
+        mock_search_many.return_value = [[], []]
+        conn = Mock()
+
+        retrieve_many(conn, ["q1", "q2"], query_cache=cache)
+
+        mock_get_embeddings.assert_called_once_with(["q2"])
+        mock_search_many.assert_called_once_with(conn, [[0.1], [0.2]], 5, with_distance=False)
+
+
+class TestRetrieveAsync:
+    @patch('retriever.search_chunks_async')
+    @patch('retriever.get_embeddings_async')
+    def test_embeds_and_searches(self, mock_get_embeddings, mock_search):
+        import asyncio
+        mock_get_embeddings.return_value = [[0.1, 0.2]]
+        mock_search.return_value = [(1, "content", "doc.pdf", 0)]
+        conn = Mock()
+
+        from retriever import retrieve_async
+        result = asyncio.run(retrieve_async(conn, "query", top_k=3, hybrid=False))
+
+        assert result == ["content"]
+        mock_get_embeddings.assert_awaited_once_with(["query"])
+        mock_search.assert_awaited_once_with(conn, [0.1, 0.2], 3)
+
+
+class TestPackedRetrieve:
+    @patch('retriever.search_chunks')
+    @patch('retriever.get_embeddings')
+    def test_packs_scored_results(self, mock_get_embeddings, mock_search_chunks):
+        mock_get_embeddings.return_value = [[0.1]]
+        mock_search_chunks.return_value = [
+            (2, "B two. C three.", "doc.pdf", 1, 0.1),
+            (1, "A one. B two.", "doc.pdf", 0, 0.2),
+        ]
+        conn = Mock()
+
+        from retriever import retrieve
+        result = retrieve(conn, "query", hybrid=False, pack=True)
+
+        assert result == ["A one. B two. C three."]
+        mock_search_chunks.assert_called_once_with(conn, [0.1], 5, with_distance=True)
+
+    @patch('retriever.hybrid_search_chunks')
+    @patch('retriever.get_embeddings')
+    def test_hybrid_packing_gets_distances(self, mock_get_embeddings, mock_hybrid):
+        mock_get_embeddings.return_value = [[0.1]]
+        hits = [(1, "Close hit.", "a.pdf", 0, 0.2), (2, "Full-text hit.", "b.pdf", 0, None)]
+        mock_hybrid.return_value = hits
+        conn = Mock()
+
+        from retriever import retrieve
+        with patch('retriever.pack_context', return_value=["packed"]) as mock_pack:
+            result = retrieve(conn, "query", hybrid=True, pack=True)
+
+        assert result == ["packed"]
+        mock_pack.assert_called_once_with(hits)
+        mock_hybrid.assert_called_once_with(conn, "query", [0.1], 5, with_distance=True)
@@ -0,0 +1,154 @@
+import json
+import threading
+import urllib.error
+import urllib.request
+import pytest
+from unittest.mock import Mock, patch
+import store
+from server import AskServer
+
+
+@pytest.fixture
+def server(tmp_path):
+    with patch('store.NUMPY_STORE_PATH', str(tmp_path / "store")):
+        pool = store.ConnectionPool(4, "numpy")
+    server = AskServer(("127.0.0.1", 0), pool, workers=4)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+    thread.join()
+
+
+def post(server, path, payload):
+    request = urllib.request.Request(
+        f"http://127.0.0.1:{server.server_port}{path}",
+        data=json.dumps(payload).encode("utf-8"),
+        headers={"Content-Type": "application/json"},
+    )
+    try:
+        with urllib.request.urlopen(request, timeout=5) as response:
+            return response.status, json.loads(response.read())
+    except urllib.error.HTTPError as error:
+        return error.code, json.loads(error.read())
+
+
+class TestAskServer:
+    @patch('server.retrieve')
+    def test_retrieve_returns_chunks(self, mock_retrieve, server):
+        mock_retrieve.return_value = ["chunk one", "chunk two"]
+
+        status, body = post(server, "/retrieve", {"query": "what?", "top_k": 2})
+
+        assert (status, body) == (200, {"chunks": ["chunk one", "chunk two"]})
+        args, kwargs = mock_retrieve.call_args
+        assert args[1:] == ("what?", 2)
+        assert kwargs["query_cache"] is server.query_cache
+
+    @patch('server.ask')
+    def test_ask_returns_answer(self, mock_ask, server):
+        mock_ask.return_value = "42"
+
+        status, body = post(server, "/ask", {"question": "meaning?"})
+
+        assert (status, body) == (200, {"answer": "42"})
+        assert mock_ask.call_args[0][1:] == ("meaning?", server.answer_cache, server.query_cache)
+
+    @patch('server.ingest')
+    def test_ingest_uses_pooled_connection(self, mock_ingest, server, tmp_path):
+        pdf = tmp_path / "doc.pdf"
+        pdf.write_bytes(b"%PDF")
+
+        status, body = post(server, "/ingest", {"path": str(pdf)})
+
+        assert (status, body) == (200, {"ingested": str(pdf)})
+        mock_ingest.assert_called_once()
+
+    def test_ingest_missing_file_is_404(self, server, tmp_path):
+        status, body = post(server, "/ingest", {"path": str(tmp_path / "missing.pdf")})
+
+        assert status == 404
+
+    @patch('server.retrieve')
+    def test_metrics_endpoints(self, mock_retrieve, server):
+        import metrics
+        mock_retrieve.return_value = []
+        metrics.reset()
+        metrics.enable()
+        try:
+            with metrics.span("search"):
+                pass
+            url = f"http://127.0.0.1:{server.server_port}"
+            with urllib.request.urlopen(url + "/metrics", timeout=5) as response:
+                text = response.read().decode("utf-8")
+                content_type = response.headers["Content-Type"]
+            with urllib.request.urlopen(url + "/metrics.json", timeout=5) as response:
+                body = json.loads(response.read())
+        finally:
+            metrics.enable(False)
+            metrics.reset()
+
+        assert content_type.startswith("text/plain")
+        assert 'askpdf_stage_seconds_count{stage="search"} 1' in text
+        assert body["histograms"]["search"]["count"] == 1
+
+    def test_missing_field_is_400(self, server):
+        status, body = post(server, "/ask", {})
+
+        assert (status, body) == (400, {"error": "Missing field: question"})
+
+    def test_unknown_endpoint_is_404(self, server):
+        assert post(server, "/nope", {})[0] == 404
+
+    @patch('server.retrieve')
+    def test_failure_is_500(self, mock_retrieve, server):
+        mock_retrieve.side_effect = RuntimeError("database is down")
+
+        assert post(server, "/retrieve", {"query": "q"}) == (500, {"error": "database is down"})
+
+    @patch('server.retrieve')
+    def test_concurrency_is_bounded_by_workers(self, mock_retrieve, server):
+        state = {"active": 0, "peak": 0}
+        lock = threading.Lock()
+        release = threading.Event()
+
+        def slow_retrieve(*args, **kwargs):
+            with lock:
+                state["active"] += 1
+                state["peak"] = max(state["peak"], state["active"])
+            release.wait(0.2)
+            with lock:
+                state["active"] -= 1
+            return []
+        mock_retrieve.side_effect = slow_retrieve
+
+        threads = [threading.Thread(target=post, args=(server, "/retrieve", {"query": "q"})) for _ in range(10)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        assert state["peak"] == 4
+
+    @patch('server.retrieve')
+    def test_idle_keep_alive_clients_do_not_hold_workers(self, mock_retrieve, server):
+        import http.client
+        import time
+        mock_retrieve.return_value = []
+        idle = []
+        for _ in range(6):
+            client = http.client.HTTPConnection("127.0.0.1", server.server_port, timeout=5)
+            client.request("POST", "/retrieve", body=json.dumps({"query": "q"}),
+                           headers={"Content-Type": "application/json"})
+            client.getresponse().read()
+            idle.append(client)
+
+        start = time.perf_counter()
+        status, _ = post(server, "/retrieve", {"query": "q"})
+        elapsed = time.perf_counter() - start
+        for client in idle:
+            client.close()
+
+        assert status == 200
+        assert elapsed < 1
@@ -0,0 +1,116 @@
+import pytest
+from unittest.mock import Mock, patch
+import npstore
+import store
+import vectordb
+
+
+class TestBackendFor:
+    def test_postgres_connection_uses_vectordb(self):
+        assert store.backend_for(Mock()) is vectordb
+
+    def test_numpy_store_uses_npstore(self, tmp_path):
+        conn = npstore.NumpyStore(str(tmp_path / "s"))
+
+        assert store.backend_for(conn) is npstore
+        assert store.backend_for(npstore.begin_document(conn, "doc.pdf")) is npstore
+
+
+class TestDispatch:
+    @patch('store.vectordb.search_chunks')
+    def test_search_goes_to_postgres_backend(self, mock_search):
+        conn = Mock()
+
+        store.search_chunks(conn, [0.1], 3)
+
+        mock_search.assert_called_once_with(conn, [0.1], 3)
+
+    def test_search_goes_to_numpy_backend(self, tmp_path):
+        conn = npstore.NumpyStore(str(tmp_path / "s"))
+        npstore.insert_chunk(conn, "text", [1.0], "doc.pdf", 0)
+
+        assert store.search_chunks(conn, [1.0], 1) == [(0, "text", "doc.pdf", 0)]
+
+
+class TestConnect:
+    def test_numpy_backend(self, tmp_path):
+        with patch('store.NUMPY_STORE_PATH', str(tmp_path / "s")):
+            conn = store.connect("numpy")
+
+        assert isinstance(conn, npstore.NumpyStore)
+
+    @patch('store.register_vector')
+    @patch('store.vectordb.create_schema')
+    @patch('store.psycopg2.connect')
+    def test_postgres_backend_creates_schema(self, mock_connect, mock_schema, mock_register):
+        conn = store.connect("postgres")
+
+        assert conn is mock_connect.return_value
+        mock_schema.assert_called_once_with(conn)
+        mock_register.assert_called_once_with(conn)
+
+    def test_unknown_backend_raises(self):
+        with pytest.raises(ValueError):
+            store.connect("sqlite")
+
+
+class TestConnectionPool:
+    @patch('store.register_vector')
+    @patch('store.vectordb.create_schema')
+    @patch('psycopg2.connect')
+    def test_registers_vector_once_per_pooled_connection(self, mock_connect, mock_schema, mock_register):
+        connections = [Mock(closed=False), Mock(closed=False)]
+        for conn in connections:
+            conn.info.transaction_status = 0
+        mock_connect.side_effect = connections
+
+        pool = store.ConnectionPool(2, "postgres")
+        for _ in range(5):
+            with pool.connection() as conn:
+                assert conn in connections
+
+        assert mock_connect.call_count == 2
+        assert [c[0][0] for c in mock_register.call_args_list] == connections
+        mock_schema.assert_called_once()
+
+    @patch('store.register_vector')
+    @patch('store.vectordb.create_schema')
+    @patch('psycopg2.connect')
+    def test_connection_is_returned_when_the_caller_fails(self, mock_connect, mock_schema, mock_register):
+        conn = Mock(closed=False)
+        conn.info.transaction_status = 0
+        mock_connect.return_value = conn
+        pool = store.ConnectionPool(1, "postgres")
+
+        with pytest.raises(RuntimeError):
+            with pool.connection():
+                raise RuntimeError("query failed")
+        with pool.connection() as again:
+            assert again is conn
+
+    def test_numpy_backend_shares_one_store(self, tmp_path):
+        with patch('store.NUMPY_STORE_PATH', str(tmp_path / "s")):
+            pool = store.ConnectionPool(4, "numpy")
+
+        with pool.connection() as first, pool.connection() as second:
+            assert first is second
+            assert isinstance(first, npstore.NumpyStore)
+        assert pool.shared
+
+
+class TestAsyncDispatch:
+    def test_numpy_search_runs_in_process(self, tmp_path):
+        import asyncio
+        conn = npstore.NumpyStore(str(tmp_path / "s"))
+        npstore.insert_chunk(conn, "text", [1.0], "doc.pdf", 0)
+
+        assert asyncio.run(store.search_chunks_async(conn, [1.0], 1)) == [(0, "text", "doc.pdf", 0)]
+
+    @patch('store.vectordb.search_chunks_async')
+    def test_postgres_search_awaits_async_query(self, mock_search):
+        import asyncio
+        mock_search.return_value = [(1, "row", "doc.pdf", 0)]
+        conn = Mock()
+
+        assert asyncio.run(store.search_chunks_async(conn, [0.1], 3)) == [(1, "row", "doc.pdf", 0)]
+        mock_search.assert_awaited_once_with(conn, [0.1], 3)
@@ -1,6 +1,11 @@
 import pytest
-from unittest.mock import Mock, MagicMock
-from vectordb import insert_chunk, search_chunks
+import struct
+from unittest.mock import Mock, MagicMock, patch
+from vectordb import (
+    insert_chunk, insert_chunks, search_chunks, create_schema, get_document,
+    create_vector_index, rebuild_vector_index, ivfflat_lists, measure_recall,
+    hybrid_search_chunks, search_chunks_many
+)
 
 
 class TestInsertChunk:
@@ -59,6 +64,132 @@ class TestInsertChunk:
         mock_conn.commit.assert_called_once()
 
 
+class TestInsertChunks:
+    def _mock_conn(self, ids):
+        mock_cursor = Mock()
+        mock_cursor.fetchall.return_value = [(i,) for i in ids]
+        mock_conn = Mock()
+        mock_conn.cursor.return_value = mock_cursor
+        return mock_conn, mock_cursor
+
+    def test_returns_ids_in_row_order(self):
+        mock_conn, mock_cursor = self._mock_conn([7, 8, 9])
+        rows = [
+            ("a", [0.1, 0.2], "doc.pdf", 0),
+            ("b", [0.3, 0.4], "doc.pdf", 1),
+            ("c", [0.5, 0.6], "doc.pdf", 2),
+        ]
+
+        result = insert_chunks(mock_conn, rows)
+
+        assert result == [7, 8, 9]
+
+    def test_reserves_one_id_per_row(self):
+        mock_conn, mock_cursor = self._mock_conn([1, 2])
+
+        insert_chunks(mock_conn, [("a", [0.1], "s", 0), ("b", [0.2], "s", 1)])
+
+        sql, params = mock_cursor.execute.call_args[0]
+        assert "nextval" in sql
+        assert params == (2,)
+
+    def test_streams_rows_with_single_binary_copy(self):
+        mock_conn, mock_cursor = self._mock_conn([1, 2])
+        captured = {}
+        mock_cursor.copy_expert.side_effect = (
+            lambda sql, f: captured.update(sql=sql, data=f.read())
+        )
+
+        insert_chunks(mock_conn, [("a", [0.1], "s", 0), ("b", [0.2], "s", 1)])
+
+        mock_cursor.copy_expert.assert_called_once()
+        assert "COPY documents" in captured["sql"]
+        assert "FORMAT binary" in captured["sql"]
+        assert captured["data"].startswith(b"PGCOPY\n\xff\r\n\x00")
+        assert captured["data"].endswith(struct.pack(">h", -1))
+
+    def test_encodes_vector_in_pgvector_binary_format(self):
+        mock_conn, mock_cursor = self._mock_conn([1])
+        captured = {}
+        mock_cursor.copy_expert.side_effect = (
+            lambda sql, f: captured.update(data=f.read())
+        )
+
+        insert_chunks(mock_conn, [("a", [0.5, 0.25], "s", 0)])
+
+        vector = struct.pack(">hhff", 2, 0, 0.5, 0.25)
+        assert struct.pack(">i", len(vector)) + vector in captured["data"]
+
+    def test_commits_once(self):
+        mock_conn, mock_cursor = self._mock_conn([1, 2, 3])
+
+        insert_chunks(mock_conn, [("x", [0.1], "s", i) for i in range(3)])
+
+        mock_conn.commit.assert_called_once()
+
+    def test_rolls_back_on_failure(self):
+        mock_conn, mock_cursor = self._mock_conn([1])
+        mock_cursor.copy_expert.side_effect = RuntimeError("copy failed")
+
+        with pytest.raises(RuntimeError):
+            insert_chunks(mock_conn, [("a", [0.1], "s", 0)])
+
+        mock_conn.rollback.assert_called_once()
+        mock_conn.commit.assert_not_called()
+
+    def test_empty_rows_skip_database(self):
+        mock_conn, mock_cursor = self._mock_conn([])
+
+        assert insert_chunks(mock_conn, []) == []
+        mock_conn.cursor.assert_not_called()
+
+    @patch('vectordb.execute_values')
+    def test_values_fallback_uses_multi_row_insert(self, mock_execute_values):
+        mock_conn, mock_cursor = self._mock_conn([])
+        mock_execute_values.return_value = [(4,), (5,)]
+        rows = [("a", [0.1], "s", 0), ("b", [0.2], "s", 1)]
+
+        result = insert_chunks(mock_conn, rows, method="values")
+
+        assert result == [4, 5]
+        args, kwargs = mock_execute_values.call_args
+        assert "RETURNING id" in args[1]
+        assert args[2] == rows
+        assert kwargs["fetch"] is True
+        mock_conn.commit.assert_called_once()
+
+    def test_page_columns_are_included_when_present(self):
+        mock_conn, mock_cursor = self._mock_conn([1])
+        captured = {}
+        mock_cursor.copy_expert.side_effect = (
+            lambda sql, f: captured.update(sql=sql, data=f.read())
+        )
+
+        insert_chunks(mock_conn, [("a", [0.1], "s", 0, 3, 4)])
+
+        assert "start_page, end_page" in captured["sql"]
+        # id + six chunk columns
+        assert captured["data"][19:21] == struct.pack(">h", 7)
+
+    def test_offset_columns_are_included_when_present(self):
+        mock_conn, mock_cursor = self._mock_conn([1])
+        captured = {}
+        mock_cursor.copy_expert.side_effect = (
+            lambda sql, f: captured.update(sql=sql, data=f.read())
+        )
+
+        insert_chunks(mock_conn, [("a", [0.1], "s", 0, 3, 4, 100, 250)])
+
+        assert "start_page, end_page, start_offset, end_offset" in captured["sql"]
+        assert captured["data"][19:21] == struct.pack(">h", 9)
+
+    def test_unknown_method_raises(self):
+        mock_conn, mock_cursor = self._mock_conn([])
+
+        with pytest.raises(ValueError):
+            insert_chunks(mock_conn, [("a", [0.1], "s", 0)], method="bogus")
+
+
 class TestSearchChunks:
     def test_returns_matching_chunks(self):
         # Setup mock cursor with results
@@ -134,3 +265,618 @@ class TestSearchChunks:
         result = search_chunks(mock_conn, [0.1] * 1536)
         
         assert result == []
+
+
+class TestScoredSearch:
+    def test_selects_distance_with_same_parameters(self):
+        mock_cursor = Mock()
+        mock_cursor.fetchall.return_value = [(1, "content", "doc.pdf", 0, 0.25)]
+        mock_conn = Mock()
+        mock_conn.cursor.return_value = mock_cursor
+
+        result = search_chunks(mock_conn, [0.1], top_k=3, with_distance=True)
+
+        assert result == [(1, "content", "doc.pdf", 0, 0.25)]
+        sql, params = mock_cursor.execute.call_args[0]
+        assert "AS distance" in sql
+        assert params == ([0.1], 3)
+
+
+class TestCreateSchema:
+    def _conn(self, columns, indexes):
+        mock_cursor = Mock()
+        mock_cursor.fetchall.side_effect = [[(c,) for c in columns], [(i,) for i in indexes]]
+        mock_conn = Mock()
+        mock_conn.cursor.return_value = mock_cursor
+        return mock_conn, mock_cursor
+
+    def test_creates_tables_and_commits(self):
+        mock_conn, mock_cursor = self._conn(["id", "content"], [])
+
+        create_schema(mock_conn)
+
+        statements = [c[0][0] for c in mock_cursor.execute.call_args_list]
+        sql = statements[0]
+        assert "CREATE TABLE IF NOT EXISTS documents" in sql
+        assert "document_files" in sql
+        assert "document_pages" in sql
+        assert "ingest_checkpoints" in sql
+        assert any("ADD COLUMN IF NOT EXISTS start_page" in s for s in statements)
+        assert any("USING gin (content_tsv)" in s for s in statements)
+        mock_conn.commit.assert_called_once()
+
+    def test_up_to_date_table_is_not_altered(self):
+        from vectordb import DOCUMENT_COLUMNS, DOCUMENT_INDEXES
+        mock_conn, mock_cursor = self._conn(list(DOCUMENT_COLUMNS), list(DOCUMENT_INDEXES))
+
+        create_schema(mock_conn)
+
+        statements = [c[0][0] for c in mock_cursor.execute.call_args_list]
+        assert not any("ALTER TABLE" in s or "CREATE INDEX" in s for s in statements)
+        mock_conn.commit.assert_called_once()
+
+    def test_only_missing_columns_are_added(self):
+        from vectordb import DOCUMENT_COLUMNS, DOCUMENT_INDEXES
+        columns = [c for c in DOCUMENT_COLUMNS if c != "end_offset"]
+        mock_conn, mock_cursor = self._conn(columns, list(DOCUMENT_INDEXES))
+
+        create_schema(mock_conn)
+
+        alters = [c[0][0] for c in mock_cursor.execute.call_args_list if "ALTER TABLE" in c[0][0]]
+        assert alters == ["ALTER TABLE documents ADD COLUMN IF NOT EXISTS end_offset INTEGER;"]
+
+    def test_vector_width_matches_the_embedder(self):
+        from embedder import EMBEDDING_DIMENSIONS
+        from vectordb import SCHEMA, VECTOR_DIMENSIONS
+
+        assert VECTOR_DIMENSIONS == EMBEDDING_DIMENSIONS
+        assert f"vector({VECTOR_DIMENSIONS})" in SCHEMA
+
+
+class TestGetDocument:
+    def test_returns_none_for_unknown_source(self):
+        mock_cursor = Mock()
+        mock_cursor.fetchone.return_value = None
+        mock_conn = Mock()
+        mock_conn.cursor.return_value = mock_cursor
+
+        assert get_document(mock_conn, "new.pdf") is None
+
+    def test_returns_file_hash_and_page_hashes(self):
+        mock_cursor = Mock()
+        mock_cursor.fetchone.return_value = ("filehash",)
+        mock_cursor.fetchall.return_value = [(1, "p1"), (2, "p2")]
+        mock_conn = Mock()
+        mock_conn.cursor.return_value = mock_cursor
+
+        result = get_document(mock_conn, "doc.pdf")
+
+        assert result == ("filehash", {1: "p1", 2: "p2"})
+
+
+class TestCheckpoints:
+    def test_reads_checkpoints_by_source(self):
+        from vectordb import get_checkpoints
+        mock_cursor = Mock()
+        mock_cursor.fetchall.return_value = [("a.pdf", 100, 1.5, "done"), ("b.pdf", 7, 2.0, "failed")]
+        mock_conn = Mock()
+        mock_conn.cursor.return_value = mock_cursor
+
+        assert get_checkpoints(mock_conn) == {"a.pdf": (100, 1.5, "done"), "b.pdf": (7, 2.0, "failed")}
+
+    def test_upserts_and_commits(self):
+        from vectordb import save_checkpoint
+        mock_cursor = Mock()
+        mock_conn = Mock()
+        mock_conn.cursor.return_value = mock_cursor
+
+        save_checkpoint(mock_conn, "a.pdf", 100, 1.5, "failed", error="PdfReadError: bad")
+
+        sql, params = mock_cursor.execute.call_args[0]
+        assert "INSERT INTO ingest_checkpoints" in sql and "ON CONFLICT (source) DO UPDATE" in sql
+        assert params == ("a.pdf", 100, 1.5, "failed", None, "PdfReadError: bad")
+        mock_conn.commit.assert_called_once()
+
+
+class TestDocumentVersion:
+    def test_hashes_the_document_registry(self):
+        from vectordb import document_version
+        mock_cursor = Mock()
+        mock_cursor.fetchone.return_value = ("abc123",)
+        mock_conn = Mock()
+        mock_conn.cursor.return_value = mock_cursor
+
+        assert document_version(mock_conn) == "abc123"
+        sql = mock_cursor.execute.call_args[0][0]
+        assert "document_files" in sql and "file_hash" in sql
+
+
+class TestReplaceDocument:
+    def replace(self, conn, new_rows, kept_rows=(), delete_ids=()):
+        # What ingest does: one transaction per document.
+        from vectordb import begin_document, write_chunks, finish_document
+        cursor = begin_document(conn, "doc.pdf")
+        ids = write_chunks(cursor, new_rows)
+        finish_document(cursor, "doc.pdf", "hash", ["p1", "p2"], kept_rows, delete_ids)
+        return ids
+
+    @patch('vectordb.execute_values')
+    def test_swaps_chunks_in_one_transaction(self, mock_execute_values):
+        mock_cursor = Mock()
+        mock_cursor.fetchall.return_value = [(20,)]
+        mock_conn = Mock()
+        mock_conn.cursor.return_value = mock_cursor
+
+        ids = self.replace(
+            mock_conn,
+            new_rows=[("new", [0.1], "doc.pdf", 1, 2, 2)],
+            kept_rows=[(10, 0, 1, 1)],
+            delete_ids=[11],
+        )
+
+        assert ids == [20]
+        statements = [c[0][0] for c in mock_cursor.execute.call_args_list]
+        assert "pg_advisory_xact_lock" in statements[0]
+        assert any("DELETE FROM documents" in sql for sql in statements)
+        assert any("INSERT INTO document_files" in sql for sql in statements)
+        mock_cursor.copy_expert.assert_called_once()
+        updates = [c for c in mock_execute_values.call_args_list if "UPDATE documents" in c[0][1]]
+        assert updates[0][0][2] == [(10, 0, 1, 1)]
+        mock_conn.commit.assert_not_called()
+
+    @patch('vectordb.execute_values')
+    def test_kept_rows_with_offsets_update_them(self, mock_execute_values):
+        mock_cursor = Mock()
+        mock_conn = Mock()
+        mock_conn.cursor.return_value = mock_cursor
+
+        self.replace(mock_conn, new_rows=[], kept_rows=[(10, 0, 1, 1, 0, 42)])
+
+        updates = [c for c in mock_execute_values.call_args_list if "UPDATE documents" in c[0][1]]
+        sql = updates[0][0][1]
+        assert "start_offset = v.start_offset" in sql and "end_offset = v.end_offset" in sql
+        assert updates[0][0][2] == [(10, 0, 1, 1, 0, 42)]
+
+
+class TestSearchSettings:
+    def _conn(self):
+        mock_cursor = Mock()
+        mock_cursor.fetchall.return_value = []
+        mock_conn = Mock()
+        mock_conn.cursor.return_value = mock_cursor
+        return mock_conn, mock_cursor
+
+    def test_no_settings_runs_only_the_search(self):
+        mock_conn, mock_cursor = self._conn()
+
+        search_chunks(mock_conn, [0.1], top_k=5)
+
+        assert mock_cursor.execute.call_count == 1
+
+    def test_sets_ef_search_locally_and_restores_default(self):
+        mock_conn, mock_cursor = self._conn()
+
+        search_chunks(mock_conn, [0.1], top_k=5, ef_search=100)
+
+        statements = [c[0] for c in mock_cursor.execute.call_args_list]
+        assert statements[0] == ("SELECT set_config(%s, %s, true);", ("hnsw.ef_search", "100"))
+        assert "ORDER BY embedding <=>" in statements[1][0]
+        assert statements[2] == ("SET LOCAL hnsw.ef_search TO DEFAULT;",)
+
+    def test_sets_ivfflat_probes(self):
+        mock_conn, mock_cursor = self._conn()
+
+        search_chunks(mock_conn, [0.1], probes=10)
+
+        assert mock_cursor.execute.call_args_list[0][0] == (
+            "SELECT set_config(%s, %s, true);", ("ivfflat.probes", "10")
+        )
+
+    def test_exact_search_disables_index_scan(self):
+        mock_conn, mock_cursor = self._conn()
+
+        search_chunks(mock_conn, [0.1], exact=True)
+
+        assert mock_cursor.execute.call_args_list[0][0] == (
+            "SELECT set_config(%s, %s, true);", ("enable_indexscan", "off")
+        )
+
+
+class TestVectorIndex:
+    def test_creates_hnsw_index_with_parameters(self):
+        mock_cursor = Mock()
+        mock_conn = Mock()
+        mock_conn.cursor.return_value = mock_cursor
+
+        create_vector_index(mock_conn, "hnsw", m=24, ef_construction=100)
+
+        sql = mock_cursor.execute.call_args[0][0]
+        assert "USING hnsw (embedding vector_cosine_ops)" in sql
+        assert "m = 24, ef_construction = 100" in sql
+        mock_conn.commit.assert_called_once()
+
+    def test_ivfflat_lists_default_from_row_count(self):
+        mock_cursor = Mock()
+        mock_cursor.fetchone.return_value = (250_000,)
+        mock_conn = Mock()
+        mock_conn.cursor.return_value = mock_cursor
+
+        create_vector_index(mock_conn, "ivfflat")
+
+        sql = mock_cursor.execute.call_args[0][0]
+        assert "USING ivfflat" in sql
+        assert "lists = 250" in sql
+
+    def test_rebuild_drops_existing_index_first(self):
+        mock_cursor = Mock()
+        mock_conn = Mock()
+        mock_conn.cursor.return_value = mock_cursor
+
+        rebuild_vector_index(mock_conn, "ivfflat", lists=50)
+
+        statements = [c[0][0] for c in mock_cursor.execute.call_args_list]
+        assert statements[0].startswith("DROP INDEX IF EXISTS")
+        assert "lists = 50" in statements[1]
+
+    def test_unknown_method_raises(self):
+        with pytest.raises(ValueError):
+            create_vector_index(Mock(), "btree")
+
+    def test_ivfflat_lists_heuristic(self):
+        assert ivfflat_lists(500) == 1
+        assert ivfflat_lists(100_000) == 100
+        assert ivfflat_lists(4_000_000) == 2000
+
+
+class TestMeasureRecall:
+    @patch('vectordb.search_chunks')
+    def test_compares_against_exact_results(self, mock_search):
+        def fake_search(conn, query, top_k, exact=False, **settings):
+            if exact:
+                return [(1,), (2,), (3,), (4,)]
+            return [(1,), (2,), (9,), (8,)]
+        mock_search.side_effect = fake_search
+
+        result = measure_recall(Mock(), [[0.1], [0.2]], top_k=4, ef_search=20)
+
+        assert result["queries"] == 2
+        assert result["recall"] == 0.5
+        assert mock_search.call_args_list[1][1] == {"ef_search": 20}
+
+    def test_no_queries(self):
+        assert measure_recall(Mock(), [])["recall"] is None
+
+
+class TestHybridSearchChunks:
+    def test_runs_both_legs_in_one_statement(self):
+        mock_cursor = Mock()
+        mock_cursor.fetchall.return_value = [(1, "E-1042 means overheating", "doc.pdf", 0)]
+        mock_conn = Mock()
+        mock_conn.cursor.return_value = mock_cursor
+
+        result = hybrid_search_chunks(mock_conn, "E-1042", [0.1] * 3, top_k=3)
+
+        assert result == [(1, "E-1042 means overheating", "doc.pdf", 0)]
+        mock_cursor.execute.assert_called_once()
+        sql, params = mock_cursor.execute.call_args[0]
+        assert "<=>" in sql
+        assert "content_tsv @@" in sql
+        assert "1.0 / (%(rrf_k)s + rank)" in sql
+        assert params["query"] == "E-1042"
+        assert params["top_k"] == 3
+        assert params["rrf_k"] == 60
+
+    def test_with_distance_returns_the_vector_leg_distance(self):
+        from vectordb import SCORED_HYBRID_SQL
+        mock_cursor = Mock()
+        mock_cursor.fetchall.return_value = [(1, "E-1042", "doc.pdf", 0, None)]
+        mock_conn = Mock()
+        mock_conn.cursor.return_value = mock_cursor
+
+        result = hybrid_search_chunks(mock_conn, "E-1042", [0.1] * 3, with_distance=True)
+
+        assert result == [(1, "E-1042", "doc.pdf", 0, None)]
+        sql = mock_cursor.execute.call_args[0][0]
+        assert sql == SCORED_HYBRID_SQL
+        assert "vector_leg.distance" in sql and "LEFT JOIN vector_leg" in sql
+
+    def test_schema_adds_full_text_column_and_index(self):
+        from vectordb import DOCUMENT_COLUMNS, DOCUMENT_INDEXES
+        assert DOCUMENT_COLUMNS["content_tsv"].startswith("tsvector")
+        assert "USING gin (content_tsv)" in DOCUMENT_INDEXES["documents_content_tsv_idx"]
+
+
+class TestSearchChunksMany:
+    def test_single_statement_groups_rows_by_query(self):
+        mock_cursor = Mock()
+        mock_cursor.fetchall.return_value = [
+            (1, 10, "a", "doc.pdf", 0),
+            (1, 11, "b", "doc.pdf", 1),
+            (3, 12, "c", "doc.pdf", 2),
+        ]
+        mock_conn = Mock()
+        mock_conn.cursor.return_value = mock_cursor
+
+        result = search_chunks_many(mock_conn, [[0.1, 0.2], [0.3, 0.4], [0.5, 0.6]], top_k=2)
+
+        assert result == [
+            [(10, "a", "doc.pdf", 0), (11, "b", "doc.pdf", 1)],
+            [],
+            [(12, "c", "doc.pdf", 2)],
+        ]
+        mock_cursor.execute.assert_called_once()
+        sql, params = mock_cursor.execute.call_args[0]
+        assert "unnest" in sql
+        assert "LATERAL" in sql
+        assert params == (["[0.1,0.2]", "[0.3,0.4]", "[0.5,0.6]"], 2)
+        assert "chunk_index, d.distance" not in sql
+
+    def test_with_distance_returns_distances(self):
+        mock_cursor = Mock()
+        mock_cursor.fetchall.return_value = [(1, 10, "a", "doc.pdf", 0, 0.25)]
+        mock_conn = Mock()
+        mock_conn.cursor.return_value = mock_cursor
+
+        result = search_chunks_many(mock_conn, [[0.1, 0.2]], top_k=1, with_distance=True)
+
+        assert result == [[(10, "a", "doc.pdf", 0, 0.25)]]
+        sql = mock_cursor.execute.call_args[0][0]
+        assert "chunk_index, d.distance" in sql
+
+    def test_no_queries_skips_database(self):
+        mock_conn = Mock()
+
+        assert search_chunks_many(mock_conn, []) == []
+        mock_conn.cursor.assert_not_called()
+
+
+def _async_conn(rows):
+    from unittest.mock import AsyncMock
+    cursor = AsyncMock()
+    cursor.fetchall.return_value = rows
+    conn = MagicMock()
+    conn.cursor.return_value.__aenter__.return_value = cursor
+    return conn, cursor
+
+
+class TestSearchChunksAsync:
+    def test_runs_same_query_as_sync_search(self):
+        import asyncio
+        from vectordb import search_chunks_async, SEARCH_SQL
+        conn, cursor = _async_conn([(1, "content", "doc.pdf", 0)])
+
+        result = asyncio.run(search_chunks_async(conn, [0.1, 0.2], 3))
+
+        assert result == [(1, "content", "doc.pdf", 0)]
+        cursor.execute.assert_awaited_once_with(SEARCH_SQL, ([0.1, 0.2], 3))
+        conn.transaction.assert_not_called()
+
+    def test_settings_run_in_a_transaction(self):
+        import asyncio
+        from vectordb import search_chunks_async
+        conn, cursor = _async_conn([])
+
+        asyncio.run(search_chunks_async(conn, [0.1], ef_search=80))
+
+        conn.transaction.assert_called_once()
+        assert cursor.execute.await_args_list[0][0] == ("SELECT set_config(%s, %s, true);", ("hnsw.ef_search", "80"))
+
+    def test_hybrid_search_uses_shared_statement(self):
+        import asyncio
+        from vectordb import hybrid_search_chunks_async, HYBRID_SQL
+        conn, cursor = _async_conn([(2, "E-1042", "doc.pdf", 1)])
+
+        result = asyncio.run(hybrid_search_chunks_async(conn, "E-1042", [0.1], top_k=2))
+
+        assert result == [(2, "E-1042", "doc.pdf", 1)]
+        sql, params = cursor.execute.await_args[0]
+        assert sql == HYBRID_SQL
+        assert params["query"] == "E-1042" and params["top_k"] == 2
+
+
+class TestQuantizedSearch:
+    def _conn(self, rows=()):
+        mock_cursor = Mock()
+        mock_cursor.fetchall.return_value = list(rows)
+        mock_conn = Mock()
+        mock_conn.cursor.return_value = mock_cursor
+        return mock_conn, mock_cursor
+
+    def test_halfvec_candidates_are_rescored_at_full_precision(self):
+        mock_conn, mock_cursor = self._conn([(1, "content", "doc.pdf", 0)])
+
+        result = search_chunks(mock_conn, [0.1, 0.2], top_k=5, quantization="halfvec")
+
+        assert result == [(1, "content", "doc.pdf", 0)]
+        sql, params = mock_cursor.execute.call_args[0]
+        assert "ORDER BY embedding::halfvec(1536) <=> %s::vector::halfvec(1536)" in sql
+        assert "ORDER BY embedding <=> %s::vector" in sql
+        assert params == ([0.1, 0.2], 20, [0.1, 0.2], 5)
+
+    def test_bit_search_uses_hamming_distance(self):
+        mock_conn, mock_cursor = self._conn()
+
+        search_chunks(mock_conn, [0.1], top_k=2, quantization="bit", rescore=30)
+
+        sql, params = mock_cursor.execute.call_args[0]
+        assert "binary_quantize(embedding)::bit(1536) <~> binary_quantize(%s::vector)" in sql
+        assert params == ([0.1], 30, [0.1], 2)
+
+    def test_distance_is_full_precision(self):
+        mock_conn, mock_cursor = self._conn()
+
+        search_chunks(mock_conn, [0.1], top_k=2, quantization="bit", with_distance=True)
+
+        sql, params = mock_cursor.execute.call_args[0]
+        assert "embedding <=> %s::vector AS distance" in sql
+        assert params == ([0.1], [0.1], 8, 2)
+
+    def test_ef_search_is_raised_to_cover_the_candidates(self):
+        mock_conn, mock_cursor = self._conn()
+
+        search_chunks(mock_conn, [0.1], top_k=20, quantization="halfvec")
+
+        statements = [c[0] for c in mock_cursor.execute.call_args_list]
+        assert statements[0] == ("SELECT set_config(%s, %s, true);", ("hnsw.ef_search", "80"))
+        assert statements[2] == ("SET LOCAL hnsw.ef_search TO DEFAULT;",)
+
+    def test_unknown_quantization_raises(self):
+        with pytest.raises(ValueError):
+            search_chunks(Mock(), [0.1], quantization="int8")
+
+    def test_async_search_uses_same_statement(self):
+        import asyncio
+        from vectordb import search_chunks_async
+        conn, cursor = _async_conn([])
+
+        asyncio.run(search_chunks_async(conn, [0.1], top_k=3, quantization="halfvec"))
+
+        sql, params = cursor.execute.await_args[0]
+        assert "halfvec(1536)" in sql
+        assert params == ([0.1], 12, [0.1], 3)
+
+
+class TestQuantizedIndex:
+    def test_creates_expression_index_on_quantized_embedding(self):
+        mock_cursor = Mock()
+        mock_conn = Mock()
+        mock_conn.cursor.return_value = mock_cursor
+
+        create_vector_index(mock_conn, "hnsw", quantization="bit")
+
+        sql = mock_cursor.execute.call_args[0][0]
+        assert "documents_embedding_bit_idx" in sql
+        assert "USING hnsw ((binary_quantize(embedding)::bit(1536)) bit_hamming_ops)" in sql
+
+    def test_rebuild_drops_only_the_quantized_index(self):
+        mock_cursor = Mock()
+        mock_conn = Mock()
+        mock_conn.cursor.return_value = mock_cursor
+
+        rebuild_vector_index(mock_conn, "hnsw", quantization="halfvec")
+
+        statements = [c[0][0] for c in mock_cursor.execute.call_args_list]
+        assert statements[0] == "DROP INDEX IF EXISTS documents_embedding_halfvec_idx;"
+        assert "(embedding::halfvec(1536)) halfvec_cosine_ops" in statements[1]
+
+
+class TestCompareQuantization:
+    def test_vector_sizes(self):
+        from vectordb import vector_bytes
+        assert vector_bytes() == 6152
+        assert vector_bytes("halfvec") == 3080
+        assert vector_bytes("bit") == 200
+
+    @patch('vectordb.vector_index_bytes')
+    @patch('vectordb.search_chunks')
+    def test_reports_recall_loss_and_savings(self, mock_search, mock_index_bytes):
+        from vectordb import compare_quantization
+
+        def fake_search(conn, query, top_k, exact=False, quantization=None, **options):
+            if exact or quantization is None:
+                return [(1,), (2,), (3,), (4,)]
+            if quantization == "halfvec":
+                return [(1,), (2,), (3,), (4,)]
+            return [(1,), (2,), (3,), (9,)]
+        mock_search.side_effect = fake_search
+        mock_index_bytes.side_effect = lambda conn, q=None, prefix=None: {None: 8000, "halfvec": 4000}.get(q)
+
+        rows = compare_quantization(Mock(), [[0.1]], top_k=4, rescore=16)
+
+        by_name = {row["quantization"]: row for row in rows}
+        assert by_name["vector"]["recall_loss"] == 0.0
+        assert by_name["halfvec"]["index_saving"] == 0.5
+        assert by_name["bit"]["recall_loss"] == 0.25
+        assert by_name["bit"]["index_bytes"] is None
+        assert by_name["bit"]["vector_saving"] > 0.96
+        assert mock_search.call_args_list[-1][1] == {"quantization": "bit", "prefix": None, "rescore": 16}
+
+
+class TestPrefixSearch:
+    def _conn(self):
+        mock_cursor = Mock()
+        mock_cursor.fetchall.return_value = []
+        mock_conn = Mock()
+        mock_conn.cursor.return_value = mock_cursor
+        return mock_conn, mock_cursor
+
+    def test_prefix_candidates_are_rescored_on_full_vectors(self):
+        mock_conn, mock_cursor = self._conn()
+
+        search_chunks(mock_conn, [0.1], top_k=5, prefix=256)
+
+        sql, params = mock_cursor.execute.call_args[0]
+        assert ("ORDER BY subvector(embedding, 1, 256)::vector(256) <=> "
+                "subvector(%s::vector, 1, 256)::vector(256)") in sql
+        assert "ORDER BY embedding <=> %s::vector" in sql
+        assert params == ([0.1], 20, [0.1], 5)
+
+    def test_prefix_combines_with_quantization(self):
+        mock_conn, mock_cursor = self._conn()
+
+        search_chunks(mock_conn, [0.1], top_k=5, prefix=512, quantization="bit")
+
+        sql = mock_cursor.execute.call_args[0][0]
+        assert "binary_quantize(subvector(embedding, 1, 512))::bit(512) <~>" in sql
+
+    def test_prefix_must_be_shorter_than_the_embedding(self):
+        with pytest.raises(ValueError):
+            search_chunks(Mock(), [0.1], prefix=1536)
+
+    def test_creates_prefix_index(self):
+        mock_cursor = Mock()
+        mock_conn = Mock()
+        mock_conn.cursor.return_value = mock_cursor
+
+        create_vector_index(mock_conn, "hnsw", prefix=256)
+
+        sql = mock_cursor.execute.call_args[0][0]
+        assert "documents_embedding_prefix256_idx" in sql
+        assert "USING hnsw ((subvector(embedding, 1, 256)::vector(256)) vector_cosine_ops)" in sql
+
+
+class TestResizeEmbeddings:
+    def _conn(self, current, indexes=()):
+        mock_cursor = Mock()
+        mock_cursor.fetchone.return_value = (current,)
+        mock_cursor.fetchall.return_value = [(name,) for name in indexes]
+        mock_conn = Mock()
+        mock_conn.cursor.return_value = mock_cursor
+        return mock_conn, mock_cursor
+
+    def test_truncates_and_renormalizes_stored_vectors(self):
+        from vectordb import resize_embeddings
+        mock_conn, mock_cursor = self._conn(1536, ["documents_embedding_idx"])
+
+        resize_embeddings(mock_conn, 512)
+
+        statements = [c[0][0] for c in mock_cursor.execute.call_args_list]
+        assert "DROP INDEX IF EXISTS documents_embedding_idx;" in statements
+        assert "USING l2_normalize(subvector(embedding, 1, 512))::vector(512)" in statements[-1]
+        mock_conn.commit.assert_called_once()
+
+    def test_same_size_is_a_no_op(self):
+        from vectordb import resize_embeddings
+        mock_conn, mock_cursor = self._conn(512)
+
+        resize_embeddings(mock_conn, 512)
+
+        assert mock_cursor.execute.call_count == 1
+        mock_conn.commit.assert_not_called()
+
+    def test_cannot_grow_embeddings(self):
+        from vectordb import resize_embeddings
+        mock_conn, _ = self._conn(512)
+
+        with pytest.raises(ValueError):
+            resize_embeddings(mock_conn, 1536)
+
+    def test_rolls_back_on_error(self):
+        from vectordb import resize_embeddings
+        mock_conn, mock_cursor = self._conn(1536)
+        mock_cursor.execute.side_effect = [None, None, Exception("boom")]
+
+        with pytest.raises(Exception):
+            resize_embeddings(mock_conn, 256)
+
+        mock_conn.rollback.assert_called_once()
@@ -1,3 +1,129 @@
+import io
+import math
+import os
+import statistics
+import struct
+import time
+
+from psycopg2.extras import execute_values
+
+CHUNK_COLUMNS = (
+    "content", "embedding", "source", "chunk_index", "start_page", "end_page",
+    "start_offset", "end_offset",
+)
+# Columns finish_document can update on rows kept from an earlier ingest.
+KEPT_COLUMNS = ("id", "chunk_index", "start_page", "end_page", "start_offset", "end_offset")
+
+# Width of documents.embedding, read from the same EMBEDDING_DIMENSIONS
+# setting the embedder uses. A table created with another width is
+# converted with resize_embeddings.
+VECTOR_DIMENSIONS = int(os.getenv("EMBEDDING_DIMENSIONS", "1536"))
+
+SCHEMA = f"""
+CREATE EXTENSION IF NOT EXISTS vector;
+CREATE TABLE IF NOT EXISTS documents (
+    id SERIAL PRIMARY KEY,
+    content TEXT,
+    embedding vector({VECTOR_DIMENSIONS}),
+    source TEXT,
+    chunk_index INTEGER
+);
+
+CREATE TABLE IF NOT EXISTS document_files (
+    source TEXT PRIMARY KEY,
+    file_hash TEXT NOT NULL,
+    page_count INTEGER NOT NULL,
+    ingested_at TIMESTAMPTZ NOT NULL DEFAULT now()
+);
+CREATE TABLE IF NOT EXISTS document_pages (
+    source TEXT NOT NULL REFERENCES document_files (source) ON DELETE CASCADE,
+    page_number INTEGER NOT NULL,
+    content_hash TEXT NOT NULL,
+    PRIMARY KEY (source, page_number)
+);
+-- Batch ingest progress per file: status is 'done', 'empty' or 'failed'.
+-- A file whose size and mtime still match is not opened again on resume.
+CREATE TABLE IF NOT EXISTS ingest_checkpoints (
+    source TEXT PRIMARY KEY,
+    file_size BIGINT NOT NULL,
+    modified_at DOUBLE PRECISION NOT NULL,
+    status TEXT NOT NULL,
+    chunks INTEGER,
+    error TEXT,
+    updated_at TIMESTAMPTZ NOT NULL DEFAULT now()
+);
+"""
+
+# Columns added to documents after the original schema. ALTER TABLE takes an
+# ACCESS EXCLUSIVE lock even when IF NOT EXISTS turns it into a no-op, which
+# would queue every search behind an open ingest transaction, so
+# create_schema only runs the ones that are missing.
+DOCUMENT_COLUMNS = {
+    "start_page": "INTEGER",
+    "end_page": "INTEGER",
+    # Character range of the chunk in the document text (all pages joined).
+    "start_offset": "INTEGER",
+    "end_offset": "INTEGER",
+    "content_tsv": "tsvector GENERATED ALWAYS AS (to_tsvector('english', coalesce(content, ''))) STORED",
+}
+# Likewise for indexes: CREATE INDEX IF NOT EXISTS waits for a SHARE lock
+# before it finds the index already there.
+DOCUMENT_INDEXES = {
+    "documents_source_idx": "CREATE INDEX IF NOT EXISTS documents_source_idx ON documents (source);",
+    "documents_content_tsv_idx":
+        "CREATE INDEX IF NOT EXISTS documents_content_tsv_idx ON documents USING gin (content_tsv);",
+}
+
+VECTOR_INDEX = "documents_embedding_idx"
+# Quantized copies of the embedding live only in their own indexes (as
+# expression indexes), so the table keeps the full vectors rescoring needs.
+QUANTIZATIONS = ("halfvec", "bit")
+# Quantized index searched by default ("halfvec" or "bit"); unset searches
+# the full-precision embedding.
+VECTOR_QUANTIZATION = os.getenv("VECTOR_QUANTIZATION") or None
+# Leading dimensions searched first by default (e.g. 256); text-embedding-3
+# prefixes are embeddings in their own right. Unset searches all of them.
+SEARCH_PREFIX_DIMENSIONS = int(os.getenv("SEARCH_PREFIX_DIMENSIONS")) if os.getenv("SEARCH_PREFIX_DIMENSIONS") else None
+# Candidates fetched from a quantized or prefix index per result, then rescored.
+RESCORE_FACTOR = int(os.getenv("RESCORE_FACTOR", "4"))
+# pgvector's default hnsw.ef_search, which also caps how many rows an HNSW
+# scan can return.
+_DEFAULT_EF_SEARCH = 40
+
+# Per-query planner settings search_chunks may change for one transaction.
+_SEARCH_SETTINGS = {
+    "ef_search": "hnsw.ef_search",
+    "probes": "ivfflat.probes",
+}
+
+# PostgreSQL binary COPY framing: signature, flags, header extension length.
+_COPY_HEADER = b"PGCOPY\n\xff\r\n\x00" + struct.pack(">ii", 0, 0)
+_COPY_TRAILER = struct.pack(">h", -1)
+
+def create_schema(conn):
+    # Safe to run on every start: creates missing tables and adds the columns
+    # and indexes introduced after the original schema. An up-to-date
+    # database is only read, so this never waits on a running ingest.
+    cursor = conn.cursor()
+    cursor.execute(SCHEMA)
+    cursor.execute("""
+        SELECT column_name FROM information_schema.columns
+        WHERE table_schema = current_schema() AND table_name = 'documents';
+    """)
+    columns = {row[0] for row in cursor.fetchall()}
+    for column, definition in DOCUMENT_COLUMNS.items():
+        if column not in columns:
+            cursor.execute(f"ALTER TABLE documents ADD COLUMN IF NOT EXISTS {column} {definition};")
+    cursor.execute("""
+        SELECT indexname FROM pg_indexes
+        WHERE schemaname = current_schema() AND tablename = 'documents';
+    """)
+    indexes = {row[0] for row in cursor.fetchall()}
+    for name, statement in DOCUMENT_INDEXES.items():
+        if name not in indexes:
+            cursor.execute(statement)
+    conn.commit()
+
 def insert_chunk(conn, content, embedding, source, chunk_index):
     cursor = conn.cursor()
     cursor.execute("""
@@ -7,13 +133,578 @@ def insert_chunk(conn, content, embedding, source, chunk_index):
     conn.commit();
     return cursor.fetchone()[0];
 
-def search_chunks(conn, query_embedding : list[float], top_k : int = 5):
+def insert_chunks(conn, rows, method: str = "copy") -> list[int]:
+    # rows are (content, embedding, source, chunk_index[, start_page, end_page])
+    # tuples. All of them are written in one transaction and the new ids come
+    # back in row order.
+    rows = list(rows)
+    if not rows:
+        return []
+
     cursor = conn.cursor()
-    query = """
+    try:
+        ids = _write_chunks(cursor, rows, method)
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    return ids
+
+def _write_chunks(cursor, rows, method: str = "copy") -> list[int]:
+    if not rows:
+        return []
+    if method == "copy":
+        return _copy_chunks(cursor, rows)
+    if method == "values":
+        return _values_chunks(cursor, rows)
+    raise ValueError(f"Unknown insert method: {method}")
+
+def _copy_chunks(cursor, rows) -> list[int]:
+    # COPY can't return ids, so reserve them from the serial sequence up front
+    # and send them along with the rows.
+    cursor.execute("""
+        SELECT nextval(pg_get_serial_sequence('documents', 'id'))
+        FROM generate_series(1, %s);
+    """, (len(rows),))
+    ids = [row[0] for row in cursor.fetchall()]
+
+    buffer = io.BytesIO()
+    buffer.write(_COPY_HEADER)
+    for chunk_id, row in zip(ids, rows):
+        buffer.write(_encode_copy_row(chunk_id, row))
+    buffer.write(_COPY_TRAILER)
+    buffer.seek(0)
+
+    columns = ", ".join(("id",) + CHUNK_COLUMNS[:len(rows[0])])
+    cursor.copy_expert(
+        f"COPY documents ({columns}) FROM STDIN WITH (FORMAT binary)", buffer
+    )
+    return ids
+
+def _encode_copy_row(chunk_id, row) -> bytes:
+    fields = [_encode_int(chunk_id)]
+    fields += [_COLUMN_ENCODERS[column](value) for column, value in zip(CHUNK_COLUMNS, row)]
+    parts = [struct.pack(">h", len(fields))]
+    for field in fields:
+        if field is None:
+            parts.append(struct.pack(">i", -1))
+        else:
+            parts.append(struct.pack(">i", len(field)))
+            parts.append(field)
+    return b"".join(parts)
+
+def _encode_int(value):
+    return None if value is None else struct.pack(">i", value)
+
+def _encode_text(value):
+    return None if value is None else value.encode("utf-8")
+
+def _encode_vector(embedding):
+    # pgvector binary format: int16 dimensions, int16 unused, float4 values.
+    if embedding is None:
+        return None
+    dim = len(embedding)
+    return struct.pack(f">hh{dim}f", dim, 0, *embedding)
+
+_COLUMN_ENCODERS = {
+    "content": _encode_text,
+    "embedding": _encode_vector,
+    "source": _encode_text,
+    "chunk_index": _encode_int,
+    "start_page": _encode_int,
+    "end_page": _encode_int,
+    "start_offset": _encode_int,
+    "end_offset": _encode_int,
+}
+
+def _values_chunks(cursor, rows) -> list[int]:
+    columns = CHUNK_COLUMNS[:len(rows[0])]
+    placeholders = ", ".join("%s::vector" if c == "embedding" else "%s" for c in columns)
+    result = execute_values(
+        cursor,
+        f"INSERT INTO documents ({', '.join(columns)}) VALUES %s RETURNING id",
+        rows,
+        template=f"({placeholders})",
+        page_size=len(rows),
+        fetch=True,
+    )
+    return [row[0] for row in result]
+
+def get_document(conn, source: str):
+    # Returns (file_hash, {page_number: content_hash}) for an ingested source,
+    # or None if it has never been registered.
+    cursor = conn.cursor()
+    cursor.execute("SELECT file_hash FROM document_files WHERE source = %s;", (source,))
+    row = cursor.fetchone()
+    if row is None:
+        return None
+    cursor.execute(
+        "SELECT page_number, content_hash FROM document_pages WHERE source = %s;",
+        (source,),
+    )
+    return row[0], dict(cursor.fetchall())
+
+def document_version(conn) -> str:
+    # Fingerprint of every ingested (source, file_hash); changes whenever a
+    # document is added or re-ingested with different contents.
+    cursor = conn.cursor()
+    cursor.execute(
+        "SELECT md5(coalesce(string_agg(source || ':' || file_hash, ',' ORDER BY source), '')) "
+        "FROM document_files;"
+    )
+    return cursor.fetchone()[0]
+
+def get_checkpoints(conn) -> dict:
+    # {source: (file_size, modified_at, status)} for every checkpointed file.
+    cursor = conn.cursor()
+    cursor.execute("SELECT source, file_size, modified_at, status FROM ingest_checkpoints;")
+    return {source: (size, modified_at, status) for source, size, modified_at, status in cursor.fetchall()}
+
+def save_checkpoint(conn, source: str, file_size: int, modified_at: float, status: str,
+                    chunks: int = None, error: str = None):
+    # Committed on its own, after the document's transaction.
+    cursor = conn.cursor()
+    cursor.execute("""
+        INSERT INTO ingest_checkpoints (source, file_size, modified_at, status, chunks, error)
+        VALUES (%s, %s, %s, %s, %s, %s)
+        ON CONFLICT (source) DO UPDATE
+        SET file_size = EXCLUDED.file_size,
+            modified_at = EXCLUDED.modified_at,
+            status = EXCLUDED.status,
+            chunks = EXCLUDED.chunks,
+            error = EXCLUDED.error,
+            updated_at = now();
+    """, (source, file_size, modified_at, status, chunks, error))
+    conn.commit()
+
+def get_source_chunks(conn, source: str):
+    # (id, content, chunk_index, start_page, end_page) for every stored chunk.
+    cursor = conn.cursor()
+    cursor.execute("""
+        SELECT id, content, chunk_index, start_page, end_page
+        FROM documents
+        WHERE source = %s
+        ORDER BY chunk_index;
+    """, (source,))
+    return cursor.fetchall()
+
+def begin_document(conn, source: str):
+    # Opens the transaction a document is replaced in. Nothing is visible to
+    # readers until the caller commits after finish_document.
+    cursor = conn.cursor()
+    # Serialize concurrent ingests of the same source.
+    cursor.execute("SELECT pg_advisory_xact_lock(hashtext(%s));", (source,))
+    return cursor
+
+def write_chunks(cursor, rows, method: str = "copy") -> list[int]:
+    # Like insert_chunks, but inside the caller's transaction.
+    return _write_chunks(cursor, list(rows), method)
+
+def finish_document(cursor, source: str, file_hash: str, page_hashes: list[str],
+                    kept_rows=(), delete_ids=()):
+    kept_rows = list(kept_rows)
+    delete_ids = list(delete_ids)
+    if delete_ids:
+        cursor.execute("DELETE FROM documents WHERE id = ANY(%s);", (delete_ids,))
+    if kept_rows:
+        columns = KEPT_COLUMNS[:len(kept_rows[0])]
+        assignments = ", ".join(f"{column} = v.{column}" for column in columns[1:])
+        execute_values(cursor, f"""
+            UPDATE documents AS d
+            SET {assignments}
+            FROM (VALUES %s) AS v ({", ".join(columns)})
+            WHERE d.id = v.id
+        """, kept_rows, page_size=len(kept_rows))
+
+    cursor.execute("""
+        INSERT INTO document_files (source, file_hash, page_count)
+        VALUES (%s, %s, %s)
+        ON CONFLICT (source) DO UPDATE
+        SET file_hash = EXCLUDED.file_hash,
+            page_count = EXCLUDED.page_count,
+            ingested_at = now();
+    """, (source, file_hash, len(page_hashes)))
+    cursor.execute("DELETE FROM document_pages WHERE source = %s;", (source,))
+    if page_hashes:
+        execute_values(
+            cursor,
+            "INSERT INTO document_pages (source, page_number, content_hash) VALUES %s",
+            [(source, n, h) for n, h in enumerate(page_hashes, 1)],
+            page_size=len(page_hashes),
+        )
+
+def create_vector_index(conn, method: str = "hnsw", m: int = 16, ef_construction: int = 64,
+                        lists: int = None, replace: bool = False, quantization: str = None,
+                        prefix: int = None):
+    # Builds an ANN index on documents.embedding for cosine distance, or on
+    # its halfvec / binary quantization and/or its leading prefix dimensions.
+    # IVFFlat clusters the rows it sees at build time, so build it after
+    # ingesting.
+    if method == "hnsw":
+        params = f"m = {int(m)}, ef_construction = {int(ef_construction)}"
+    elif method == "ivfflat":
+        if lists is None:
+            lists = ivfflat_lists(count_chunks(conn))
+        params = f"lists = {int(lists)}"
+    else:
+        raise ValueError(f"Unknown index method: {method}")
+    if quantization is None and prefix is None:
+        column = "embedding vector_cosine_ops"
+    else:
+        expression, opclass, _, _ = _coarse_search(quantization, prefix)
+        column = f"({expression}) {opclass}"
+
+    index = vector_index_name(quantization, prefix)
+    cursor = conn.cursor()
+    if replace:
+        cursor.execute(f"DROP INDEX IF EXISTS {index};")
+    cursor.execute(f"""
+        CREATE INDEX IF NOT EXISTS {index} ON documents
+        USING {method} ({column}) WITH ({params});
+    """)
+    conn.commit()
+
+def rebuild_vector_index(conn, method: str = "hnsw", **params):
+    create_vector_index(conn, method, replace=True, **params)
+
+def drop_vector_index(conn, quantization: str = None, prefix: int = None):
+    cursor = conn.cursor()
+    cursor.execute(f"DROP INDEX IF EXISTS {vector_index_name(quantization, prefix)};")
+    conn.commit()
+
+def vector_index_name(quantization: str = None, prefix: int = None) -> str:
+    if quantization is None and prefix is None:
+        return VECTOR_INDEX
+    _coarse_search(quantization, prefix)
+    parts = ["documents_embedding"]
+    if quantization is not None:
+        parts.append(quantization)
+    if prefix is not None:
+        parts.append(f"prefix{int(prefix)}")
+    return "_".join(parts + ["idx"])
+
+def _coarse_search(quantization: str = None, prefix: int = None):
+    # (indexed expression, opclass, distance operator, query expression) for
+    # a first-stage search over a quantized and/or shortened embedding.
+    if quantization is not None and quantization not in QUANTIZATIONS:
+        raise ValueError(f"Unknown quantization: {quantization}")
+    if prefix is None:
+        dimensions, column, query = VECTOR_DIMENSIONS, "embedding", "%s::vector"
+    elif 0 < prefix < VECTOR_DIMENSIONS:
+        dimensions = int(prefix)
+        column = f"subvector(embedding, 1, {dimensions})"
+        query = f"subvector(%s::vector, 1, {dimensions})"
+    else:
+        raise ValueError(f"Prefix must be between 1 and {VECTOR_DIMENSIONS - 1} dimensions, got {prefix}")
+    if quantization == "bit":
+        return (f"binary_quantize({column})::bit({dimensions})", "bit_hamming_ops",
+                "<~>", f"binary_quantize({query})")
+    kind, opclass = ("halfvec", "halfvec_cosine_ops") if quantization else ("vector", "vector_cosine_ops")
+    return (f"{column}::{kind}({dimensions})", opclass, "<=>", f"{query}::{kind}({dimensions})")
+
+def resize_embeddings(conn, dimensions: int):
+    # Shortens every stored embedding to its first dimensions values, scaled
+    # back to unit length: for text-embedding-3 that is what the API returns
+    # when asked for fewer dimensions, so existing rows don't need to be
+    # re-embedded. Vector indexes are dropped and have to be rebuilt; set
+    # EMBEDDING_DIMENSIONS to match so new chunks and queries agree.
+    cursor = conn.cursor()
+    cursor.execute("""
+        SELECT atttypmod FROM pg_attribute
+        WHERE attrelid = 'documents'::regclass AND attname = 'embedding';
+    """)
+    current = cursor.fetchone()[0]
+    if dimensions == current:
+        return
+    if not 0 < dimensions < current:
+        raise ValueError(f"Can only shorten {current}-dimensional embeddings, got {dimensions}")
+    try:
+        cursor.execute(
+            "SELECT indexname FROM pg_indexes WHERE tablename = 'documents' AND indexname LIKE %s;",
+            ("documents_embedding%",),
+        )
+        for (index,) in cursor.fetchall():
+            cursor.execute(f"DROP INDEX IF EXISTS {index};")
+        cursor.execute(f"""
+            ALTER TABLE documents ALTER COLUMN embedding TYPE vector({int(dimensions)})
+            USING l2_normalize(subvector(embedding, 1, {int(dimensions)}))::vector({int(dimensions)});
+        """)
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+
+def ivfflat_lists(row_count: int) -> int:
+    # pgvector's guidance: rows / 1000 up to 1M rows, sqrt(rows) beyond.
+    if row_count <= 1_000_000:
+        return max(row_count // 1000, 1)
+    return int(math.sqrt(row_count))
+
+def count_chunks(conn) -> int:
+    cursor = conn.cursor()
+    cursor.execute("SELECT count(*) FROM documents;")
+    return cursor.fetchone()[0]
+
+SEARCH_SQL = """
     SELECT id, content, source, chunk_index
     FROM documents
     ORDER BY embedding <=> %s::vector
     LIMIT %s;
     """
-    cursor.execute(query, (query_embedding, top_k));
-    return cursor.fetchall();
\ No newline at end of file
+# Same search, with the cosine distance as a fifth column.
+SCORED_SEARCH_SQL = """
+    SELECT id, content, source, chunk_index, embedding <=> %s::vector AS distance
+    FROM documents
+    ORDER BY distance
+    LIMIT %s;
+    """
+
+def _two_stage_search_sql(quantization: str, prefix: int, with_distance: bool) -> str:
+    # Coarse pass over the quantized / prefix index, then exact cosine
+    # distance on the full-precision embeddings of those candidates only.
+    expression, _, operator, query = _coarse_search(quantization, prefix)
+    distance = ", embedding <=> %s::vector AS distance" if with_distance else ""
+    order = "distance" if with_distance else "embedding <=> %s::vector"
+    return f"""
+    SELECT id, content, source, chunk_index{distance}
+    FROM (
+        SELECT id, content, source, chunk_index, embedding
+        FROM documents
+        ORDER BY {expression} {operator} {query}
+        LIMIT %s
+    ) candidates
+    ORDER BY {order}
+    LIMIT %s;
+    """
+
+def _search_query(query_embedding, top_k, with_distance, quantization, prefix, rescore):
+    # (sql, params, candidates) for one search; candidates is None when the
+    # full-precision index is searched directly.
+    if quantization is None and prefix is None:
+        sql = SCORED_SEARCH_SQL if with_distance else SEARCH_SQL
+        return sql, (query_embedding, top_k), None
+    candidates = max(rescore if rescore is not None else top_k * RESCORE_FACTOR, top_k)
+    sql = _two_stage_search_sql(quantization, prefix, with_distance)
+    if with_distance:
+        params = (query_embedding, query_embedding, candidates, top_k)
+    else:
+        params = (query_embedding, candidates, query_embedding, top_k)
+    return sql, params, candidates
+
+def search_chunks(conn, query_embedding : list[float], top_k : int = 5,
+                  ef_search: int = None, probes: int = None, exact: bool = False,
+                  with_distance: bool = False, quantization: str = VECTOR_QUANTIZATION,
+                  prefix: int = SEARCH_PREFIX_DIMENSIONS, rescore: int = None):
+    # ef_search / probes trade recall for latency on HNSW / IVFFlat indexes for
+    # this query only. exact=True skips the index and scans every row.
+    # quantization ("halfvec" or "bit") and/or prefix (a number of leading
+    # dimensions) take rescore candidates (default top_k * RESCORE_FACTOR)
+    # from the matching index and return the top_k of them by full-precision
+    # distance.
+    sql, params, candidates = _search_query(query_embedding, top_k, with_distance, quantization, prefix, rescore)
+    if candidates is not None and ef_search is None and candidates > _DEFAULT_EF_SEARCH:
+        ef_search = candidates
+    settings = _search_settings(ef_search, probes, exact)
+
+    cursor = conn.cursor()
+    for name, value in settings.items():
+        cursor.execute(SET_CONFIG_SQL, (name, str(value)))
+    cursor.execute(sql, params);
+    results = cursor.fetchall();
+    # The settings last until the transaction ends; put the defaults back so
+    # later queries on this connection aren't affected.
+    for name in settings:
+        cursor.execute(f"SET LOCAL {name} TO DEFAULT;")
+    return results;
+
+async def search_chunks_async(aconn, query_embedding: list[float], top_k: int = 5,
+                              ef_search: int = None, probes: int = None, exact: bool = False,
+                              with_distance: bool = False, quantization: str = VECTOR_QUANTIZATION,
+                              prefix: int = SEARCH_PREFIX_DIMENSIONS, rescore: int = None):
+    # search_chunks on a psycopg 3 AsyncConnection (see store.connect_async).
+    # The connection is in autocommit mode, so settings get a transaction of
+    # their own to be local to.
+    sql, params, candidates = _search_query(query_embedding, top_k, with_distance, quantization, prefix, rescore)
+    if candidates is not None and ef_search is None and candidates > _DEFAULT_EF_SEARCH:
+        ef_search = candidates
+    settings = _search_settings(ef_search, probes, exact)
+    if not settings:
+        async with aconn.cursor() as cursor:
+            await cursor.execute(sql, params)
+            return await cursor.fetchall()
+    async with aconn.transaction():
+        async with aconn.cursor() as cursor:
+            for name, value in settings.items():
+                await cursor.execute(SET_CONFIG_SQL, (name, str(value)))
+            await cursor.execute(sql, params)
+            return await cursor.fetchall()
+
+# SET can't take bound parameters (psycopg 3 binds them server side);
+# set_config(..., true) can, and is transaction-local like SET LOCAL.
+SET_CONFIG_SQL = "SELECT set_config(%s, %s, true);"
+
+def _search_settings(ef_search, probes, exact) -> dict:
+    return {name: value for name, value in (
+        (_SEARCH_SETTINGS["ef_search"], ef_search),
+        (_SEARCH_SETTINGS["probes"], probes),
+        ("enable_indexscan", "off" if exact else None),
+    ) if value is not None}
+
+def search_chunks_many(conn, query_embeddings: list[list[float]], top_k: int = 5,
+                       with_distance: bool = False):
+    # One k-NN per query, all in one statement: the LATERAL subquery runs the
+    # same index-backed search as search_chunks for each unnested vector.
+    # Returns one result list per query, in query order.
+    if not query_embeddings:
+        return []
+    distance = ", d.distance" if with_distance else ""
+    cursor = conn.cursor()
+    cursor.execute(f"""
+    SELECT q.ord, d.id, d.content, d.source, d.chunk_index{distance}
+    FROM unnest(%s::text[]) WITH ORDINALITY AS q (embedding, ord)
+    CROSS JOIN LATERAL (
+        SELECT id, content, source, chunk_index,
+               embedding <=> q.embedding::vector AS distance
+        FROM documents
+        ORDER BY distance
+        LIMIT %s
+    ) d
+    ORDER BY q.ord, d.distance;
+    """, ([_vector_literal(e) for e in query_embeddings], top_k))
+    results = [[] for _ in query_embeddings]
+    for ord, *row in cursor.fetchall():
+        results[ord - 1].append(tuple(row))
+    return results
+
+def _vector_literal(embedding) -> str:
+    return "[" + ",".join(repr(float(x)) for x in embedding) + "]"
+
+_HYBRID_TEMPLATE = """
+    WITH vector_leg AS (
+        SELECT id, row_number() OVER (ORDER BY distance) AS rank, distance
+        FROM (
+            SELECT id, embedding <=> %(embedding)s::vector AS distance
+            FROM documents
+            ORDER BY distance
+            LIMIT %(candidates)s
+        ) nearest
+    ),
+    lexical_leg AS (
+        SELECT id, row_number() OVER (ORDER BY score DESC) AS rank
+        FROM (
+            SELECT id, ts_rank_cd(content_tsv, tsq) AS score
+            FROM documents, websearch_to_tsquery('english', %(query)s) tsq
+            WHERE content_tsv @@ tsq
+            ORDER BY score DESC
+            LIMIT %(candidates)s
+        ) matches
+    ),
+    fused AS (
+        SELECT id, sum(1.0 / (%(rrf_k)s + rank)) AS score
+        FROM (SELECT id, rank FROM vector_leg UNION ALL SELECT id, rank FROM lexical_leg) legs
+        GROUP BY id
+    )
+    SELECT d.id, d.content, d.source, d.chunk_index{distance}
+    FROM fused JOIN documents d USING (id){join}
+    ORDER BY fused.score DESC, d.id
+    LIMIT %(top_k)s;
+    """
+HYBRID_SQL = _HYBRID_TEMPLATE.format(distance="", join="")
+# Same search, with the vector leg's cosine distance as a fifth column. It is
+# NULL for hits only the full-text leg found.
+SCORED_HYBRID_SQL = _HYBRID_TEMPLATE.format(
+    distance=", vector_leg.distance", join="\n    LEFT JOIN vector_leg USING (id)",
+)
+
+def hybrid_search_chunks(conn, query: str, query_embedding: list[float], top_k: int = 5,
+                         candidates: int = 50, rrf_k: int = 60, with_distance: bool = False):
+    # Vector and full-text candidates fused with reciprocal rank fusion, all
+    # in one statement. Each leg keeps its own index-friendly ORDER BY/LIMIT.
+    cursor = conn.cursor()
+    cursor.execute(SCORED_HYBRID_SQL if with_distance else HYBRID_SQL,
+                   _hybrid_params(query, query_embedding, top_k, candidates, rrf_k))
+    return cursor.fetchall()
+
+async def hybrid_search_chunks_async(aconn, query: str, query_embedding: list[float], top_k: int = 5,
+                                     candidates: int = 50, rrf_k: int = 60, with_distance: bool = False):
+    async with aconn.cursor() as cursor:
+        await cursor.execute(SCORED_HYBRID_SQL if with_distance else HYBRID_SQL,
+                             _hybrid_params(query, query_embedding, top_k, candidates, rrf_k))
+        return await cursor.fetchall()
+
+def _hybrid_params(query, query_embedding, top_k, candidates, rrf_k) -> dict:
+    return {
+        "embedding": query_embedding,
+        "query": query,
+        "candidates": candidates,
+        "rrf_k": rrf_k,
+        "top_k": top_k,
+    }
+
+def measure_recall(conn, query_embeddings, top_k: int = 10, **settings) -> dict:
+    # Compares search_chunks with the given settings against an exact,
+    # full-precision scan over the same queries.
+    recalls, ann_ms, exact_ms = [], [], []
+    for query_embedding in query_embeddings:
+        tick = time.perf_counter()
+        exact = {row[0] for row in search_chunks(conn, query_embedding, top_k, exact=True, quantization=None, prefix=None)}
+        exact_ms.append((time.perf_counter() - tick) * 1000)
+
+        tick = time.perf_counter()
+        approx = {row[0] for row in search_chunks(conn, query_embedding, top_k, **settings)}
+        ann_ms.append((time.perf_counter() - tick) * 1000)
+
+        recalls.append(len(exact & approx) / len(exact) if exact else 1.0)
+
+    if not recalls:
+        return {"queries": 0, "recall": None, "ann_ms_p50": None, "exact_ms_p50": None}
+    return {
+        "queries": len(recalls),
+        "recall": statistics.mean(recalls),
+        "ann_ms_p50": statistics.median(ann_ms),
+        "exact_ms_p50": statistics.median(exact_ms),
+    }
+
+def vector_index_bytes(conn, quantization: str = None, prefix: int = None):
+    # On-disk size of the matching vector index, or None if it hasn't been
+    # built.
+    cursor = conn.cursor()
+    cursor.execute("SELECT pg_relation_size(to_regclass(%s));", (vector_index_name(quantization, prefix),))
+    return cursor.fetchone()[0]
+
+def vector_bytes(quantization: str = None, dimensions: int = VECTOR_DIMENSIONS) -> int:
+    # Storage for one value: pgvector's 8-byte header plus the elements.
+    if quantization is None:
+        return 8 + 4 * dimensions
+    if quantization == "halfvec":
+        return 8 + 2 * dimensions
+    _coarse_search(quantization)
+    return 8 + (dimensions + 7) // 8
+
+def compare_quantization(conn, query_embeddings, top_k: int = 10,
+                         quantizations=(None, "halfvec", "bit"), prefixes=(None,),
+                         rescore: int = None, **settings) -> list[dict]:
+    # One row per (quantization, prefix): recall and latency from
+    # measure_recall, the recall lost against full precision, and the memory
+    # saved per vector and (when both indexes exist) by the index.
+    full_index = vector_index_bytes(conn)
+    rows = []
+    for prefix in prefixes:
+        for quantization in quantizations:
+            options = dict(settings, quantization=quantization, prefix=prefix)
+            if quantization is not None or prefix is not None:
+                options["rescore"] = rescore
+            result = measure_recall(conn, query_embeddings, top_k, **options)
+            index = vector_index_bytes(conn, quantization, prefix)
+            size = vector_bytes(quantization, prefix or VECTOR_DIMENSIONS)
+            rows.append({
+                "quantization": quantization or "vector",
+                "prefix": prefix,
+                **result,
+                "recall_loss": None if result["recall"] is None else 1.0 - result["recall"],
+                "vector_bytes": size,
+                "vector_saving": 1.0 - size / vector_bytes(),
+                "index_bytes": index,
+                "index_saving": 1.0 - index / full_index if index and full_index else None,
+            })
+    return rows